@@ -12,11 +12,73 @@ load_dotenv(BASE_DIR / ".env")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Настройки вебхука: публичный адрес бота, путь, секретный токен и адрес встроенного сервера.
+# Порт берется из PORT, если его задает хостинг.
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080")
+
 if os.getenv('RENDER'):
     DB_PATH = Path("/data/lovebot.db")
 else:
     DB_PATH = BASE_DIR / "lovebot.db"
 
+# Пул соединений с базой: количество соединений для чтения и таймаут ожидания (в секундах)
+DB_POOL_READERS = int(os.getenv("DB_POOL_READERS", "4"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+
+# Кэш пользователей и партнеров: максимальное число записей и время жизни (в секундах)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Кэш соседних записей архивов (воспоминания, ответы на вопросы дня): число пар и время жизни (в секундах)
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "1000"))
+ARCHIVE_CACHE_TTL = float(os.getenv("ARCHIVE_CACHE_TTL", "120"))
+
+# Перемешанные колоды воспоминаний для /memory: число пар в памяти и время жизни колоды (в секундах)
+MEMORY_DECK_CACHE_SIZE = int(os.getenv("MEMORY_DECK_CACHE_SIZE", "1000"))
+MEMORY_DECK_TTL = float(os.getenv("MEMORY_DECK_TTL", "86400"))
+
+# Планировщик: сколько доставок выполнять одновременно и сколько секунд ждать одну доставку
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "50"))
+SCHEDULER_JOB_TIMEOUT = float(os.getenv("SCHEDULER_JOB_TIMEOUT", "20"))
+
+# Исходящие сообщения: общий лимит и лимит на чат (сообщений в секунду), размер очереди и число повторов
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Хранилище состояний FSM: размер кэша горячих записей, их время жизни в кэше (в секундах)
+# и как часто сбрасывать накопленные изменения в базу (в секундах)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "5000"))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "600"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+
+# Срок жизни незавершенных диалогов (в секундах) для состояний без своего срока в STATE_TTLS
+# и для данных без состояния, а также как часто удалять истекшие записи (в секундах)
+FSM_DEFAULT_TTL = int(os.getenv("FSM_DEFAULT_TTL", "86400"))
+FSM_DATA_TTL = int(os.getenv("FSM_DATA_TTL", "21600"))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "300"))
+
+# Обработка входящих апдейтов: сколько апдейтов обрабатывать одновременно (по умолчанию
+# без ограничения), как часто сохранять позицию обработанных апдейтов (в секундах)
+# и при каком отставании (в секундах) считать, что бот разбирает накопившуюся очередь.
+# Повторно присланные апдейты ищутся среди последних UPDATES_DEDUP_WINDOW номеров
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY") or 0) or None
+UPDATES_FLUSH_INTERVAL = float(os.getenv("UPDATES_FLUSH_INTERVAL", "2"))
+UPDATES_BACKLOG_LAG = float(os.getenv("UPDATES_BACKLOG_LAG", "5"))
+UPDATES_DEDUP_WINDOW = int(os.getenv("UPDATES_DEDUP_WINDOW", "1000"))
+
+# Как часто писать в лог статистику работы бота (в минутах)
+STATS_LOG_INTERVAL = int(os.getenv("STATS_LOG_INTERVAL", "15"))
+
 # Проверки на наличие токенов
 if not BOT_TOKEN:
     print("Ошибка: не найден BOT_TOKEN. Убедитесь, что он есть в .env или в переменных окружения хостинга.")
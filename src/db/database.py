@@ -1,16 +1,87 @@
 import aiosqlite
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import random
+import time
+from collections import defaultdict
 from datetime import datetime
-import pytz
-from src.config import BASE_DIR
+from src.config import (
+    BASE_DIR, DB_POOL_READERS, DB_ACQUIRE_TIMEOUT, USER_CACHE_SIZE, USER_CACHE_TTL,
+    ARCHIVE_CACHE_SIZE, ARCHIVE_CACHE_TTL, MEMORY_DECK_CACHE_SIZE, MEMORY_DECK_TTL
+)
+from src.db.pool import ConnectionPool
+from src.db.migrations import apply_migrations
+from src.db.question_deck import draw_questions
+from src.db.triggers import rebuild_couple_triggers, rebuild_stale_triggers
+from src.utils.cache import TTLCache
+from src.utils.stats import register_stats_provider
+from src.utils.timezones import get_timezone, to_epoch
 
 DB_PATH = BASE_DIR / "lovebot.db"
 
+# Общий пул соединений, создается в db_start() и закрывается в db_close()
+_pool: ConnectionPool = None
+
+# Кэш записей пользователей по user_id. Сбрасывается в add_user, link_partners и unlink_partners.
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_MISSING = object()
+
+_USER_FIELDS = ("user_id", "username", "partner_id", "start_date")
+
+# Архивы, которые листаются по одной записи от новых к старым: (запрос, ключ сортировки).
+# Вопросы дня попадают в архив, только если на них ответил хотя бы один из пары.
+_ARCHIVES = {
+    "memories": ("SELECT * FROM memories WHERE couple_id = ?", ("added_at", "memory_id")),
+    "qotd": (
+        """SELECT da.*, q.text AS question_text, u1.username AS user1_name, u2.username AS user2_name
+           FROM daily_answers da
+           JOIN questions q ON da.question_id = q.question_id
+           LEFT JOIN users u1 ON u1.user_id = da.user1_id
+           LEFT JOIN users u2 ON u2.user_id = da.user2_id
+           WHERE da.couple_id = ? AND (da.answer_user1 IS NOT NULL OR da.answer_user2 IS NOT NULL)""",
+        ("da.question_date",)
+    ),
+}
+
+# Вопросы дня пар с ответами и именами обоих партнеров
+_DAILY_QUESTION_SQL = """
+    SELECT da.*, q.text as question_text, u1.username AS user1_name, u2.username AS user2_name
+    FROM daily_answers da
+    JOIN questions q ON da.question_id = q.question_id
+    LEFT JOIN users u1 ON u1.user_id = da.user1_id
+    LEFT JOIN users u2 ON u2.user_id = da.user2_id"""
+
+# Условие на пары (couple_id, дата вопроса), переданные JSON-массивом [[couple_id, "ГГГГ-ММ-ДД"], ...]
+_COUPLE_DATES_FILTER = """(da.couple_id, da.question_date) IN (
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))"""
+
+# Кэш часовых поясов пар по couple_id. Сбрасывается в update_reminders_settings.
+_timezone_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Кэш соседних записей архивов по couple_id: словарь {(архив, курсор, направление): запись}.
+# Сбрасывается целиком для пары в add_memory и save_answer.
+_archive_cache = TTLCache(maxsize=ARCHIVE_CACHE_SIZE, ttl=ARCHIVE_CACHE_TTL)
+_ARCHIVE_ENTRIES_PER_COUPLE = 64
+
+# Перемешанные колоды memory_id по couple_id для случайного воспоминания: за один круг
+# каждое воспоминание показывается ровно один раз. add_memory подмешивает новое воспоминание
+# в непоказанную часть колоды, удаленные воспоминания пропускаются с пересборкой колоды.
+_memory_decks = TTLCache(maxsize=MEMORY_DECK_CACHE_SIZE, ttl=MEMORY_DECK_TTL)
 
-async def db_start():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("PRAGMA foreign_keys = ON")
 
+async def db_start():
+    global _pool
+    _pool = ConnectionPool(DB_PATH, readers=DB_POOL_READERS, acquire_timeout=DB_ACQUIRE_TIMEOUT)
+    await _pool.open()
+    register_stats_provider("db_pool", _pool.stats)
+    register_stats_provider("user_cache", _user_cache.stats)
+    register_stats_provider("archive_cache", _archive_cache.stats)
+    register_stats_provider("timezone_cache", _timezone_cache.stats)
+
+    async with _pool.writer() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
@@ -25,6 +96,7 @@ async def db_start():
                 text TEXT NOT NULL UNIQUE
             )""")
 
+        # Исходная схема: миграция 9 переводит время событий и комплиментов в секунды UTC
         await db.execute("""
             CREATE TABLE IF NOT EXISTS scheduled_compliments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -107,100 +179,253 @@ async def db_start():
             )
         """)
         await db.commit()
+        await apply_migrations(db)
         logging.info("База данных успешно инициализирована.")
 
-async def add_scheduled_compliment(sender_id, receiver_id, text, send_at, caption=None, attachment_type=None, attachment_file_id=None):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+
+async def db_close():
+    """Закрывает пул соединений при остановке бота."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def _fetch_page(sql: str, params: tuple, order_by: tuple, cursor: tuple = None, backward: bool = False,
+                      page_size: int = 5, inclusive: bool = False):
+    """
+    Выбирает одну страницу по ключу order_by без OFFSET (keyset-пагинация).
+
+    sql - запрос с условием WHERE, но без сортировки; cursor - значения ключа граничной строки.
+    Строки берутся после курсора (или перед ним при backward), inclusive включает саму граничную строку.
+    Возвращает строки по возрастанию ключа и признак того, что в направлении выборки есть еще строки.
+    """
+    if cursor is not None:
+        operator = "<" if backward else ">"
+        if inclusive:
+            operator += "="
+        sql += f" AND ({', '.join(order_by)}) {operator} ({', '.join('?' for _ in order_by)})"
+        params += tuple(cursor)
+    direction = "DESC" if backward else "ASC"
+    sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column in order_by) + " LIMIT ?"
+    params += (page_size + 1,)
+
+    async with _pool.reader() as db:
+        result = await db.execute(sql, params)
+        rows = await result.fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+    return rows, has_more
+
+
+async def add_scheduled_compliment(sender_id, receiver_id, text, send_at: datetime, caption=None, attachment_type=None,
+                                   attachment_file_id=None):
+    """Сохраняет отложенный комплимент на момент send_at (с часовым поясом) и возвращает его id."""
+    async with _pool.writer() as db:
+        cursor = await db.execute(
             """INSERT INTO scheduled_compliments 
                (sender_id, receiver_id, text, caption, send_at, attachment_type, attachment_file_id) 
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (sender_id, receiver_id, text, caption, send_at, attachment_type, attachment_file_id)
+            (sender_id, receiver_id, text, caption, to_epoch(send_at), attachment_type, attachment_file_id)
         )
         await db.commit()
+        return cursor.lastrowid
+
+async def get_pending_compliments_schedule():
+    """Возвращает id и время отправки (секунды UTC) всех еще не отправленных комплиментов."""
+    async with _pool.reader() as db:
+        cursor = await db.execute("SELECT id, send_at FROM scheduled_compliments")
+        return await cursor.fetchall()
 
 async def get_due_compliments():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        moscow_tz = pytz.timezone("Europe/Moscow")
-        now_aware = datetime.now(moscow_tz)
-        now_iso = now_aware.isoformat()
-        cursor = await db.execute("SELECT * FROM scheduled_compliments WHERE send_at <= ?", (now_iso,))
+    """Возвращает комплименты, время отправки которых наступило, вместе с именем отправителя."""
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            """SELECT sc.*, u.username AS sender_name FROM scheduled_compliments sc
+               LEFT JOIN users u ON u.user_id = sc.sender_id
+               WHERE sc.send_at <= ?""",
+            (int(time.time()),)
+        )
         return await cursor.fetchall()
 
-async def delete_compliment(compliment_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM scheduled_compliments WHERE id = ?", (compliment_id,))
+async def delete_compliments(compliment_ids: list):
+    """Удаляет из очереди отложенные комплименты с указанными id."""
+    if not compliment_ids:
+        return
+    async with _pool.writer() as db:
+        await db.execute(
+            "DELETE FROM scheduled_compliments WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(compliment_ids),)
+        )
+        await db.commit()
+
+async def get_bot_state(key: str):
+    """Возвращает значение из служебной таблицы bot_state или None."""
+    async with _pool.reader() as db:
+        cursor = await db.execute("SELECT value FROM bot_state WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+async def set_bot_state(key: str, value: str):
+    async with _pool.writer() as db:
+        await _set_bot_state(db, key, value)
         await db.commit()
 
+async def _set_bot_state(conn, key: str, value: str):
+    await conn.execute(
+        "INSERT INTO bot_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+def _line_fingerprint(line: str) -> int:
+    """64-битный отпечаток строки, помещается в INTEGER PRIMARY KEY."""
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def _read_questions_file(path) -> tuple:
+    """Читает файл вопросов и возвращает хеш содержимого и {отпечаток: строка}. Выполняется в потоке."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    lines = (line.strip() for line in content.decode("utf-8").splitlines())
+    return hashlib.sha256(content).hexdigest(), {_line_fingerprint(line): line for line in lines if line}
+
 async def add_questions_to_db():
+    """
+    Синхронизирует каталог вопросов с questions.txt.
+
+    Если размер и время изменения файла совпадают с сохраненными, файл даже не читается.
+    Если совпадает хеш содержимого, ничего не пишется. Иначе по отпечаткам строк
+    вычисляется разница с прошлой версией и в базу добавляются только новые вопросы.
+    Удаленные из файла вопросы остаются в базе: на них могут ссылаться ответы пар.
+    """
     questions_file_path = BASE_DIR / "questions.txt"
     try:
-        with open(questions_file_path, 'r', encoding='utf-8') as f:
-            questions_list = [line.strip() for line in f if line.strip()]
-        if not questions_list: return
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.executemany("INSERT OR IGNORE INTO questions (text) VALUES (?)", [(q,) for q in questions_list])
-            await db.commit()
-            logging.info(f"Добавлено/обновлено {len(questions_list)} вопросов из файла.")
+        stat = await asyncio.to_thread(os.stat, questions_file_path)
     except FileNotFoundError:
         logging.error(f"Файл с вопросами не найден: {questions_file_path}.")
+        return
 
-async def get_today_question_for_couple(couple_id: int):
-    today = datetime.now().date()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            """SELECT da.*, q.text as question_text FROM daily_answers da
-               JOIN questions q ON da.question_id = q.question_id
-               WHERE da.couple_id = ? AND da.question_date = ?""",
-            (couple_id, today)
-        )
-        return await cursor.fetchone()
-
-async def get_qotd_archive(couple_id: int):
-    """Получает весь архив ответов на вопросы дня для пары."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            """SELECT da.*, q.text as question_text FROM daily_answers da
-               JOIN questions q ON da.question_id = q.question_id
-               WHERE da.couple_id = ? AND (da.answer_user1 IS NOT NULL OR da.answer_user2 IS NOT NULL)
-               ORDER BY da.question_date DESC""",
-            (couple_id,)
-        )
-        return await cursor.fetchall()
+    file_stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    if await get_bot_state("questions_file_stamp") == file_stamp:
+        logging.info("Файл с вопросами не изменился, синхронизация пропущена.")
+        return
 
+    content_hash, lines = await asyncio.to_thread(_read_questions_file, questions_file_path)
+    async with _pool.writer() as db:
+        cursor = await db.execute("SELECT value FROM bot_state WHERE key = 'questions_file_hash'")
+        row = await cursor.fetchone()
+        if row and row[0] == content_hash:
+            await _set_bot_state(db, "questions_file_stamp", file_stamp)
+            await db.commit()
+            logging.info("Содержимое файла с вопросами не изменилось, синхронизация пропущена.")
+            return
+
+        cursor = await db.execute("SELECT fingerprint FROM question_sync")
+        known = {row[0] for row in await cursor.fetchall()}
+        added = [fingerprint for fingerprint in lines if fingerprint not in known]
+        removed = [fingerprint for fingerprint in known if fingerprint not in lines]
+
+        await db.executemany("INSERT OR IGNORE INTO questions (text) VALUES (?)", [(lines[f],) for f in added])
+        await db.executemany("INSERT INTO question_sync (fingerprint) VALUES (?)", [(f,) for f in added])
+        await db.executemany("DELETE FROM question_sync WHERE fingerprint = ?", [(f,) for f in removed])
+        await _set_bot_state(db, "questions_file_hash", content_hash)
+        await _set_bot_state(db, "questions_file_stamp", file_stamp)
+        await db.commit()
+        logging.info(f"Файл с вопросами синхронизирован: новых строк {len(added)}, удаленных {len(removed)}.")
+
+def _remember_archive_entry(couple_id: int, cache_key: tuple, value):
+    entries = _archive_cache.get(couple_id)
+    if entries is None or len(entries) >= _ARCHIVE_ENTRIES_PER_COUPLE:
+        entries = {}
+        _archive_cache.set(couple_id, entries)
+    entries[cache_key] = value
+
+async def get_archive_entry(archive: str, couple_id: int, cursor: tuple = None, older: bool = True):
+    """
+    Возвращает запись архива, соседнюю с курсором: более старую (older) или более новую.
+    Без курсора возвращает самую новую запись. Записи отдаются словарями, соседи берутся из кэша.
+    """
+    cache_key = (archive, cursor, older)
+    entries = _archive_cache.get(couple_id)
+    if entries is not None and cache_key in entries:
+        return entries[cache_key]
+
+    sql, order_by = _ARCHIVES[archive]
+    rows, _ = await _fetch_page(sql, (couple_id,), order_by, cursor, backward=older, page_size=1)
+    entry = dict(rows[0]) if rows else None
+    _remember_archive_entry(couple_id, cache_key, entry)
+    return entry
+
+async def count_archive_entries(archive: str, couple_id: int) -> int:
+    """Возвращает количество записей в архиве пары."""
+    cache_key = (archive, "count")
+    entries = _archive_cache.get(couple_id)
+    if entries is not None and cache_key in entries:
+        return entries[cache_key]
+
+    sql, _ = _ARCHIVES[archive]
+    async with _pool.reader() as db:
+        cursor = await db.execute(f"SELECT COUNT(*) FROM ({sql})", (couple_id,))
+        total = (await cursor.fetchone())[0]
+    _remember_archive_entry(couple_id, cache_key, total)
+    return total
+
+async def prefetch_archive_neighbors(archive: str, couple_id: int, cursor: tuple):
+    """Заранее загружает в кэш записи до и после курсора, чтобы следующее листание не ходило в базу."""
+    for older in (True, False):
+        await get_archive_entry(archive, couple_id, cursor, older)
 
-async def get_random_question():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM questions ORDER BY RANDOM() LIMIT 1")
-        return await cursor.fetchone()
 
 async def add_custom_question(text: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         try:
             await db.execute("INSERT INTO questions (text) VALUES (?)", (text,))
             await db.commit()
             return True
         except aiosqlite.IntegrityError:
+            await db.rollback()
             return False
 
-async def create_daily_question_entry(couple_id: int, question_id: int, user1_id: int, user2_id: int):
-    today = datetime.now().date()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+def _couple_dates_param(couple_dates: dict) -> str:
+    return json.dumps([[couple_id, day.isoformat()] for couple_id, day in couple_dates.items()])
+
+async def assign_daily_questions(couples: list) -> dict:
+    """
+    Назначает вопрос дня сразу всем переданным парам в одной транзакции.
+    У каждой пары в поле question_date передается ее местная дата. Пары, у которых вопрос
+    на эту дату уже есть, получают его же. Возвращает {couple_id: вопрос}.
+    """
+    async with _pool.writer() as db:
+        cursor = await db.execute(
+            f"""SELECT da.couple_id, q.* FROM daily_answers da
+                JOIN questions q ON da.question_id = q.question_id
+                WHERE {_COUPLE_DATES_FILTER}""",
+            (_couple_dates_param({couple['couple_id']: couple['question_date'] for couple in couples}),)
+        )
+        questions = {row['couple_id']: row for row in await cursor.fetchall()}
+
+        new_couples = [couple for couple in couples if couple['couple_id'] not in questions]
+        drawn = await draw_questions(db, [couple['couple_id'] for couple in new_couples])
+        await db.executemany(
             """INSERT OR IGNORE INTO daily_answers 
                (couple_id, question_id, user1_id, user2_id, question_date) 
                VALUES (?, ?, ?, ?, ?)""",
-            (couple_id, question_id, user1_id, user2_id, today)
+            [
+                (couple['couple_id'], drawn[couple['couple_id']]['question_id'], couple['user1_id'],
+                 couple['user2_id'], couple['question_date'])
+                for couple in new_couples if couple['couple_id'] in drawn
+            ]
         )
         await db.commit()
+    questions.update(drawn)
+    return questions
 
 async def save_answer(couple_id: int, user_id: int, answer: str):
-    today = datetime.now().date()
-    async with aiosqlite.connect(DB_PATH) as db:
+    today = await get_couple_today(couple_id)
+    async with _pool.writer() as db:
         cursor = await db.execute("SELECT user1_id FROM daily_answers WHERE couple_id = ? AND question_date = ?", (couple_id, today))
         row = await cursor.fetchone()
         if not row: return False
@@ -210,69 +435,92 @@ async def save_answer(couple_id: int, user_id: int, answer: str):
             (answer, couple_id, today)
         )
         await db.commit()
-        return True
+    _archive_cache.invalidate(couple_id)
+    return True
 
 async def get_today_question_for_couple(couple_id: int):
-    today = datetime.now().date()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    """Возвращает сегодняшний (по времени пары) вопрос пары с ответами и именами обоих партнеров."""
+    today = await get_couple_today(couple_id)
+    async with _pool.reader() as db:
         cursor = await db.execute(
-            """SELECT da.*, q.text as question_text FROM daily_answers da
-               JOIN questions q ON da.question_id = q.question_id
-               WHERE da.couple_id = ? AND da.question_date = ?""",
-            (couple_id, today)
+            _DAILY_QUESTION_SQL + " WHERE da.couple_id = ? AND da.question_date = ?", (couple_id, today)
         )
         return await cursor.fetchone()
 
-async def get_all_couples_with_settings():
-    """Получает все пары и их настройки."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+async def get_questions_for_couple_dates(couple_dates: dict) -> dict:
+    """
+    То же, что get_today_question_for_couple, но сразу для многих пар одним запросом.
+    couple_dates - {couple_id: местная дата пары}. Возвращает {couple_id: запись}.
+    """
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            _DAILY_QUESTION_SQL + f" WHERE {_COUPLE_DATES_FILTER}", (_couple_dates_param(couple_dates),)
+        )
+        return {row['couple_id']: row for row in await cursor.fetchall()}
+
+async def get_due_triggers(minute_of_day: int):
+    """
+    Возвращает задачи планировщика, назначенные на указанную минуту суток по UTC, вместе
+    с участниками пары и текущим смещением ее пояса (utc_offset, в минутах).
+    """
+    async with _pool.reader() as db:
         cursor = await db.execute("""
-            SELECT
-                s.couple_id,
-                u.user_id as user1_id,
-                u.partner_id as user2_id,
-                s.reminders_enabled,
-                s.reminder_time,
-                s.qotd_enabled,
-                s.qotd_send_time,
-                s.qotd_summary_time
-            FROM couple_settings s
-            JOIN users u ON s.couple_id = MIN(u.user_id, u.partner_id)
-            GROUP BY s.couple_id
-        """)
+            SELECT t.job_kind, t.utc_offset, c.couple_id, c.user1_id, c.user2_id
+            FROM schedule_triggers t
+            JOIN couples c ON c.couple_id = t.couple_id
+            WHERE t.minute_of_day = ?
+        """, (minute_of_day,))
         return await cursor.fetchall()
 
-async def get_all_pairs():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT user_id, partner_id FROM users WHERE partner_id IS NOT NULL")
-        return await cursor.fetchall()
+async def refresh_stale_triggers() -> int:
+    """Пересчитывает срабатывания пар, у которых сменилось смещение пояса. Возвращает число таких пар."""
+    now = int(time.time())
+    async with _pool.reader() as db:
+        cursor = await db.execute("SELECT 1 FROM schedule_triggers WHERE valid_until <= ? LIMIT 1", (now,))
+        if await cursor.fetchone() is None:
+            return 0
+    async with _pool.writer() as db:
+        refreshed = await rebuild_stale_triggers(db, now)
+        await db.commit()
+    logging.info(f"Пересчитаны срабатывания {refreshed} пар после смены смещения часового пояса.")
+    return refreshed
 
 async def add_user(user_id: int, username: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
-        if await cursor.fetchone() is None:
-            await db.execute("INSERT INTO users (user_id, username) VALUES (?, ?)", (user_id, username))
-            await db.commit()
-            logging.info(f"Добавлен новый пользователь: {username} (ID: {user_id})")
+    if await get_user(user_id) is not None:
+        return
+    async with _pool.writer() as db:
+        cursor = await db.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, username))
+        await db.commit()
+    _user_cache.invalidate(user_id)
+    if cursor.rowcount:
+        logging.info(f"Добавлен новый пользователь: {username} (ID: {user_id})")
 
 async def get_user(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return await cursor.fetchone()
+    user = _user_cache.get(user_id, _MISSING)
+    if user is not _MISSING:
+        return user
+    async with _pool.reader() as db:
+        cursor = await db.execute("SELECT user_id, username, partner_id, start_date FROM users WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+    user = dict(row) if row else None
+    _user_cache.set(user_id, user)
+    return user
 
 async def link_partners(user1_id: int, user2_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Связывает пользователей в пару: обновляет users, couples и настройки пары в одной транзакции."""
+    couple_id = min(user1_id, user2_id)
+    async with _pool.writer() as db:
         today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         await db.execute("UPDATE users SET partner_id = ?, start_date = ? WHERE user_id = ?", (user2_id, today, user1_id))
         await db.execute("UPDATE users SET partner_id = ?, start_date = ? WHERE user_id = ?", (user1_id, today, user2_id))
+        await db.execute(
+            "INSERT OR REPLACE INTO couples (couple_id, user1_id, user2_id, created_at) VALUES (?, ?, ?, ?)",
+            (couple_id, couple_id, max(user1_id, user2_id), today)
+        )
+        await db.execute("INSERT OR IGNORE INTO couple_settings (couple_id) VALUES (?)", (couple_id,))
         await db.commit()
-        logging.info(f"Пользователи {user1_id} и {user2_id} теперь партнеры.")
-        couple_id = min(user1_id, user2_id)
-        await get_couple_settings(couple_id)
+    _user_cache.invalidate(user1_id, user2_id)
+    logging.info(f"Пользователи {user1_id} и {user2_id} теперь партнеры.")
 
 async def get_partner(user_id: int):
     user_data = await get_user(user_id)
@@ -280,87 +528,146 @@ async def get_partner(user_id: int):
         return await get_user(user_data['partner_id'])
     return None
 
+async def get_user_context(user_id: int):
+    """
+    Одним запросом получает пользователя и его партнера.
+    Возвращает кортеж (user, partner), где любой элемент может быть None.
+    """
+    user = _user_cache.get(user_id, _MISSING)
+    if user is not _MISSING:
+        partner = await get_user(user['partner_id']) if user and user['partner_id'] else None
+        return user, partner
+
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            """SELECT u.user_id, u.username, u.partner_id, u.start_date,
+                      p.user_id AS p_user_id, p.username AS p_username,
+                      p.partner_id AS p_partner_id, p.start_date AS p_start_date
+               FROM users u
+               LEFT JOIN users p ON p.user_id = u.partner_id
+               WHERE u.user_id = ?""",
+            (user_id,)
+        )
+        row = await cursor.fetchone()
+    if not row:
+        _user_cache.set(user_id, None)
+        return None, None
+    user = {key: row[key] for key in _USER_FIELDS}
+    _user_cache.set(user_id, user)
+    partner = None
+    if row['p_user_id'] is not None:
+        partner = {key: row[f"p_{key}"] for key in _USER_FIELDS}
+        _user_cache.set(partner['user_id'], partner)
+    return user, partner
+
 async def unlink_partners(user_id: int):
     partner = await get_partner(user_id)
     if not partner: return False
     partner_id = partner['user_id']
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("UPDATE users SET partner_id = NULL, start_date = NULL WHERE user_id = ?", (user_id,))
         await db.execute("UPDATE users SET partner_id = NULL, start_date = NULL WHERE user_id = ?", (partner_id,))
+        await db.execute("DELETE FROM couples WHERE couple_id = ?", (min(user_id, partner_id),))
         await db.commit()
-        logging.info(f"Связь между {user_id} и {partner_id} разорвана.")
-        return True
+    _user_cache.invalidate(user_id, partner_id)
+    logging.info(f"Связь между {user_id} и {partner_id} разорвана.")
+    return True
 
-async def add_event(couple_id: int, event_date: datetime, title: str, details: str = None):
-    async with aiosqlite.connect(DB_PATH) as db:
+async def add_event(couple_id: int, event_at: datetime, title: str, details: str = None):
+    """Добавляет событие на момент event_at (с часовым поясом)."""
+    async with _pool.writer() as db:
         await db.execute(
-            "INSERT INTO events (couple_id, event_date, title, details) VALUES (?, ?, ?, ?)",
-            (couple_id, event_date.isoformat(), title, details)
+            "INSERT INTO events (couple_id, event_at, title, details) VALUES (?, ?, ?, ?)",
+            (couple_id, to_epoch(event_at), title, details)
         )
         await db.commit()
-        logging.info(f"Для пары {couple_id} добавлено событие '{title}' на {event_date}")
+        logging.info(f"Для пары {couple_id} добавлено событие '{title}' на {event_at}")
 
 async def get_events_for_period(couple_id: int, start_date: datetime, end_date: datetime):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    """Возвращает события пары между двумя моментами (с часовым поясом) по возрастанию времени."""
+    async with _pool.reader() as db:
         cursor = await db.execute(
-            "SELECT *, strftime('%w', event_date) as weekday FROM events WHERE couple_id = ? AND event_date BETWEEN ? AND ? ORDER BY event_date",
-            (couple_id, start_date.isoformat(), end_date.isoformat())
+            "SELECT * FROM events WHERE couple_id = ? AND event_at BETWEEN ? AND ? ORDER BY event_at, event_id",
+            (couple_id, to_epoch(start_date), to_epoch(end_date))
         )
         return await cursor.fetchall()
 
+async def get_events_for_couples(couple_ids: list, start_date: datetime, end_date: datetime) -> dict:
+    """Возвращает события за период сразу для многих пар одним запросом: {couple_id: [события по времени]}."""
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            """SELECT * FROM events
+               WHERE couple_id IN (SELECT value FROM json_each(?)) AND event_at BETWEEN ? AND ?
+               ORDER BY couple_id, event_at, event_id""",
+            (json.dumps(couple_ids), to_epoch(start_date), to_epoch(end_date))
+        )
+        events = defaultdict(list)
+        for row in await cursor.fetchall():
+            events[row['couple_id']].append(row)
+        return events
+
+async def get_events_page(couple_id: int, start_date: datetime, end_date: datetime, cursor: tuple = None,
+                          backward: bool = False, page_size: int = 5):
+    """Страница событий за период с курсором по (event_at, event_id)."""
+    return await _fetch_page(
+        "SELECT * FROM events WHERE couple_id = ? AND event_at BETWEEN ? AND ?",
+        (couple_id, to_epoch(start_date), to_epoch(end_date)),
+        ("event_at", "event_id"), cursor, backward, page_size
+    )
+
 async def get_event_by_id(event_id: int, couple_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.reader() as db:
         cursor = await db.execute(
             "SELECT * FROM events WHERE event_id = ? AND couple_id = ?", (event_id, couple_id)
         )
         return await cursor.fetchone()
 
 async def delete_event_by_id(event_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("DELETE FROM events WHERE event_id = ?", (event_id,))
         await db.commit()
         logging.info(f"Событие {event_id} удалено.")
 
 async def get_couple_settings(couple_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.reader() as db:
         cursor = await db.execute("SELECT * FROM couple_settings WHERE couple_id = ?", (couple_id,))
         settings = await cursor.fetchone()
-        if not settings:
-            await db.execute("INSERT INTO couple_settings (couple_id) VALUES (?)", (couple_id,))
-            await db.commit()
-            cursor = await db.execute("SELECT * FROM couple_settings WHERE couple_id = ?", (couple_id,))
-            settings = await cursor.fetchone()
+    if settings:
         return settings
+    async with _pool.writer() as db:
+        await db.execute("INSERT OR IGNORE INTO couple_settings (couple_id) VALUES (?)", (couple_id,))
+        await db.commit()
+        cursor = await db.execute("SELECT * FROM couple_settings WHERE couple_id = ?", (couple_id,))
+        return await cursor.fetchone()
 
 async def update_reminders_settings(couple_id: int, **kwargs):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         fields = ", ".join([f"{key} = ?" for key in kwargs])
         values = list(kwargs.values())
         values.append(couple_id)
         await db.execute(f"UPDATE couple_settings SET {fields} WHERE couple_id = ?", tuple(values))
+        await rebuild_couple_triggers(db, couple_id)
         await db.commit()
         logging.info(f"Настройки для пары {couple_id} обновлены: {kwargs}")
-
-async def get_couples_for_reminder(current_time_str: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("""
-            SELECT
-                s.couple_id,
-                u.user_id as user1_id,
-                u.partner_id as user2_id
-            FROM couple_settings s
-            JOIN users u ON s.couple_id = MIN(u.user_id, u.partner_id)
-            WHERE s.reminders_enabled = 1 AND s.reminder_time = ?
-            GROUP BY s.couple_id
-        """, (current_time_str,))
-        return await cursor.fetchall()
+    _timezone_cache.invalidate(couple_id)
+
+async def get_couple_timezone(couple_id: int):
+    """Возвращает часовой пояс пары (объект pytz). Без настроек - пояс по умолчанию."""
+    name = _timezone_cache.get(couple_id, _MISSING)
+    if name is _MISSING:
+        async with _pool.reader() as db:
+            cursor = await db.execute("SELECT timezone FROM couple_settings WHERE couple_id = ?", (couple_id,))
+            row = await cursor.fetchone()
+        name = row[0] if row else None
+        _timezone_cache.set(couple_id, name)
+    return get_timezone(name)
+
+async def get_couple_today(couple_id: int):
+    """Текущая дата в часовом поясе пары."""
+    return datetime.now(await get_couple_timezone(couple_id)).date()
 
 async def add_wish(user_id: int, title: str, link: str = None, photo_file_id: str = None):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute(
             "INSERT INTO wishlist (user_id, title, link, photo_file_id) VALUES (?, ?, ?, ?)",
             (user_id, title, link, photo_file_id)
@@ -369,60 +676,95 @@ async def add_wish(user_id: int, title: str, link: str = None, photo_file_id: st
         logging.info(f"Пользователь {user_id} добавил желание '{title}'")
 
 async def get_wishes(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.reader() as db:
         cursor = await db.execute("SELECT * FROM wishlist WHERE user_id = ?", (user_id,))
         return await cursor.fetchall()
 
+async def get_wishes_page(user_id: int, cursor: tuple = None, backward: bool = False, page_size: int = 5):
+    """Страница желаний пользователя с курсором по wish_id."""
+    return await _fetch_page(
+        "SELECT * FROM wishlist WHERE user_id = ?", (user_id,), ("wish_id",), cursor, backward, page_size
+    )
+
 async def get_wish_by_id(wish_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.reader() as db:
         cursor = await db.execute("SELECT * FROM wishlist WHERE wish_id = ?", (wish_id,))
         return await cursor.fetchone()
 
 async def delete_wish_by_id(wish_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("DELETE FROM wishlist WHERE wish_id = ? AND user_id = ?", (wish_id, user_id))
         await db.commit()
         logging.info(f"Пользователь {user_id} удалил желание {wish_id}")
 
 async def book_wish(wish_id: int, booker_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("UPDATE wishlist SET booked_by_id = ? WHERE wish_id = ?", (booker_id, wish_id))
         await db.commit()
 
 async def unbook_wish(wish_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("UPDATE wishlist SET booked_by_id = NULL WHERE wish_id = ?", (wish_id,))
         await db.commit()
 
 async def add_memory(couple_id: int, media_type: str, media_file_id: str, description: str, added_at: datetime.date):
     """Добавляет новое воспоминание."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+    async with _pool.writer() as db:
+        cursor = await db.execute(
             "INSERT INTO memories (couple_id, media_type, media_file_id, description, added_at) VALUES (?, ?, ?, ?, ?)",
             (couple_id, media_type, media_file_id, description, added_at)
         )
         await db.commit()
         logging.info(f"Для пары {couple_id} добавлено новое воспоминание.")
+    _archive_cache.invalidate(couple_id)
+
+    deck = _memory_decks.get(couple_id)
+    if deck is not None:
+        deck["ids"].insert(random.randint(deck["pos"], len(deck["ids"])), cursor.lastrowid)
+
+async def _build_memory_deck(couple_id: int, last_shown: int = None) -> dict:
+    """Собирает новую перемешанную колоду, не начиная ее с только что показанного воспоминания."""
+    async with _pool.reader() as db:
+        cursor = await db.execute("SELECT memory_id FROM memories WHERE couple_id = ?", (couple_id,))
+        ids = [row[0] for row in await cursor.fetchall()]
+    random.shuffle(ids)
+    if len(ids) > 1 and ids[0] == last_shown:
+        swap_with = random.randrange(1, len(ids))
+        ids[0], ids[swap_with] = ids[swap_with], ids[0]
+    deck = {"ids": ids, "pos": 0, "last": last_shown}
+    _memory_decks.set(couple_id, deck)
+    return deck
 
 async def get_random_memory(couple_id: int):
-    """Получает случайное воспоминание для пары."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM memories WHERE couple_id = ? ORDER BY RANDOM() LIMIT 1", (couple_id,))
-        return await cursor.fetchone()
-
-async def get_all_memories(couple_id: int):
-    """Получает все воспоминания для пары в хронологическом порядке."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM memories WHERE couple_id = ? ORDER BY added_at DESC", (couple_id,))
-        return await cursor.fetchall()
+    """
+    Получает случайное воспоминание для пары.
+    Берет следующий memory_id из перемешанной колоды пары и читает запись по ключу,
+    так что стоимость вызова не зависит от числа воспоминаний (колода собирается раз за круг).
+    """
+    deck = _memory_decks.get(couple_id)
+    for _ in range(2):
+        if deck is None or deck["pos"] >= len(deck["ids"]):
+            deck = await _build_memory_deck(couple_id, deck["last"] if deck else None)
+            if not deck["ids"]:
+                return None
+
+        memory_id = deck["ids"][deck["pos"]]
+        deck["pos"] += 1
+        deck["last"] = memory_id
+        async with _pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT * FROM memories WHERE memory_id = ? AND couple_id = ?", (memory_id, couple_id)
+            )
+            memory = await cursor.fetchone()
+        if memory:
+            return memory
+        # Воспоминание удалено - колода устарела, собираем заново
+        deck["pos"] = len(deck["ids"])
+    return None
 
 async def add_movie_to_watchlist(couple_id: int, title: str):
     """Добавляет фильм в список просмотра пары."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         try:
             await db.execute(
                 "INSERT INTO movie_watchlist (couple_id, title) VALUES (?, ?)",
@@ -431,24 +773,31 @@ async def add_movie_to_watchlist(couple_id: int, title: str):
             await db.commit()
             return True
         except aiosqlite.IntegrityError: # Если такой фильм уже есть
+            await db.rollback()
             return False
 
 async def get_movie_watchlist(couple_id: int):
     """Получает список фильмов для просмотра для пары."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.reader() as db:
         cursor = await db.execute("SELECT * FROM movie_watchlist WHERE couple_id = ? ORDER BY id", (couple_id,))
         return await cursor.fetchall()
 
+async def get_movie_watchlist_page(couple_id: int, cursor: tuple = None, backward: bool = False,
+                                   page_size: int = 5):
+    """Страница списка фильмов пары с курсором по id."""
+    return await _fetch_page(
+        "SELECT * FROM movie_watchlist WHERE couple_id = ?", (couple_id,), ("id",), cursor, backward, page_size
+    )
+
 async def delete_movie_from_watchlist(movie_id: int, couple_id: int):
     """Удаляет фильм из списка просмотра."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("DELETE FROM movie_watchlist WHERE id = ? AND couple_id = ?", (movie_id, couple_id))
         await db.commit()
 
 async def add_date_idea(couple_id: int, idea_text: str):
     """Добавляет новую идею для свидания."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         try:
             await db.execute(
                 "INSERT INTO date_ideas (couple_id, idea_text) VALUES (?, ?)",
@@ -457,18 +806,20 @@ async def add_date_idea(couple_id: int, idea_text: str):
             await db.commit()
             return True
         except aiosqlite.IntegrityError:
+            await db.rollback()
             return False
 
-async def get_date_ideas(couple_id: int):
-    """Получает все идеи для свиданий для пары."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM date_ideas WHERE couple_id = ? ORDER BY is_completed, id", (couple_id,))
-        return await cursor.fetchall()
+async def get_date_ideas_page(couple_id: int, cursor: tuple = None, backward: bool = False, page_size: int = 5,
+                              inclusive: bool = False):
+    """Страница идей для свиданий: сначала невыполненные, курсор по (is_completed, id)."""
+    return await _fetch_page(
+        "SELECT * FROM date_ideas WHERE couple_id = ?", (couple_id,),
+        ("is_completed", "id"), cursor, backward, page_size, inclusive
+    )
 
 async def toggle_date_idea_status(idea_id: int, couple_id: int):
     """Переключает статус выполнения идеи."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         # Инвертируем текущее значение is_completed
         await db.execute(
             "UPDATE date_ideas SET is_completed = NOT is_completed WHERE id = ? AND couple_id = ?",
@@ -478,6 +829,50 @@ async def toggle_date_idea_status(idea_id: int, couple_id: int):
 
 async def delete_date_idea(idea_id: int, couple_id: int):
     """Удаляет идею для свидания."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool.writer() as db:
         await db.execute("DELETE FROM date_ideas WHERE id = ? AND couple_id = ?", (idea_id, couple_id))
         await db.commit()
+
+
+async def get_fsm_record(storage_key: str):
+    """Возвращает сохраненное состояние FSM, его данные (JSON-строкой) и срок жизни или None."""
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT state, data, expires_at FROM fsm_storage WHERE storage_key = ?", (storage_key,)
+        )
+        return await cursor.fetchone()
+
+async def save_fsm_records(upserts: list, deletes: list):
+    """
+    Записывает пачку изменений FSM одной транзакцией.
+    upserts - кортежи (storage_key, state, data, expires_at), deletes - ключи пустых записей.
+    """
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    async with _pool.writer() as db:
+        if upserts:
+            await db.executemany(
+                """INSERT INTO fsm_storage (storage_key, state, data, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(storage_key) DO UPDATE SET
+                   state = excluded.state, data = excluded.data,
+                   expires_at = excluded.expires_at, updated_at = excluded.updated_at""",
+                [(key, state, data, expires_at, updated_at) for key, state, data, expires_at in upserts]
+            )
+        if deletes:
+            await db.executemany("DELETE FROM fsm_storage WHERE storage_key = ?", [(key,) for key in deletes])
+        await db.commit()
+
+async def delete_expired_fsm_records(now_ts: int) -> int:
+    """Удаляет состояния FSM с истекшим сроком жизни и возвращает их количество."""
+    async with _pool.writer() as db:
+        cursor = await db.execute("DELETE FROM fsm_storage WHERE expires_at <= ?", (now_ts,))
+        await db.commit()
+        return cursor.rowcount
+
+async def get_fsm_storage_size():
+    """Возвращает количество сохраненных состояний FSM и их суммарный размер в байтах."""
+    async with _pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(data AS BLOB)) + LENGTH(CAST(COALESCE(state, '') AS BLOB))), 0) "
+            "FROM fsm_storage"
+        )
+        return await cursor.fetchone()
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from datetime import date, datetime, time as dtime
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from src.db import database as db
+from src.utils.cache import TTLCache
+
+_EMPTY_DATA = "{}"
+_EMPTY_RECORD = (None, _EMPTY_DATA, None)
+
+
+class _FSMEncoder(json.JSONEncoder):
+    """Сохраняет даты и время с пометкой типа, а строки из базы - как обычные словари."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return {"__type__": "datetime", "value": o.isoformat()}
+        if isinstance(o, date):
+            return {"__type__": "date", "value": o.isoformat()}
+        if isinstance(o, dtime):
+            return {"__type__": "time", "value": o.isoformat()}
+        if isinstance(o, sqlite3.Row):
+            return dict(o)
+        return super().default(o)
+
+
+def _decode_object(obj: dict):
+    kind = obj.get("__type__")
+    if kind == "datetime":
+        return datetime.fromisoformat(obj["value"])
+    if kind == "date":
+        return date.fromisoformat(obj["value"])
+    if kind == "time":
+        return dtime.fromisoformat(obj["value"])
+    return obj
+
+
+def dump_data(data: Mapping[str, Any]) -> str:
+    return json.dumps(data, cls=_FSMEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_data(raw: str) -> Dict[str, Any]:
+    return json.loads(raw, object_hook=_decode_object)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в базе бота, состояния диалогов переживают перезапуск.
+
+    Перед базой стоит небольшой LRU-кэш горячих записей (включая пустые, чтобы
+    get_state на каждом апдейте не ходил в базу). Изменения не пишутся сразу:
+    они копятся в памяти и раз в flush_interval секунд сбрасываются одной
+    транзакцией, так что несколько шагов одного диалога дают одну запись.
+    При остановке несброшенные изменения записываются в close().
+
+    Каждая запись живет ограниченное время с момента последнего изменения: срок берется
+    из state_ttls по состоянию или его группе, для остальных состояний - default_ttl,
+    для данных без состояния - data_ttl. Истекшие записи считаются пустыми при чтении
+    и раз в sweep_interval секунд удаляются из базы.
+    """
+
+    def __init__(self, cache_size: int = 5000, cache_ttl: float = 600.0, flush_interval: float = 1.0,
+                 state_ttls: Optional[dict] = None, default_ttl: int = 86400, data_ttl: int = 21600,
+                 sweep_interval: float = 300.0):
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.default_ttl = default_ttl
+        self.data_ttl = data_ttl
+        self.state_ttls = {}
+        for target, ttl in (state_ttls or {}).items():
+            if isinstance(target, State):
+                self.state_ttls[target.state] = ttl
+            elif isinstance(target, type) and issubclass(target, StatesGroup):
+                self.state_ttls[target.__full_group_name__] = ttl
+            else:
+                self.state_ttls[str(target)] = ttl
+
+        # Значения кэша и очередей записи - (state, data в JSON, expires_at)
+        self._hot = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._dirty = {}
+        self._flushing = {}
+        self._tasks = []
+        self._stats = {"flushes": 0, "flushed_records": 0, "flush_errors": 0, "expired": 0}
+        self._size = {"entries": 0, "bytes": 0}
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            getattr(key, "business_connection_id", None), key.destiny
+        ))
+
+    def _ttl_for(self, state: Optional[str]) -> int:
+        if state is None:
+            return self.data_ttl
+        ttl = self.state_ttls.get(state)
+        if ttl is None:
+            ttl = self.state_ttls.get(state.split(":", 1)[0], self.default_ttl)
+        return ttl
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._sweep_loop()),
+        ]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _sweep_loop(self):
+        while True:
+            await self.sweep()
+            await asyncio.sleep(self.sweep_interval)
+
+    async def flush(self):
+        """Записывает в базу все накопленные изменения."""
+        if not self._dirty:
+            return
+        self._flushing, self._dirty = self._dirty, {}
+        upserts = []
+        deletes = []
+        for storage_key, (state, data, expires_at) in self._flushing.items():
+            if state is None and data == _EMPTY_DATA:
+                deletes.append(storage_key)
+            else:
+                upserts.append((storage_key, state, data, expires_at))
+        try:
+            await db.save_fsm_records(upserts, deletes)
+            self._stats["flushes"] += 1
+            self._stats["flushed_records"] += len(self._flushing)
+        except asyncio.CancelledError:
+            self._requeue_flushing()
+            raise
+        except Exception as e:
+            self._stats["flush_errors"] += 1
+            logging.error(f"FSM: не удалось записать {len(self._flushing)} состояний, повторю позже: {e}")
+            self._requeue_flushing()
+        finally:
+            self._flushing = {}
+
+    def _requeue_flushing(self):
+        # Более свежие изменения, пришедшие во время записи, не затираем
+        for storage_key, record in self._flushing.items():
+            self._dirty.setdefault(storage_key, record)
+
+    async def sweep(self):
+        """Удаляет из базы истекшие записи и обновляет счетчики размера хранилища."""
+        try:
+            expired = await db.delete_expired_fsm_records(int(time.time()))
+            entries, size = await db.get_fsm_storage_size()
+        except Exception as e:
+            logging.error(f"FSM: не удалось удалить истекшие состояния: {e}")
+            return
+        self._stats["expired"] += expired
+        self._size = {"entries": entries, "bytes": size}
+        if expired:
+            logging.info(f"FSM: удалено {expired} брошенных диалогов, осталось {entries} ({size} байт).")
+
+    async def _get_record(self, storage_key: str):
+        record = self._dirty.get(storage_key) or self._flushing.get(storage_key)
+        if record is None:
+            record = self._hot.get(storage_key)
+        if record is None:
+            row = await db.get_fsm_record(storage_key)
+            record = (row["state"], row["data"], row["expires_at"]) if row else _EMPTY_RECORD
+            self._hot.set(storage_key, record)
+        expires_at = record[2]
+        if expires_at is not None and expires_at <= time.time():
+            return _EMPTY_RECORD
+        return record
+
+    def _put_record(self, storage_key: str, state: Optional[str], data: str):
+        if state is None and data == _EMPTY_DATA:
+            record = _EMPTY_RECORD
+        else:
+            record = (state, data, int(time.time()) + self._ttl_for(state))
+        self._hot.set(storage_key, record)
+        self._dirty[storage_key] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._make_key(key)
+        _, data, _ = await self._get_record(storage_key)
+        new_state = state.state if isinstance(state, State) else state
+        self._put_record(storage_key, new_state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._get_record(self._make_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self._make_key(key)
+        state, _, _ = await self._get_record(storage_key)
+        self._put_record(storage_key, state, dump_data(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data, _ = await self._get_record(self._make_key(key))
+        return load_data(data)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "cache": self._hot.stats(),
+            "pending": len(self._dirty),
+            **self._size,
+            **self._stats,
+        }
@@ -0,0 +1,189 @@
+import logging
+from datetime import datetime
+
+from src.db.triggers import rebuild_all_triggers
+from src.utils.timezones import DEFAULT_TZ
+
+
+def _legacy_epoch(value: str) -> int:
+    """Переводит старую ISO-строку в секунды UTC. Время без пояса считается московским."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = DEFAULT_TZ.localize(moment)
+    return int(moment.timestamp())
+
+
+async def events_to_epoch(conn):
+    """Пересоздает events с колонкой event_at (секунды UTC) вместо строки event_date."""
+    await conn.execute("""
+        CREATE TABLE events_new (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            couple_id INTEGER NOT NULL,
+            event_at INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            details TEXT
+        )""")
+    cursor = await conn.execute("SELECT event_id, couple_id, event_date, title, details FROM events")
+    await conn.executemany(
+        "INSERT INTO events_new (event_id, couple_id, event_at, title, details) VALUES (?, ?, ?, ?, ?)",
+        [(row[0], row[1], _legacy_epoch(row[2]), row[3], row[4]) for row in await cursor.fetchall()]
+    )
+    await conn.execute("DROP TABLE events")
+    await conn.execute("ALTER TABLE events_new RENAME TO events")
+
+
+async def compliments_to_epoch(conn):
+    """Пересоздает scheduled_compliments, храня send_at в секундах UTC вместо ISO-строки."""
+    await conn.execute("""
+        CREATE TABLE scheduled_compliments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER NOT NULL,
+            receiver_id INTEGER NOT NULL,
+            text TEXT,
+            caption TEXT,
+            attachment_type TEXT,
+            attachment_file_id TEXT,
+            send_at INTEGER NOT NULL
+        )""")
+    cursor = await conn.execute(
+        """SELECT id, sender_id, receiver_id, text, caption, attachment_type, attachment_file_id, send_at
+           FROM scheduled_compliments"""
+    )
+    await conn.executemany(
+        """INSERT INTO scheduled_compliments_new
+           (id, sender_id, receiver_id, text, caption, attachment_type, attachment_file_id, send_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        [(*row[:7], _legacy_epoch(row[7])) for row in await cursor.fetchall()]
+    )
+    await conn.execute("DROP TABLE scheduled_compliments")
+    await conn.execute("ALTER TABLE scheduled_compliments_new RENAME TO scheduled_compliments")
+
+
+# Список миграций схемы: (версия, описание, шаги).
+# Шаг - это SQL-строка или асинхронная функция, принимающая соединение.
+# Версии только добавляются в конец списка, уже примененные миграции не изменяются.
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов", [
+        "CREATE INDEX IF NOT EXISTS idx_events_couple_date ON events (couple_id, event_date)",
+        "CREATE INDEX IF NOT EXISTS idx_memories_couple_added ON memories (couple_id, added_at)",
+        "CREATE INDEX IF NOT EXISTS idx_wishlist_user ON wishlist (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_compliments_send_at ON scheduled_compliments (send_at)",
+    ]),
+    (2, "Таблица пар с заполнением из users.partner_id", [
+        """CREATE TABLE IF NOT EXISTS couples (
+            couple_id INTEGER PRIMARY KEY,
+            user1_id INTEGER NOT NULL UNIQUE,
+            user2_id INTEGER NOT NULL UNIQUE,
+            created_at TEXT
+        )""",
+        """INSERT OR IGNORE INTO couples (couple_id, user1_id, user2_id, created_at)
+           SELECT user_id, user_id, partner_id, start_date FROM users
+           WHERE partner_id IS NOT NULL AND user_id < partner_id""",
+    ]),
+    (3, "Индекс срабатываний планировщика по минутам суток", [
+        """CREATE TABLE IF NOT EXISTS schedule_triggers (
+            minute_of_day INTEGER NOT NULL,
+            couple_id INTEGER NOT NULL,
+            job_kind TEXT NOT NULL,
+            PRIMARY KEY (minute_of_day, couple_id, job_kind)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_triggers_couple ON schedule_triggers (couple_id)",
+        rebuild_all_triggers,
+    ]),
+    (4, "Хранилище состояний FSM", [
+        """CREATE TABLE IF NOT EXISTS fsm_storage (
+            storage_key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID""",
+    ]),
+    (5, "Срок жизни состояний FSM", [
+        "ALTER TABLE fsm_storage ADD COLUMN expires_at INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires ON fsm_storage (expires_at)",
+    ]),
+    (6, "Индексы для постраничного просмотра списков", [
+        "DROP INDEX IF EXISTS idx_events_couple_date",
+        "CREATE INDEX IF NOT EXISTS idx_events_couple_date ON events (couple_id, event_date, event_id)",
+        "DROP INDEX IF EXISTS idx_wishlist_user",
+        "CREATE INDEX IF NOT EXISTS idx_wishlist_user ON wishlist (user_id, wish_id)",
+        "CREATE INDEX IF NOT EXISTS idx_movie_watchlist_couple ON movie_watchlist (couple_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_date_ideas_couple_status ON date_ideas (couple_id, is_completed, id)",
+    ]),
+    (7, "Колоды вопросов дня без повторов", [
+        """CREATE TABLE IF NOT EXISTS question_decks (
+            couple_id INTEGER PRIMARY KEY,
+            segments TEXT NOT NULL
+        )""",
+    ]),
+    (8, "Служебное состояние бота и отпечатки строк questions.txt", [
+        """CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )""",
+        "CREATE TABLE IF NOT EXISTS question_sync (fingerprint INTEGER PRIMARY KEY)",
+    ]),
+    (9, "Время событий и отложенных комплиментов в секундах UTC", [
+        events_to_epoch,
+        "CREATE INDEX IF NOT EXISTS idx_events_couple_at ON events (couple_id, event_at, event_id)",
+        compliments_to_epoch,
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_compliments_send_at ON scheduled_compliments (send_at)",
+    ]),
+    (10, "Часовой пояс пары и срабатывания планировщика по UTC", [
+        "ALTER TABLE couple_settings ADD COLUMN timezone TEXT NOT NULL DEFAULT 'Europe/Moscow'",
+        "DROP TABLE IF EXISTS schedule_triggers",
+        """CREATE TABLE schedule_triggers (
+            minute_of_day INTEGER NOT NULL,
+            couple_id INTEGER NOT NULL,
+            job_kind TEXT NOT NULL,
+            utc_offset INTEGER NOT NULL,
+            valid_until INTEGER NOT NULL,
+            PRIMARY KEY (minute_of_day, couple_id, job_kind)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_triggers_couple ON schedule_triggers (couple_id)",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_triggers_valid_until ON schedule_triggers (valid_until)",
+        rebuild_all_triggers,
+    ]),
+]
+
+
+async def get_schema_version(conn) -> int:
+    cursor = await conn.execute("SELECT MAX(version) FROM schema_version")
+    row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def apply_migrations(conn):
+    """
+    Применяет по порядку все миграции, которые еще не записаны в schema_version.
+    Каждая миграция выполняется в отдельной транзакции.
+    """
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT NOT NULL
+        )""")
+    await conn.commit()
+
+    current_version = await get_schema_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version:
+            continue
+        await conn.execute("BEGIN")
+        try:
+            for step in steps:
+                if isinstance(step, str):
+                    await conn.execute(step)
+                else:
+                    await step(conn)
+            await conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            logging.exception(f"Не удалось применить миграцию {version}: {description}")
+            raise
+        logging.info(f"Применена миграция {version}: {description}")
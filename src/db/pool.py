@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений aiosqlite: одно соединение для записи и N для чтения.
+
+    SQLite допускает только одного писателя, поэтому все изменения идут через
+    единственное соединение под замком, а чтения распределяются по читателям.
+    В режиме WAL читатели не блокируют писателя и наоборот.
+    """
+
+    def __init__(self, db_path, readers: int = 4, acquire_timeout: float = 5.0):
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self.acquire_timeout = acquire_timeout
+
+        self._writer = None
+        self._writer_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+
+        self._stats = {
+            "reader_acquired": 0,
+            "writer_acquired": 0,
+            "reader_wait_total": 0.0,
+            "writer_wait_total": 0.0,
+            "timeouts": 0,
+            "readers_in_use_peak": 0,
+        }
+
+    async def _connect(self, readonly: bool = False):
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute("PRAGMA foreign_keys = ON")
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        if readonly:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def open(self):
+        """Открывает соединения пула. Вызывается один раз при старте бота."""
+        self._writer = await self._connect()
+        for _ in range(self.readers_count):
+            conn = await self._connect(readonly=True)
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+        logging.info(f"Пул соединений открыт: 1 писатель, {self.readers_count} читателей.")
+
+    async def close(self):
+        """Закрывает все соединения пула."""
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers.clear()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+        logging.info(f"Пул соединений закрыт. Статистика: {self.stats()}")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Выдает соединение только для чтения."""
+        started = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self._readers.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise PoolTimeoutError("Истекло время ожидания соединения для чтения")
+
+        self._stats["reader_acquired"] += 1
+        self._stats["reader_wait_total"] += time.monotonic() - started
+        in_use = self.readers_count - self._readers.qsize()
+        self._stats["readers_in_use_peak"] = max(self._stats["readers_in_use_peak"], in_use)
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        """
+        Выдает единственное соединение для записи.
+        Если внутри блока возникло исключение, незафиксированные изменения откатываются.
+        """
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._writer_lock.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise PoolTimeoutError("Истекло время ожидания соединения для записи")
+
+        self._stats["writer_acquired"] += 1
+        self._stats["writer_wait_total"] += time.monotonic() - started
+        try:
+            yield self._writer
+        except BaseException:
+            await self._writer.rollback()
+            raise
+        finally:
+            self._writer_lock.release()
+
+    def stats(self) -> dict:
+        """Возвращает статистику использования пула."""
+        readers_acquired = self._stats["reader_acquired"]
+        writer_acquired = self._stats["writer_acquired"]
+        return {
+            "readers_total": self.readers_count,
+            "readers_in_use": self.readers_count - self._readers.qsize(),
+            "readers_in_use_peak": self._stats["readers_in_use_peak"],
+            "writer_busy": self._writer_lock.locked(),
+            "reader_acquired": readers_acquired,
+            "writer_acquired": writer_acquired,
+            "reader_wait_avg_ms": round(self._stats["reader_wait_total"] / readers_acquired * 1000, 2) if readers_acquired else 0.0,
+            "writer_wait_avg_ms": round(self._stats["writer_wait_total"] / writer_acquired * 1000, 2) if writer_acquired else 0.0,
+            "timeouts": self._stats["timeouts"],
+        }
@@ -0,0 +1,109 @@
+import json
+import math
+import random
+
+# Колода вопросов пары - список сегментов {"lo", "hi", "seed", "pos"}.
+# Сегмент покрывает question_id из диапазона [lo, hi] и выдает их в порядке
+# аффинной перестановки (a * i + b) mod n, где a и b выводятся из seed, а pos -
+# сколько позиций уже выдано. Новые вопросы добавляются в колоду отдельным сегментом,
+# поэтому пара не увидит повтор, пока не пройдет весь каталог.
+
+# Сколько пустых позиций (удаленных question_id) пропустить за один вызов
+MAX_SKIPPED_GAPS = 1000
+
+
+def new_segment(lo: int, hi: int) -> dict:
+    return {"lo": lo, "hi": hi, "seed": random.getrandbits(32), "pos": 0}
+
+
+def affine_params(seed: int, n: int) -> tuple:
+    """Выводит из seed коэффициенты перестановки: a взаимно просто с n."""
+    rng = random.Random(seed)
+    b = rng.randrange(n)
+    if n == 1:
+        return 1, b
+    a = rng.randrange(1, n)
+    while math.gcd(a, n) != 1:
+        a = rng.randrange(1, n)
+    return a, b
+
+
+def segment_remaining(segment: dict) -> int:
+    return segment["hi"] - segment["lo"] + 1 - segment["pos"]
+
+
+def take_from_segment(segment: dict) -> int:
+    """Возвращает следующий question_id сегмента и сдвигает позицию."""
+    n = segment["hi"] - segment["lo"] + 1
+    a, b = affine_params(segment["seed"], n)
+    question_id = segment["lo"] + (a * segment["pos"] + b) % n
+    segment["pos"] += 1
+    return question_id
+
+
+def _next_question_id(segments: list, min_id: int, max_id: int) -> tuple:
+    """
+    Выбирает сегмент случайно с весом по числу оставшихся в нем вопросов и берет из него
+    следующий question_id. Если каталог пройден целиком, колода начинается заново.
+    Возвращает (сегменты, question_id).
+    """
+    open_segments = [segment for segment in segments if segment_remaining(segment) > 0]
+    if not open_segments:
+        segments = open_segments = [new_segment(min_id, max_id)]
+    segment = random.choices(open_segments, weights=[segment_remaining(s) for s in open_segments])[0]
+    return segments, take_from_segment(segment)
+
+
+async def draw_questions(conn, couple_ids: list) -> dict:
+    """
+    Достает следующий вопрос из колоды каждой пары и сохраняет новые состояния колод.
+    Колоды читаются одним запросом и сохраняются одним executemany, вопросы
+    загружаются одним запросом на раунд; пустые позиции (удаленные вопросы) добирают
+    следующие раунды. Возвращает {couple_id: вопрос}. Не фиксирует транзакцию.
+    """
+    if not couple_ids:
+        return {}
+    cursor = await conn.execute("SELECT MIN(question_id), MAX(question_id) FROM questions")
+    min_id, max_id = await cursor.fetchone()
+    if max_id is None:
+        return {}
+
+    cursor = await conn.execute(
+        "SELECT couple_id, segments FROM question_decks WHERE couple_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(couple_ids),)
+    )
+    decks = {row[0]: json.loads(row[1]) for row in await cursor.fetchall()}
+    for couple_id in couple_ids:
+        segments = decks.get(couple_id) or [new_segment(min_id, max_id)]
+        # Вопросы, добавленные после создания колоды, подмешиваются новым сегментом
+        covered_to = max(segment["hi"] for segment in segments)
+        if max_id > covered_to:
+            segments.append(new_segment(covered_to + 1, max_id))
+        decks[couple_id] = segments
+
+    questions = {}
+    pending = list(couple_ids)
+    for _ in range(MAX_SKIPPED_GAPS):
+        if not pending:
+            break
+        picks = {}
+        for couple_id in pending:
+            decks[couple_id], picks[couple_id] = _next_question_id(decks[couple_id], min_id, max_id)
+        cursor = await conn.execute(
+            "SELECT * FROM questions WHERE question_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(set(picks.values()))),)
+        )
+        found = {row["question_id"]: row for row in await cursor.fetchall()}
+        pending = []
+        for couple_id, question_id in picks.items():
+            if question_id in found:
+                questions[couple_id] = found[question_id]
+            else:
+                pending.append(couple_id)
+
+    await conn.executemany(
+        """INSERT INTO question_decks (couple_id, segments) VALUES (?, ?)
+           ON CONFLICT(couple_id) DO UPDATE SET segments = excluded.segments""",
+        [(couple_id, json.dumps(decks[couple_id])) for couple_id in couple_ids]
+    )
+    return questions
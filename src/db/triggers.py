@@ -0,0 +1,107 @@
+import json
+import time
+from datetime import datetime
+
+from src.utils.timezones import get_timezone, next_offset_change, utc_offset_minutes
+
+# Виды задач, которые планировщик запускает по времени из настроек пары
+JOB_EVENT_REMINDER = "event_reminder"
+JOB_QOTD_SEND = "qotd_send"
+JOB_QOTD_REMINDER = "qotd_reminder"
+JOB_QOTD_SUMMARY = "qotd_summary"
+
+MINUTES_IN_DAY = 24 * 60
+
+
+def minute_of_day(time_str: str) -> int:
+    """Переводит время 'ЧЧ:ММ' в номер минуты от начала суток."""
+    parsed = datetime.strptime(time_str, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+def build_triggers(settings, utc_offset: int) -> list:
+    """
+    Возвращает список (минута суток по UTC, вид задачи) для настроек одной пары.
+    Местное время из настроек переводится в UTC по смещению пояса пары utc_offset (в минутах).
+    """
+    local_triggers = []
+    if settings['reminders_enabled']:
+        local_triggers.append((minute_of_day(settings['reminder_time']), JOB_EVENT_REMINDER))
+    if settings['qotd_enabled']:
+        summary_minute = minute_of_day(settings['qotd_summary_time'])
+        local_triggers.append((minute_of_day(settings['qotd_send_time']), JOB_QOTD_SEND))
+        # Напоминание об ответе приходит за час до итогов
+        local_triggers.append((summary_minute - 60, JOB_QOTD_REMINDER))
+        local_triggers.append((summary_minute, JOB_QOTD_SUMMARY))
+    return [((minute - utc_offset) % MINUTES_IN_DAY, kind) for minute, kind in local_triggers]
+
+
+def _zone_offset(name: str, now: int, offsets: dict) -> tuple:
+    """
+    Возвращает (смещение пояса в минутах, момент его ближайшей смены) для пояса name.
+    Поиск смены смещения дорогой, поэтому результат запоминается в offsets на один пересчет.
+    """
+    cached = offsets.get(name)
+    if cached is None:
+        tz = get_timezone(name)
+        cached = offsets[name] = (utc_offset_minutes(tz, now), next_offset_change(tz, now))
+    return cached
+
+
+async def rebuild_triggers(conn, couple_ids: list):
+    """
+    Пересчитывает записи schedule_triggers для пар couple_ids по их текущим настройкам.
+    Записи действительны до ближайшей смены смещения пояса пары (valid_until),
+    после чего планировщик пересчитывает их заново. Смещение и срок считаются
+    один раз на пояс, а не на каждую пару.
+    Не фиксирует транзакцию - это делает вызывающий код.
+    """
+    if not couple_ids:
+        return
+    ids = json.dumps(couple_ids)
+    await conn.execute("DELETE FROM schedule_triggers WHERE couple_id IN (SELECT value FROM json_each(?))", (ids,))
+    cursor = await conn.execute(
+        "SELECT * FROM couple_settings WHERE couple_id IN (SELECT value FROM json_each(?))", (ids,)
+    )
+    now = int(time.time())
+    offsets = {}
+    rows = []
+    for settings in await cursor.fetchall():
+        utc_offset, valid_until = _zone_offset(settings['timezone'], now, offsets)
+        rows.extend(
+            (minute, settings['couple_id'], kind, utc_offset, valid_until)
+            for minute, kind in build_triggers(settings, utc_offset)
+        )
+    await conn.executemany(
+        """INSERT OR IGNORE INTO schedule_triggers (minute_of_day, couple_id, job_kind, utc_offset, valid_until)
+           VALUES (?, ?, ?, ?, ?)""",
+        rows
+    )
+
+
+async def rebuild_couple_triggers(conn, couple_id: int):
+    """Пересчитывает записи schedule_triggers для одной пары. Не фиксирует транзакцию."""
+    await rebuild_triggers(conn, [couple_id])
+
+
+async def rebuild_all_triggers(conn):
+    """
+    Заполняет schedule_triggers для всех пар с настройками.
+    На схеме до миграции 10 (без utc_offset) ничего не делает: таблицу заполнит миграция 10.
+    """
+    cursor = await conn.execute("PRAGMA table_info(schedule_triggers)")
+    if "utc_offset" not in {row[1] for row in await cursor.fetchall()}:
+        return
+    cursor = await conn.execute("SELECT couple_id FROM couple_settings")
+    await rebuild_triggers(conn, [row[0] for row in await cursor.fetchall()])
+
+
+async def rebuild_stale_triggers(conn, now: int) -> int:
+    """
+    Пересчитывает записи пар, у которых сменилось смещение пояса (срок valid_until истек).
+    Возвращает число пересчитанных пар. Не фиксирует транзакцию.
+    """
+    cursor = await conn.execute("SELECT DISTINCT couple_id FROM schedule_triggers WHERE valid_until <= ?", (now,))
+    couple_ids = [row[0] for row in await cursor.fetchall()]
+    await rebuild_triggers(conn, couple_ids)
+    return len(couple_ids)
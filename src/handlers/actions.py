@@ -1,6 +1,5 @@
 import logging
 from datetime import datetime, timedelta
-import pytz
 from aiogram import Router, F, types, Bot
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -8,19 +7,17 @@ from aiogram.fsm.context import FSMContext
 from src.db import database as db
 from src.states.user_states import Actions
 from src.keyboards.inline import get_send_time_kb, get_skip_attachment_kb, get_date_selection_kb
+from src.utils.compliment_timer import compliment_timer
+from src.utils.outbound import PRIORITY_NOTIFICATION, priority_scope
 
 router = Router()
 
 
-@router.message(Command("compliment"))
+@router.message(Command("compliment"), flags={"couple_required": True})
 async def cmd_compliment(message: types.Message, state: FSMContext):
     """
     Шаг 1: Начинает диалог и просит ввести текст.
     """
-    user_data = await db.get_user(message.from_user.id)
-    if not user_data or not user_data['partner_id']:
-        await message.answer("Эта команда доступна только для пар.")
-        return
     await state.set_state(Actions.waiting_for_compliment_text)
     await message.answer("Какой комплимент вы хотите отправить партнеру? Напишите текст.")
 
@@ -75,13 +72,13 @@ async def process_skip_attachment(callback: types.CallbackQuery, state: FSMConte
     await state.set_state(Actions.waiting_for_send_time_choice)
 
 
-@router.callback_query(Actions.waiting_for_send_time_choice, F.data == "send_now")
-async def process_send_now(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Actions.waiting_for_send_time_choice, F.data == "send_now", flags={"couple_required": True})
+async def process_send_now(callback: types.CallbackQuery, state: FSMContext, user_data: dict, partner: dict):
     """
     Шаг 4 (Вариант А): Пользователь выбрал "Отправить сейчас". Завершаем диалог.
     """
     await callback.message.delete()
-    await finalize_compliment(callback.from_user.id, callback.bot, state)
+    await finalize_compliment(callback.from_user.id, user_data, partner, callback.bot, state)
 
 
 @router.callback_query(Actions.waiting_for_send_time_choice, F.data == "send_later")
@@ -97,26 +94,27 @@ async def process_send_later(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(Actions.waiting_for_send_date)
 
 
-@router.callback_query(Actions.waiting_for_send_date, F.data.startswith("date_"))
-async def process_date_button(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Actions.waiting_for_send_date, F.data.startswith("date_"), flags={"couple_required": True})
+async def process_date_button(callback: types.CallbackQuery, state: FSMContext, couple_id: int):
     """
     Шаг 5 (Вариант А): Обрабатывает нажатие кнопок "Сегодня" / "Завтра".
     """
     await callback.answer()
     date_choice = callback.data.split("_")[1]
     send_date = None
+    today = await db.get_couple_today(couple_id)
     if date_choice == "today":
-        send_date = datetime.now().date()
+        send_date = today
     elif date_choice == "tomorrow":
-        send_date = (datetime.now() + timedelta(days=1)).date()
+        send_date = today + timedelta(days=1)
     await state.update_data(send_date=send_date)
     await callback.message.edit_text(
         "Отлично! Теперь введите время в формате <b>ЧЧ:ММ</b> (например, 09:30 или 18:00).")
     await state.set_state(Actions.waiting_for_send_time)
 
 
-@router.message(Actions.waiting_for_send_date, F.text)
-async def process_date_text_input(message: types.Message, state: FSMContext):
+@router.message(Actions.waiting_for_send_date, F.text, flags={"couple_required": True})
+async def process_date_text_input(message: types.Message, state: FSMContext, couple_id: int):
     """
     Шаг 5 (Вариант Б): Обрабатывает дату, введенную вручную.
     """
@@ -125,7 +123,7 @@ async def process_date_text_input(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Неверный формат. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ или выберите на кнопках.")
         return
-    if send_date < datetime.now().date():
+    if send_date < await db.get_couple_today(couple_id):
         await message.answer("Эта дата уже в прошлом! Пожалуйста, выберите сегодняшнюю или будущую дату.")
         return
     await state.update_data(send_date=send_date)
@@ -133,8 +131,9 @@ async def process_date_text_input(message: types.Message, state: FSMContext):
     await state.set_state(Actions.waiting_for_send_time)
 
 
-@router.message(Actions.waiting_for_send_time, F.text)
-async def process_send_time(message: types.Message, state: FSMContext):
+@router.message(Actions.waiting_for_send_time, F.text, flags={"couple_required": True})
+async def process_send_time(message: types.Message, state: FSMContext, user_data: dict, partner: dict,
+                            couple_id: int):
     """
     Шаг 6: Обрабатывает время, сохраняет его и завершает диалог.
     """
@@ -143,22 +142,20 @@ async def process_send_time(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Неверный формат. Пожалуйста, введите время в формате ЧЧ:ММ.")
         return
-    user_data = await state.get_data()
-    naive_send_datetime = datetime.combine(user_data['send_date'], user_time)
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    aware_send_datetime = moscow_tz.localize(naive_send_datetime)
-    if aware_send_datetime < datetime.now(moscow_tz):
+    data = await state.get_data()
+    naive_send_datetime = datetime.combine(data['send_date'], user_time)
+    couple_tz = await db.get_couple_timezone(couple_id)
+    aware_send_datetime = couple_tz.localize(naive_send_datetime)
+    if aware_send_datetime < datetime.now(couple_tz):
         await message.answer("Это время уже прошло! Пожалуйста, выберите будущее время.")
         return
     await state.update_data(send_datetime=aware_send_datetime)
-    await finalize_compliment(message.from_user.id, message.bot, state)
+    await finalize_compliment(message.from_user.id, user_data, partner, message.bot, state)
 
 
-async def finalize_compliment(user_id: int, bot: Bot, state: FSMContext):
+async def finalize_compliment(user_id: int, sender: dict, partner: dict, bot: Bot, state: FSMContext):
     data = await state.get_data()
     await state.clear()
-    sender = await db.get_user(user_id)
-    partner = await db.get_partner(user_id)
     if not partner or not sender:
         logging.error(f"Не удалось найти пару для user_id: {user_id} при финализации комплимента.")
         try:
@@ -179,16 +176,17 @@ async def finalize_compliment(user_id: int, bot: Bot, state: FSMContext):
 
     if 'send_datetime' not in data:
         try:
-            await bot.send_message(chat_id=partner['user_id'], text=full_message)
-            if file_id:
-                if attachment_type == 'photo':
-                    await bot.send_photo(chat_id=partner['user_id'], photo=file_id, caption=caption)
-                elif attachment_type == 'video':
-                    await bot.send_video(chat_id=partner['user_id'], video=file_id, caption=caption)
-                elif attachment_type == 'voice':
-                    await bot.send_voice(chat_id=partner['user_id'], voice=file_id, caption=caption)
-                elif attachment_type == 'video_note':
-                    await bot.send_video_note(chat_id=partner['user_id'], video_note=file_id)
+            with priority_scope(PRIORITY_NOTIFICATION):
+                await bot.send_message(chat_id=partner['user_id'], text=full_message)
+                if file_id:
+                    if attachment_type == 'photo':
+                        await bot.send_photo(chat_id=partner['user_id'], photo=file_id, caption=caption)
+                    elif attachment_type == 'video':
+                        await bot.send_video(chat_id=partner['user_id'], video=file_id, caption=caption)
+                    elif attachment_type == 'voice':
+                        await bot.send_voice(chat_id=partner['user_id'], voice=file_id, caption=caption)
+                    elif attachment_type == 'video_note':
+                        await bot.send_video_note(chat_id=partner['user_id'], video_note=file_id)
             await bot.send_message(user_id, "Ваш комплимент отправлен! 💖")
         except Exception as e:
             logging.error(f"Ошибка при отправке комплимента: {e}")
@@ -196,14 +194,14 @@ async def finalize_compliment(user_id: int, bot: Bot, state: FSMContext):
     else:
         send_datetime = data['send_datetime']
         send_time_str = send_datetime.strftime('%d.%m.%Y в %H:%M')
-        send_at_iso = send_datetime.isoformat()
-        await db.add_scheduled_compliment(
+        compliment_id = await db.add_scheduled_compliment(
             sender_id=user_id,
             receiver_id=partner['user_id'],
             text=text,
             caption=caption,
             attachment_type=attachment_type,
             attachment_file_id=file_id,
-            send_at=send_at_iso
+            send_at=send_datetime
         )
+        compliment_timer.schedule(compliment_id, send_datetime)
         await bot.send_message(user_id, f"Отлично! Ваш комплимент будет отправлен {send_time_str}. 💌")
@@ -1,6 +1,5 @@
 import logging
 from datetime import datetime, timedelta
-import pytz
 from aiogram import Router, F, types, Bot
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -9,6 +8,9 @@ from itertools import groupby
 from src.db import database as db
 from src.states.user_states import Calendar
 from src.keyboards.inline import get_events_period_kb, get_skip_details_kb, get_date_selection_kb, get_delete_event_kb
+from src.utils.outbound import PRIORITY_NOTIFICATION, priority_scope
+from src.utils.paging import PAGE_SIZE, page_cursors, parse_page_callback
+from src.utils.timezones import from_epoch
 
 router = Router()
 
@@ -18,14 +20,9 @@ WEEKDAYS_RU = {
 }
 
 
-@router.message(Command("addevent"))
+@router.message(Command("addevent"), flags={"couple_required": True})
 async def cmd_addevent(message: types.Message, state: FSMContext):
     await state.clear()
-    user_data = await db.get_user(message.from_user.id)
-    if not user_data or not user_data['partner_id']:
-        await message.answer("Эта команда доступна только для пар.")
-        return
-
     await state.set_state(Calendar.waiting_for_event_date)
     await message.answer(
         "На какую дату планируем событие? Выберите или введите вручную (ДД.ММ.ГГГГ).",
@@ -33,29 +30,30 @@ async def cmd_addevent(message: types.Message, state: FSMContext):
     )
 
 
-@router.callback_query(Calendar.waiting_for_event_date, F.data.startswith("date_"))
-async def process_event_date_button(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Calendar.waiting_for_event_date, F.data.startswith("date_"), flags={"couple_required": True})
+async def process_event_date_button(callback: types.CallbackQuery, state: FSMContext, couple_id: int):
     await callback.answer()
     date_choice = callback.data.split("_")[1]
     send_date = None
+    today = await db.get_couple_today(couple_id)
     if date_choice == "today":
-        send_date = datetime.now().date()
+        send_date = today
     elif date_choice == "tomorrow":
-        send_date = (datetime.now() + timedelta(days=1)).date()
+        send_date = today + timedelta(days=1)
 
     await state.update_data(event_date=send_date)
     await callback.message.edit_text("Отлично! Теперь введите время в формате ЧЧ:ММ.")
     await state.set_state(Calendar.waiting_for_event_time)
 
 
-@router.message(Calendar.waiting_for_event_date, F.text)
-async def process_event_date_text(message: types.Message, state: FSMContext):
+@router.message(Calendar.waiting_for_event_date, F.text, flags={"couple_required": True})
+async def process_event_date_text(message: types.Message, state: FSMContext, couple_id: int):
     try:
         send_date = datetime.strptime(message.text, "%d.%m.%Y").date()
     except ValueError:
         await message.answer("Неверный формат. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ.")
         return
-    if send_date < datetime.now().date():
+    if send_date < await db.get_couple_today(couple_id):
         await message.answer("Эта дата уже в прошлом!")
         return
     await state.update_data(event_date=send_date)
@@ -63,8 +61,8 @@ async def process_event_date_text(message: types.Message, state: FSMContext):
     await state.set_state(Calendar.waiting_for_event_time)
 
 
-@router.message(Calendar.waiting_for_event_time, F.text)
-async def process_event_time(message: types.Message, state: FSMContext):
+@router.message(Calendar.waiting_for_event_time, F.text, flags={"couple_required": True})
+async def process_event_time(message: types.Message, state: FSMContext, couple_id: int):
     try:
         user_time = datetime.strptime(message.text, "%H:%M").time()
     except ValueError:
@@ -76,9 +74,9 @@ async def process_event_time(message: types.Message, state: FSMContext):
 
     naive_event_datetime = datetime.combine(event_date, user_time)
 
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    aware_event_datetime = moscow_tz.localize(naive_event_datetime)
-    now_aware = datetime.now(moscow_tz)
+    couple_tz = await db.get_couple_timezone(couple_id)
+    aware_event_datetime = couple_tz.localize(naive_event_datetime)
+    now_aware = datetime.now(couple_tz)
 
     if aware_event_datetime < now_aware:
         await message.answer("Это время уже прошло! Пожалуйста, выберите будущее время.")
@@ -98,21 +96,17 @@ async def process_event_title(message: types.Message, state: FSMContext):
     await state.set_state(Calendar.waiting_for_event_details)
 
 
-async def finalize_event_creation(user_id: int, bot: Bot, state: FSMContext):
+async def finalize_event_creation(user_id: int, user: dict, partner: dict, couple_id: int, bot: Bot, state: FSMContext):
     data = await state.get_data()
     await state.clear()
 
-    user = await db.get_user(user_id)
-    partner = await db.get_partner(user_id)
-
     event_date = data['event_date']
     event_time = data['event_time']
     event_title = data['event_title']
     event_details = data.get('event_details')
 
-    full_event_date = datetime.combine(event_date, event_time)
-
-    couple_id = min(user_id, partner['user_id'])
+    couple_tz = await db.get_couple_timezone(couple_id)
+    full_event_date = couple_tz.localize(datetime.combine(event_date, event_time))
 
     await db.add_event(couple_id, full_event_date, event_title, event_details)
 
@@ -120,44 +114,41 @@ async def finalize_event_creation(user_id: int, bot: Bot, state: FSMContext):
     await bot.send_message(user_id, f"✅ Событие добавлено: {event_date_str} - {event_title}")
 
     try:
-        await bot.send_message(
-            partner['user_id'],
-            f"🔔 {user['username']} добавил(а) новое событие: {event_date_str} - {event_title}"
-        )
+        with priority_scope(PRIORITY_NOTIFICATION):
+            await bot.send_message(
+                partner['user_id'],
+                f"🔔 {user['username']} добавил(а) новое событие: {event_date_str} - {event_title}"
+            )
     except Exception as e:
         logging.error(f"Не удалось уведомить партнера {partner['user_id']} о новом событии: {e}")
 
 
-@router.message(Calendar.waiting_for_event_details, F.text)
-async def process_event_details(message: types.Message, state: FSMContext):
+@router.message(Calendar.waiting_for_event_details, F.text, flags={"couple_required": True})
+async def process_event_details(message: types.Message, state: FSMContext, user_data: dict, partner: dict,
+                                couple_id: int):
     await state.update_data(event_details=message.text)
-    await finalize_event_creation(message.from_user.id, message.bot, state)
+    await finalize_event_creation(message.from_user.id, user_data, partner, couple_id, message.bot, state)
 
 
-@router.callback_query(Calendar.waiting_for_event_details, F.data == "skip_details")
-async def process_skip_details(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Calendar.waiting_for_event_details, F.data == "skip_details", flags={"couple_required": True})
+async def process_skip_details(callback: types.CallbackQuery, state: FSMContext, user_data: dict, partner: dict,
+                               couple_id: int):
     await callback.message.delete()
-    await finalize_event_creation(callback.from_user.id, callback.bot, state)
+    await finalize_event_creation(callback.from_user.id, user_data, partner, couple_id, callback.bot, state)
 
 
-@router.message(Command("events"))
+@router.message(Command("events"), flags={"couple_required": True})
 async def cmd_events(message: types.Message, state: FSMContext):
     await state.clear()
-    user_data = await db.get_user(message.from_user.id)
-    if not user_data or not user_data['partner_id']:
-        await message.answer("Эта команда доступна только для пар.")
-        return
     await message.answer("За какой период показать события?", reply_markup=get_events_period_kb())
 
 
-@router.callback_query(F.data.startswith("events_"))
-async def process_events_period(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("events_"), flags={"couple_required": True})
+async def process_events_period(callback: types.CallbackQuery, couple_id: int):
     period = callback.data.split("_")[1]
-    user_id = callback.from_user.id
-    partner = await db.get_partner(user_id)
-    couple_id = min(user_id, partner['user_id'])
 
-    now = datetime.now()
+    couple_tz = await db.get_couple_timezone(couple_id)
+    now = datetime.now(couple_tz)
     start_date = now
     end_date = None
     title = ""
@@ -188,7 +179,7 @@ async def process_events_period(callback: types.CallbackQuery):
 
     response_text = f"<b>{title}</b>\n\n"
 
-    key_func = lambda e: datetime.fromisoformat(e['event_date']).date()
+    key_func = lambda e: from_epoch(e['event_at'], couple_tz).date()
 
     for event_date, daily_events in groupby(events, key=key_func):
         day_of_week_en = event_date.strftime("%A")
@@ -197,8 +188,7 @@ async def process_events_period(callback: types.CallbackQuery):
         response_text += f"————— <b>{day_str}</b> —————\n"
 
         for event in daily_events:
-            event_datetime = datetime.fromisoformat(event['event_date'])
-            time_str = event_datetime.strftime("%H:%M")
+            time_str = from_epoch(event['event_at'], couple_tz).strftime("%H:%M")
             response_text += f"    {time_str} - {event['title']}\n"
             if event['details']:
                 response_text += f"         <i>└ {event['details']}</i>\n"
@@ -208,36 +198,43 @@ async def process_events_period(callback: types.CallbackQuery):
     await callback.message.edit_text(response_text)
 
 
-@router.message(Command("delevent"))
-async def cmd_delevent(message: types.Message, state: FSMContext):
-    await state.clear()
-    user_id = message.from_user.id
-    partner = await db.get_partner(user_id)
-    if not partner:
-        await message.answer("Эта команда доступна только для пар.")
-        return
+async def build_delete_events_kb(couple_id: int, cursor: tuple = None, backward: bool = False):
+    """Загружает одну страницу предстоящих событий и строит для нее клавиатуру удаления."""
+    couple_tz = await db.get_couple_timezone(couple_id)
+    now = datetime.now(couple_tz)
+    end = now + timedelta(days=365 * 5)
+    events, has_more = await db.get_events_page(couple_id, now, end, cursor, backward, PAGE_SIZE)
+    if not events and cursor is not None:
+        # Страница опустела (события удалены или прошли) - начинаем сначала
+        cursor, backward = None, False
+        events, has_more = await db.get_events_page(couple_id, now, end, page_size=PAGE_SIZE)
+    if not events:
+        return None
 
-    couple_id = min(user_id, partner['user_id'])
-    now = datetime.now()
-    events = await db.get_events_for_period(couple_id, now, now + timedelta(days=365 * 5))
+    prev_cursor, next_cursor = page_cursors(
+        events, lambda e: (e['event_at'], e['event_id']), cursor, backward, has_more
+    )
+    return get_delete_event_kb(events, prev_cursor, next_cursor, couple_tz)
 
-    if not events:
+
+@router.message(Command("delevent"), flags={"couple_required": True})
+async def cmd_delevent(message: types.Message, state: FSMContext, couple_id: int):
+    await state.clear()
+    keyboard = await build_delete_events_kb(couple_id)
+
+    if not keyboard:
         await message.answer("У вас нет предстоящих событий для удаления.")
         return
 
     await message.answer(
         "Какое событие вы хотите удалить?",
-        reply_markup=get_delete_event_kb(events)
+        reply_markup=keyboard
     )
 
 
-@router.callback_query(F.data.startswith("del_event_"))
-async def process_del_event(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("del_event_"), flags={"couple_required": True})
+async def process_del_event(callback: types.CallbackQuery, partner: dict, couple_id: int):
     event_id = int(callback.data.split("_")[-1])
-
-    user_id = callback.from_user.id
-    partner = await db.get_partner(user_id)
-    couple_id = min(user_id, partner['user_id'])
     event = await db.get_event_by_id(event_id, couple_id)
 
     if not event:
@@ -249,21 +246,21 @@ async def process_del_event(callback: types.CallbackQuery):
     await callback.message.edit_text(f"✅ Событие '{event['title']}' удалено.")
 
     try:
-        await callback.bot.send_message(
-            partner['user_id'],
-            f"🔔 {callback.from_user.username} удалил(а) событие: '{event['title']}'"
-        )
+        with priority_scope(PRIORITY_NOTIFICATION):
+            await callback.bot.send_message(
+                partner['user_id'],
+                f"🔔 {callback.from_user.username} удалил(а) событие: '{event['title']}'"
+            )
     except Exception as e:
         logging.error(f"Не удалось уведомить партнера об удалении события: {e}")
 
 
-@router.callback_query(F.data.startswith("event_page_"))
-async def process_event_page(callback: types.CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    user_id = callback.from_user.id
-    partner = await db.get_partner(user_id)
-    couple_id = min(user_id, partner['user_id'])
-    now = datetime.now()
-    events = await db.get_events_for_period(couple_id, now, now + timedelta(days=365 * 5))
+@router.callback_query(F.data.startswith("event_page_"), flags={"couple_required": True})
+async def process_event_page(callback: types.CallbackQuery, couple_id: int):
+    cursor, backward = parse_page_callback(callback.data, int, int)
+    keyboard = await build_delete_events_kb(couple_id, cursor, backward)
 
-    await callback.message.edit_reply_markup(reply_markup=get_delete_event_kb(events, page))
+    if not keyboard:
+        await callback.message.edit_text("У вас нет предстоящих событий для удаления.")
+        return
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
@@ -9,7 +9,7 @@ router = Router()
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, partner: dict):
     """
     Обработчик команды /start.
     Регистрирует пользователя и показывает приветственное сообщение.
@@ -20,10 +20,8 @@ async def cmd_start(message: Message, state: FSMContext):
     username = message.from_user.username or message.from_user.first_name
 
     await db.add_user(user_id, username)
-    user_data = await db.get_user(user_id)
 
-    if user_data and user_data['partner_id']:
-        partner = await db.get_partner(user_id)
+    if partner:
         await message.answer(
             f"Привет, {username}! ❤️\n"
             f"Вы в паре с {partner['username']}.\n\n"
@@ -5,30 +5,48 @@ from aiogram.fsm.context import FSMContext
 from src.db import database as db
 from src.states.user_states import DateIdea
 from src.keyboards.inline import get_date_ideas_kb, get_delete_date_idea_kb
+from src.utils.paging import PAGE_SIZE, page_cursors, parse_page_callback
 
 router = Router()
+CHECKLIST_PAGE_SIZE = 10
 
 
-async def get_couple_id(user_id: int):
-    partner = await db.get_partner(user_id)
-    return min(user_id, partner['user_id']) if partner else None
+def idea_key(idea) -> tuple:
+    return int(idea['is_completed']), idea['id']
+
+
+async def load_ideas_page(couple_id: int, cursor: tuple = None, backward: bool = False, page_size: int = PAGE_SIZE,
+                          inclusive: bool = False):
+    """
+    Загружает страницу идей и курсоры соседних страниц.
+    inclusive - страница начинается с самой идеи-курсора (перерисовка после отметки).
+    Если страница опустела после удаления, возвращает первую.
+    """
+    ideas, has_more = await db.get_date_ideas_page(couple_id, cursor, backward, page_size, inclusive)
+    if not ideas and cursor is not None:
+        cursor, backward, inclusive = None, False, False
+        ideas, has_more = await db.get_date_ideas_page(couple_id, page_size=page_size)
+
+    prev_cursor, next_cursor = page_cursors(ideas, idea_key, cursor, backward, has_more)
+    if inclusive and prev_cursor:
+        # Есть ли что-то перед первой идеей страницы - достаточно одной строки
+        _, has_prev = await db.get_date_ideas_page(couple_id, idea_key(ideas[0]), backward=True, page_size=0)
+        if not has_prev:
+            prev_cursor = None
+    return ideas, prev_cursor, next_cursor
 
 
 # --- Добавление идеи ---
-@router.message(Command("add_date_idea"))
+@router.message(Command("add_date_idea"), flags={"couple_required": True})
 async def cmd_add_date_idea(message: types.Message, state: FSMContext):
     await state.clear()
-    if not await get_couple_id(message.from_user.id):
-        return await message.answer("Эта команда доступна только для пар.")
-
     await state.set_state(DateIdea.waiting_for_idea_text)
     await message.answer("Какую идею для свидания вы хотите добавить в ваш общий список?")
 
 
-@router.message(DateIdea.waiting_for_idea_text, F.text)
-async def process_new_date_idea(message: types.Message, state: FSMContext):
+@router.message(DateIdea.waiting_for_idea_text, F.text, flags={"couple_required": True})
+async def process_new_date_idea(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
     success = await db.add_date_idea(couple_id, message.text)
 
     if success:
@@ -38,76 +56,86 @@ async def process_new_date_idea(message: types.Message, state: FSMContext):
 
 
 # --- Просмотр и управление ---
-@router.message(Command("date_ideas"))
-async def cmd_date_ideas(message: types.Message, state: FSMContext):
+@router.message(Command("date_ideas"), flags={"couple_required": True})
+async def cmd_date_ideas(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
-    ideas = await db.get_date_ideas(couple_id)
+    ideas, prev_cursor, next_cursor = await load_ideas_page(couple_id, page_size=CHECKLIST_PAGE_SIZE)
     if not ideas:
         return await message.answer(
             "Ваш список идей для свиданий пока пуст. Добавьте что-нибудь командой /add_date_idea.")
 
     await message.answer(
         "<b>💖 Ваш список идей для свиданий:</b>\n\nНажимайте на идеи, чтобы отметить их как выполненные.",
-        reply_markup=get_date_ideas_kb(ideas)
+        reply_markup=get_date_ideas_kb(ideas, prev_cursor, next_cursor)
     )
 
 
-@router.callback_query(F.data.startswith("toggle_idea_"))
-async def process_toggle_idea(callback: types.CallbackQuery):
-    idea_id = int(callback.data.split("_")[-1])
-    couple_id = await get_couple_id(callback.from_user.id)
+@router.callback_query(F.data.startswith("toggle_idea_"), flags={"couple_required": True})
+async def process_toggle_idea(callback: types.CallbackQuery, couple_id: int):
+    # toggle_idea_<id>_<ключ первой идеи страницы>
+    parts = callback.data.split("_", 3)
+    idea_id = int(parts[2])
+    anchor = None
+    if len(parts) == 4 and parts[3]:
+        is_completed, first_id = parts[3].split("|")
+        anchor = (int(is_completed), int(first_id))
 
     await db.toggle_date_idea_status(idea_id, couple_id)
     await callback.answer("Статус изменен!")
 
-    # Обновляем клавиатуру
-    ideas = await db.get_date_ideas(couple_id)
-    await callback.message.edit_reply_markup(reply_markup=get_date_ideas_kb(ideas))
+    # Обновляем ту же страницу клавиатуры
+    ideas, prev_cursor, next_cursor = await load_ideas_page(
+        couple_id, anchor, page_size=CHECKLIST_PAGE_SIZE, inclusive=True
+    )
+    await callback.message.edit_reply_markup(reply_markup=get_date_ideas_kb(ideas, prev_cursor, next_cursor))
+
+
+@router.callback_query(F.data.startswith("checklist_page_"), flags={"couple_required": True})
+async def process_checklist_page(callback: types.CallbackQuery, couple_id: int):
+    cursor, backward = parse_page_callback(callback.data, int, int)
+    ideas, prev_cursor, next_cursor = await load_ideas_page(couple_id, cursor, backward, CHECKLIST_PAGE_SIZE)
+    if not ideas:
+        return await callback.message.edit_text("Ваш список идей для свиданий пока пуст.")
+    await callback.message.edit_reply_markup(reply_markup=get_date_ideas_kb(ideas, prev_cursor, next_cursor))
 
 
 # --- Удаление идеи ---
-@router.message(Command("del_date_idea"))
-async def cmd_del_date_idea(message: types.Message, state: FSMContext):
+@router.message(Command("del_date_idea"), flags={"couple_required": True})
+async def cmd_del_date_idea(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
-    ideas = await db.get_date_ideas(couple_id)
+    ideas, prev_cursor, next_cursor = await load_ideas_page(couple_id)
     if not ideas:
         return await message.answer("Ваш список идей пуст. Нечего удалять.")
 
     await message.answer(
         "Какую идею вы хотите удалить из списка?",
-        reply_markup=get_delete_date_idea_kb(ideas)
+        reply_markup=get_delete_date_idea_kb(ideas, prev_cursor, next_cursor)
     )
 
 
-@router.callback_query(F.data.startswith("del_idea_"))
-async def process_del_idea(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("del_idea_"), flags={"couple_required": True})
+async def process_del_idea(callback: types.CallbackQuery, couple_id: int):
     idea_id = int(callback.data.split("_")[-1])
-    couple_id = await get_couple_id(callback.from_user.id)
 
     await db.delete_date_idea(idea_id, couple_id)
     await callback.answer("Идея удалена.", show_alert=True)
 
-    ideas = await db.get_date_ideas(couple_id)
+    ideas, prev_cursor, next_cursor = await load_ideas_page(couple_id)
     if not ideas:
         await callback.message.edit_text("Ваш список идей теперь пуст.")
     else:
         await callback.message.edit_text(
             "Какую идею вы хотите удалить из списка?",
-            reply_markup=get_delete_date_idea_kb(ideas)
+            reply_markup=get_delete_date_idea_kb(ideas, prev_cursor, next_cursor)
         )
 
 
-@router.callback_query(F.data.startswith("idea_page_"))
-async def process_idea_page(callback: types.CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    couple_id = await get_couple_id(callback.from_user.id)
-    ideas = await db.get_date_ideas(couple_id)
-    await callback.message.edit_reply_markup(reply_markup=get_delete_date_idea_kb(ideas, page))
+@router.callback_query(F.data.startswith("idea_page_"), flags={"couple_required": True})
+async def process_idea_page(callback: types.CallbackQuery, couple_id: int):
+    cursor, backward = parse_page_callback(callback.data, int, int)
+    ideas, prev_cursor, next_cursor = await load_ideas_page(couple_id, cursor, backward)
+    if not ideas:
+        return await callback.message.edit_text("Ваш список идей теперь пуст.")
+    await callback.message.edit_reply_markup(reply_markup=get_delete_date_idea_kb(ideas, prev_cursor, next_cursor))
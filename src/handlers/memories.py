@@ -8,21 +8,14 @@ from aiogram.types import InputMediaPhoto, InputMediaVideo
 from src.db import database as db
 from src.states.user_states import Memory
 from src.keyboards.inline import get_memory_view_kb, get_today_date_kb
+from src.utils.paging import encode_cursor, parse_archive_callback
 
 router = Router()
 
 
-async def get_couple_id(user_id: int):
-    partner = await db.get_partner(user_id)
-    return min(user_id, partner['user_id']) if partner else None
-
-
-@router.message(Command("addmemory"))
+@router.message(Command("addmemory"), flags={"couple_required": True})
 async def cmd_addmemory(message: types.Message, state: FSMContext):
     await state.clear()
-    if not await get_couple_id(message.from_user.id):
-        return await message.answer("Эта команда доступна только для пар.")
-
     await state.set_state(Memory.waiting_for_media)
     await message.answer("Отправьте фото или видео, которое хотите сохранить в вашей 'Капсуле Памяти'.")
 
@@ -48,12 +41,11 @@ async def process_memory_description(message: types.Message, state: FSMContext):
     )
 
 
-async def finalize_memory_creation(user_id: int, bot: Bot, state: FSMContext, memory_date: datetime.date):
+async def finalize_memory_creation(user_id: int, couple_id: int, bot: Bot, state: FSMContext, memory_date: datetime.date):
     """Общая функция для завершения создания воспоминания."""
     data = await state.get_data()
     await state.clear()
 
-    couple_id = await get_couple_id(user_id)
     await db.add_memory(
         couple_id=couple_id,
         media_type=data['media_type'],
@@ -64,29 +56,27 @@ async def finalize_memory_creation(user_id: int, bot: Bot, state: FSMContext, me
     await bot.send_message(user_id, "✅ Воспоминание добавлено в вашу капсулу!")
 
 
-@router.message(Memory.waiting_for_date, F.text)
-async def process_memory_date_text(message: types.Message, state: FSMContext):
+@router.message(Memory.waiting_for_date, F.text, flags={"couple_required": True})
+async def process_memory_date_text(message: types.Message, state: FSMContext, couple_id: int):
     try:
         memory_date = datetime.strptime(message.text, "%d.%m.%Y").date()
     except ValueError:
         await message.answer(
             "Неверный формат. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ или нажмите кнопку 'Сегодня'.")
         return
-    await finalize_memory_creation(message.from_user.id, message.bot, state, memory_date)
+    await finalize_memory_creation(message.from_user.id, couple_id, message.bot, state, memory_date)
 
 
-@router.callback_query(Memory.waiting_for_date, F.data == "date_today")
-async def process_memory_date_button(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Memory.waiting_for_date, F.data == "date_today", flags={"couple_required": True})
+async def process_memory_date_button(callback: types.CallbackQuery, state: FSMContext, couple_id: int):
     await callback.message.delete()  # Удаляем сообщение с кнопкой
-    await finalize_memory_creation(callback.from_user.id, callback.bot, state, datetime.now().date())
+    await finalize_memory_creation(callback.from_user.id, couple_id, callback.bot, state,
+                                   await db.get_couple_today(couple_id))
 
 
-@router.message(Command("memory"))
-async def cmd_memory(message: types.Message, state: FSMContext):
+@router.message(Command("memory"), flags={"couple_required": True})
+async def cmd_memory(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
     memory = await db.get_random_memory(couple_id)
     if not memory:
@@ -101,55 +91,57 @@ async def cmd_memory(message: types.Message, state: FSMContext):
         await message.answer_video(video=memory['media_file_id'], caption=caption)
 
 
-@router.message(Command("allmemories"))
-async def cmd_allmemories(message: types.Message, state: FSMContext):
+def memory_cursor(memory: dict) -> tuple:
+    return memory['added_at'], memory['memory_id']
+
+
+@router.message(Command("allmemories"), flags={"couple_required": True})
+async def cmd_allmemories(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
-    memories = await db.get_all_memories(couple_id)
-    if not memories:
+    # Показываем самое новое воспоминание, остальные подгружаются по одному при листании
+    memory = await db.get_archive_entry("memories", couple_id)
+    if not memory:
         return await message.answer("Ваша 'Капсула Памяти' пока пуста.")
 
-    await state.update_data(memories_archive=memories)
-
-    # Показываем первое воспоминание
-    memory = memories[0]
+    total = await db.count_archive_entries("memories", couple_id)
     date_str = datetime.strptime(memory['added_at'], "%Y-%m-%d").strftime("%d.%m.%Y")
     caption = f"<b>Воспоминание от {date_str}:</b>\n\n{memory['description']}"
+    keyboard = get_memory_view_kb(0, total, encode_cursor(*memory_cursor(memory)))
 
     if memory['media_type'] == 'photo':
         await message.answer_photo(
             photo=memory['media_file_id'],
             caption=caption,
-            reply_markup=get_memory_view_kb(0, len(memories))
+            reply_markup=keyboard
         )
     elif memory['media_type'] == 'video':
         await message.answer_video(
             video=memory['media_file_id'],
             caption=caption,
-            reply_markup=get_memory_view_kb(0, len(memories))
+            reply_markup=keyboard
         )
 
+    await db.prefetch_archive_neighbors("memories", couple_id, memory_cursor(memory))
 
-@router.callback_query(F.data.startswith("memory_view_"))
-async def process_memory_page(callback: types.CallbackQuery, state: FSMContext):
-    page_index = int(callback.data.split("_")[-1])
-
-    data = await state.get_data()
-    memories = data.get('memories_archive')
 
-    # Если FSM сбросился, получаем данные заново
-    if not memories:
-        couple_id = await get_couple_id(callback.from_user.id)
-        memories = await db.get_all_memories(couple_id)
-        await state.update_data(memories_archive=memories)
+@router.callback_query(F.data.startswith("memory_view_"), flags={"couple_required": True})
+async def process_memory_page(callback: types.CallbackQuery, couple_id: int):
+    parsed = parse_archive_callback(callback.data, str, int)
+    if parsed is None:
+        # Кнопка старого формата - начинаем с самого нового воспоминания
+        page_index = 0
+        memory = await db.get_archive_entry("memories", couple_id)
+    else:
+        current_index, cursor, older = parsed
+        page_index = current_index + 1 if older else current_index - 1
+        memory = await db.get_archive_entry("memories", couple_id, cursor, older)
 
-    if page_index >= len(memories) or page_index < 0:
+    if not memory:
         return await callback.answer("Ошибка навигации.")
 
-    memory = memories[page_index]
+    total = await db.count_archive_entries("memories", couple_id)
+    page_index = max(0, min(page_index, total - 1))
     date_str = datetime.strptime(memory['added_at'], "%Y-%m-%d").strftime("%d.%m.%Y")
     caption = f"<b>Воспоминание от {date_str}:</b>\n\n{memory['description']}"
 
@@ -161,5 +153,7 @@ async def process_memory_page(callback: types.CallbackQuery, state: FSMContext):
 
     await callback.message.edit_media(
         media=media,
-        reply_markup=get_memory_view_kb(page_index, len(memories))
+        reply_markup=get_memory_view_kb(page_index, total, encode_cursor(*memory_cursor(memory)))
     )
+
+    await db.prefetch_archive_neighbors("memories", couple_id, memory_cursor(memory))
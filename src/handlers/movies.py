@@ -9,6 +9,8 @@ from src.config import TMDB_API_KEY
 from src.db import database as db
 from src.states.user_states import Movie
 from src.keyboards.inline import get_movie_genre_kb, get_movie_suggestion_kb, get_delete_movie_kb
+from src.utils.paging import PAGE_SIZE, page_cursors, parse_page_callback
+from src.utils.outbound import PRIORITY_NOTIFICATION, priority_scope
 
 router = Router()
 
@@ -19,11 +21,6 @@ TMDB_GENRE_MAP = {
 TMDB_IMG_BASE_URL = "https://image.tmdb.org/t/p/w500"
 
 
-async def get_couple_id(user_id: int):
-    partner = await db.get_partner(user_id)
-    return min(user_id, partner['user_id']) if partner else None
-
-
 async def get_random_movie_from_api(genre_id: int):
     """Получает случайный популярный фильм по жанру из TMDb API."""
     # Запрашиваем случайную страницу из первых 20 (чтобы не получать слишком нишевые фильмы)
@@ -41,12 +38,9 @@ async def get_random_movie_from_api(genre_id: int):
 
 # --- Кинорулетка ---
 
-@router.message(Command("movie"))
+@router.message(Command("movie"), flags={"couple_required": True})
 async def cmd_movie(message: types.Message, state: FSMContext):
     await state.clear()
-    if not await get_couple_id(message.from_user.id):
-        return await message.answer("Эта команда доступна только для пар.")
-
     await state.set_state(Movie.choosing_genre)
     await message.answer("Какой жанр предпочитаете сегодня вечером?", reply_markup=get_movie_genre_kb())
 
@@ -97,13 +91,12 @@ async def process_another_movie(callback: types.CallbackQuery, state: FSMContext
     await show_random_movie(callback, state)
 
 
-@router.callback_query(Movie.choosing_genre, F.data == "movie_add_watchlist")
-async def process_add_to_watchlist(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Movie.choosing_genre, F.data == "movie_add_watchlist", flags={"couple_required": True})
+async def process_add_to_watchlist(callback: types.CallbackQuery, state: FSMContext, couple_id: int):
     data = await state.get_data()
     movie = data.get('current_movie')
     if not movie: return
 
-    couple_id = await get_couple_id(callback.from_user.id)
     success = await db.add_movie_to_watchlist(couple_id, movie['title'])
 
     if success:
@@ -112,8 +105,8 @@ async def process_add_to_watchlist(callback: types.CallbackQuery, state: FSMCont
         await callback.answer(f"'{movie['title']}' уже есть в вашем списке.", show_alert=True)
 
 
-@router.callback_query(Movie.choosing_genre, F.data == "movie_lets_watch")
-async def process_lets_watch(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(Movie.choosing_genre, F.data == "movie_lets_watch", flags={"couple_required": True})
+async def process_lets_watch(callback: types.CallbackQuery, state: FSMContext, partner: dict):
     data = await state.get_data()
     movie = data.get('current_movie')
     if not movie: return
@@ -123,32 +116,28 @@ async def process_lets_watch(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.answer(
         f"Отличный выбор! Сегодня вы смотрите '<b>{movie['title']}</b>'.\n\nПриятного просмотра! 🍿")
 
-    partner = await db.get_partner(callback.from_user.id)
     try:
-        await callback.bot.send_message(
-            partner['user_id'],
-            f"🔔 {callback.from_user.username} выбрал(а) фильм на вечер: '<b>{movie['title']}</b>'.\n\nГотовьте попкорн! 😉"
-        )
+        with priority_scope(PRIORITY_NOTIFICATION):
+            await callback.bot.send_message(
+                partner['user_id'],
+                f"🔔 {callback.from_user.username} выбрал(а) фильм на вечер: '<b>{movie['title']}</b>'.\n\nГотовьте попкорн! 😉"
+            )
     except Exception as e:
         logging.error(f"Не удалось уведомить партнера о выборе фильма: {e}")
 
 
 # --- Список просмотра ---
 
-@router.message(Command("addmovie"))
+@router.message(Command("addmovie"), flags={"couple_required": True})
 async def cmd_addmovie(message: types.Message, state: FSMContext):
     await state.clear()
-    if not await get_couple_id(message.from_user.id):
-        return await message.answer("Эта команда доступна только для пар.")
-
     await state.set_state(Movie.waiting_for_movie_title)
     await message.answer("Введите название фильма, который хотите добавить в список просмотра.")
 
 
-@router.message(Movie.waiting_for_movie_title, F.text)
-async def process_add_movie_title(message: types.Message, state: FSMContext):
+@router.message(Movie.waiting_for_movie_title, F.text, flags={"couple_required": True})
+async def process_add_movie_title(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
     success = await db.add_movie_to_watchlist(couple_id, message.text)
 
     if success:
@@ -157,12 +146,9 @@ async def process_add_movie_title(message: types.Message, state: FSMContext):
         await message.answer(f"Фильм '{message.text}' уже есть в вашем списке.")
 
 
-@router.message(Command("watchlist"))
-async def cmd_watchlist(message: types.Message, state: FSMContext):
+@router.message(Command("watchlist"), flags={"couple_required": True})
+async def cmd_watchlist(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
     watchlist = await db.get_movie_watchlist(couple_id)
     if not watchlist:
@@ -176,44 +162,54 @@ async def cmd_watchlist(message: types.Message, state: FSMContext):
     await message.answer(text)
 
 
-@router.message(Command("delmovie"))
-async def cmd_delmovie(message: types.Message, state: FSMContext):
+async def build_delete_movies_kb(couple_id: int, cursor: tuple = None, backward: bool = False):
+    """Загружает одну страницу списка фильмов и строит для нее клавиатуру удаления."""
+    movies, has_more = await db.get_movie_watchlist_page(couple_id, cursor, backward, PAGE_SIZE)
+    if not movies and cursor is not None:
+        cursor, backward = None, False
+        movies, has_more = await db.get_movie_watchlist_page(couple_id, page_size=PAGE_SIZE)
+    if not movies:
+        return None
+
+    prev_cursor, next_cursor = page_cursors(movies, lambda m: (m['id'],), cursor, backward, has_more)
+    return get_delete_movie_kb(movies, prev_cursor, next_cursor)
+
+
+@router.message(Command("delmovie"), flags={"couple_required": True})
+async def cmd_delmovie(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
-    watchlist = await db.get_movie_watchlist(couple_id)
-    if not watchlist:
+    keyboard = await build_delete_movies_kb(couple_id)
+    if not keyboard:
         return await message.answer("Ваш список просмотра пуст. Нечего удалять.")
 
     await message.answer(
         "Какой фильм вы хотите удалить из списка?",
-        reply_markup=get_delete_movie_kb(watchlist)
+        reply_markup=keyboard
     )
 
 
-@router.callback_query(F.data.startswith("del_movie_"))
-async def process_del_movie(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("del_movie_"), flags={"couple_required": True})
+async def process_del_movie(callback: types.CallbackQuery, couple_id: int):
     movie_id = int(callback.data.split("_")[-1])
-    couple_id = await get_couple_id(callback.from_user.id)
 
     await db.delete_movie_from_watchlist(movie_id, couple_id)
     await callback.answer("Фильм удален из списка.", show_alert=True)
 
-    watchlist = await db.get_movie_watchlist(couple_id)
-    if not watchlist:
+    keyboard = await build_delete_movies_kb(couple_id)
+    if not keyboard:
         await callback.message.edit_text("Ваш список просмотра теперь пуст.")
     else:
         await callback.message.edit_text(
             "Какой фильм вы хотите удалить из списка?",
-            reply_markup=get_delete_movie_kb(watchlist)
+            reply_markup=keyboard
         )
 
 
-@router.callback_query(F.data.startswith("movie_page_"))
-async def process_movie_page(callback: types.CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    couple_id = await get_couple_id(callback.from_user.id)
-    watchlist = await db.get_movie_watchlist(couple_id)
-    await callback.message.edit_reply_markup(reply_markup=get_delete_movie_kb(watchlist, page))
+@router.callback_query(F.data.startswith("movie_page_"), flags={"couple_required": True})
+async def process_movie_page(callback: types.CallbackQuery, couple_id: int):
+    cursor, backward = parse_page_callback(callback.data, int)
+    keyboard = await build_delete_movies_kb(couple_id, cursor, backward)
+    if not keyboard:
+        return await callback.message.edit_text("Ваш список просмотра теперь пуст.")
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
@@ -4,18 +4,18 @@ from aiogram.filters import Command, StateFilter
 
 from src.db import database as db
 from src.keyboards.inline import get_confirm_unlink_kb
+from src.utils.outbound import PRIORITY_NOTIFICATION, priority_scope
 
 router = Router()
 
 
 @router.message(Command("code"))
-async def cmd_code(message: types.Message):
+async def cmd_code(message: types.Message, user_data: dict):
     """
     Обработчик команды /code.
     Выдает пользователю его уникальный код для приглашения.
     """
     user_id = message.from_user.id
-    user_data = await db.get_user(user_id)
 
     if user_data and user_data['partner_id']:
         await message.answer("Вы уже в паре, эта команда вам не нужна. ❤️")
@@ -34,7 +34,7 @@ async def cmd_code(message: types.Message):
 
 
 @router.message(F.text.isdigit(), StateFilter(None))
-async def handle_invite_code(message: types.Message):
+async def handle_invite_code(message: types.Message, user_data: dict):
     """
     Обрабатывает сообщение, если оно является кодом приглашения (просто число).
     """
@@ -48,8 +48,7 @@ async def handle_invite_code(message: types.Message):
             await message.answer("Нельзя создать пару с самим собой! 😉")
             return
 
-        current_user_data = await db.get_user(user_id)
-        if current_user_data and current_user_data['partner_id']:
+        if user_data and user_data['partner_id']:
             await message.answer(
                 "Вы уже в паре. Чтобы создать новую, сначала разорвите текущую связь командой /unlink.")
             return
@@ -66,10 +65,11 @@ async def handle_invite_code(message: types.Message):
 
         await message.answer(f"Поздравляем! Вы теперь в паре с пользователем {inviter_data['username']}! ❤️")
         try:
-            await message.bot.send_message(
-                chat_id=inviter_id,
-                text=f"Отличные новости! Пользователь {username} принял ваше приглашение. Вы теперь в паре! ❤️"
-            )
+            with priority_scope(PRIORITY_NOTIFICATION):
+                await message.bot.send_message(
+                    chat_id=inviter_id,
+                    text=f"Отличные новости! Пользователь {username} принял ваше приглашение. Вы теперь в паре! ❤️"
+                )
         except Exception as e:
             logging.error(f"Не удалось уведомить партнера {inviter_id}: {e}")
 
@@ -78,12 +78,10 @@ async def handle_invite_code(message: types.Message):
 
 
 @router.message(Command("unlink"))
-async def cmd_unlink(message: types.Message):
+async def cmd_unlink(message: types.Message, user_data: dict):
     """
     Шаг 1: Запрашивает подтверждение на разрыв связи.
     """
-    user_data = await db.get_user(message.from_user.id)
-
     if not user_data or not user_data['partner_id']:
         await message.answer("Вы и так не в паре.")
         return
@@ -95,12 +93,11 @@ async def cmd_unlink(message: types.Message):
 
 
 @router.callback_query(F.data == "confirm_unlink")
-async def process_confirm_unlink(callback: types.CallbackQuery):
+async def process_confirm_unlink(callback: types.CallbackQuery, user_data: dict):
     """
     Шаг 2 (Вариант А): Пользователь подтвердил разрыв.
     """
     user_id = callback.from_user.id
-    user_data = await db.get_user(user_id)
     if not user_data or not user_data['partner_id']:
         await callback.message.edit_text("Вы уже не в паре.")
         return
@@ -112,10 +109,11 @@ async def process_confirm_unlink(callback: types.CallbackQuery):
 
     try:
         if partner_id != user_id:
-            await callback.bot.send_message(
-                chat_id=partner_id,
-                text=f"Пользователь {callback.from_user.first_name} разорвал(а) с вами пару в боте."
-            )
+            with priority_scope(PRIORITY_NOTIFICATION):
+                await callback.bot.send_message(
+                    chat_id=partner_id,
+                    text=f"Пользователь {callback.from_user.first_name} разорвал(а) с вами пару в боте."
+                )
     except Exception as e:
         logging.error(f"Не удалось уведомить партнера {partner_id} о разрыве: {e}")
 
@@ -6,13 +6,10 @@ from datetime import datetime
 from src.db import database as db
 from src.states.user_states import QOTD
 from src.keyboards.inline import get_qotd_archive_kb
+from src.utils.paging import encode_cursor, parse_archive_callback
 
 router = Router()
 
-async def get_couple_id(user_id: int):
-    partner = await db.get_partner(user_id)
-    return min(user_id, partner['user_id']) if partner else None
-
 
 @router.message(Command("addquestion"))
 async def cmd_addquestion(message: types.Message, state: FSMContext):
@@ -31,11 +28,9 @@ async def process_new_question(message: types.Message, state: FSMContext):
     await state.clear()
 
 
-@router.callback_query(F.data == "answer_qotd")
-async def handle_answer_button(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(F.data == "answer_qotd", flags={"couple_required": True})
+async def handle_answer_button(callback: types.CallbackQuery, state: FSMContext, couple_id: int):
     user_id = callback.from_user.id
-    partner = await db.get_partner(user_id)
-    couple_id = min(user_id, partner['user_id'])
 
     today_question_data = await db.get_today_question_for_couple(couple_id)
     if not today_question_data:
@@ -54,13 +49,9 @@ async def handle_answer_button(callback: types.CallbackQuery, state: FSMContext)
     await callback.answer()
 
 
-@router.message(QOTD.waiting_for_answer, F.text)
-async def process_qotd_answer(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    partner = await db.get_partner(user_id)
-    couple_id = min(user_id, partner['user_id'])
-
-    success = await db.save_answer(couple_id, user_id, message.text)
+@router.message(QOTD.waiting_for_answer, F.text, flags={"couple_required": True})
+async def process_qotd_answer(message: types.Message, state: FSMContext, couple_id: int):
+    success = await db.save_answer(couple_id, message.from_user.id, message.text)
     if success:
         await message.answer("Ваш ответ принят! Ответы будут показаны вечером.")
     else:
@@ -68,63 +59,72 @@ async def process_qotd_answer(message: types.Message, state: FSMContext):
     await state.clear()
 
 
-async def format_archive_page(archive_entry: dict, user_id: int):
+def format_archive_page(archive_entry: dict, user_id: int):
     """Форматирует текст для одной страницы архива."""
     question_date = datetime.strptime(archive_entry['question_date'], "%Y-%m-%d").strftime("%d.%m.%Y")
 
-    user1 = await db.get_user(archive_entry['user1_id'])
-    user2 = await db.get_user(archive_entry['user2_id'])
-
     my_answer = "<i>(нет ответа)</i>"
     partner_answer = "<i>(нет ответа)</i>"
 
     if archive_entry['user1_id'] == user_id:
         my_answer = archive_entry['answer_user1'] or my_answer
         partner_answer = archive_entry['answer_user2'] or partner_answer
+        partner_name = archive_entry['user2_name']
     else:
         my_answer = archive_entry['answer_user2'] or my_answer
         partner_answer = archive_entry['answer_user1'] or partner_answer
+        partner_name = archive_entry['user1_name']
 
     text = (
         f"<b>Архив за {question_date}</b>\n\n"
         f"<i>Вопрос: {archive_entry['question_text']}</i>\n\n"
         f"<b>Ваш ответ:</b>\n{my_answer}\n\n"
-        f"<b>Ответ партнера:</b>\n{partner_answer}"
+        f"<b>Ответ {partner_name or 'партнера'}:</b>\n{partner_answer}"
     )
-    return
+    return text
 
 
-@router.message(Command("answers"))
-async def cmd_answers(message: types.Message, state: FSMContext):
+@router.message(Command("answers"), flags={"couple_required": True})
+async def cmd_answers(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        return await message.answer("Эта команда доступна только для пар.")
 
-    archive = await db.get_qotd_archive(couple_id)
-    if not archive:
+    # Показываем самую свежую запись, остальные подгружаются по одной при листании
+    entry = await db.get_archive_entry("qotd", couple_id)
+    if not entry:
         return await message.answer("Архив ваших ответов пока пуст.\nЕсли хотите новый добавь вопрос /addquestion.")
 
-    page_text = await format_archive_page(archive[0], message.from_user.id)
+    total = await db.count_archive_entries("qotd", couple_id)
+    page_text = format_archive_page(entry, message.from_user.id)
     await message.answer(
         page_text,
-        reply_markup=get_qotd_archive_kb(0, len(archive))
+        reply_markup=get_qotd_archive_kb(0, total, encode_cursor(entry['question_date']))
     )
 
+    await db.prefetch_archive_neighbors("qotd", couple_id, (entry['question_date'],))
 
-@router.callback_query(F.data.startswith("qotd_archive_"))
-async def process_archive_page(callback: types.CallbackQuery):
-    page_index = int(callback.data.split("_")[-1])
 
-    couple_id = await get_couple_id(callback.from_user.id)
-    archive = await db.get_qotd_archive(couple_id)
+@router.callback_query(F.data.startswith("qotd_archive_"), flags={"couple_required": True})
+async def process_archive_page(callback: types.CallbackQuery, couple_id: int):
+    parsed = parse_archive_callback(callback.data, str)
+    if parsed is None:
+        # Кнопка старого формата - начинаем с самой свежей записи
+        page_index = 0
+        entry = await db.get_archive_entry("qotd", couple_id)
+    else:
+        current_index, cursor, older = parsed
+        page_index = current_index + 1 if older else current_index - 1
+        entry = await db.get_archive_entry("qotd", couple_id, cursor, older)
 
-    if page_index >= len(archive) or page_index < 0:
+    if not entry:
         return await callback.answer("Ошибка навигации.", show_alert=True)
 
-    page_text = await format_archive_page(archive[page_index], callback.from_user.id)
+    total = await db.count_archive_entries("qotd", couple_id)
+    page_index = max(0, min(page_index, total - 1))
+    page_text = format_archive_page(entry, callback.from_user.id)
 
     await callback.message.edit_text(
         page_text,
-        reply_markup=get_qotd_archive_kb(page_index, len(archive))
-    )
\ No newline at end of file
+        reply_markup=get_qotd_archive_kb(page_index, total, encode_cursor(entry['question_date']))
+    )
+
+    await db.prefetch_archive_neighbors("qotd", couple_id, (entry['question_date'],))
\ No newline at end of file
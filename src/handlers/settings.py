@@ -6,19 +6,11 @@ from datetime import datetime
 from src.db import database as db
 from src.states.user_states import Settings
 from src.keyboards.inline import get_settings_kb
+from src.utils.timezones import get_timezone, parse_timezone
 
 router = Router()
 
 
-async def get_couple_id(user_id: int):
-    """Вспомогательная функция для получения ID пары."""
-    partner = await db.get_partner(user_id)
-    if not partner:
-        return None
-    # ID пары - это меньший из ID партнеров, чтобы был уникальным и постоянным
-    return min(user_id, partner['user_id'])
-
-
 async def show_settings_menu(message: types.Message, couple_id: int):
     """Отображает или обновляет меню настроек."""
     settings = await db.get_couple_settings(couple_id)
@@ -28,13 +20,9 @@ async def show_settings_menu(message: types.Message, couple_id: int):
     )
 
 
-@router.message(Command("settings"))
-async def cmd_settings(message: types.Message, state: FSMContext):
+@router.message(Command("settings"), flags={"couple_required": True})
+async def cmd_settings(message: types.Message, state: FSMContext, couple_id: int):
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
-    if not couple_id:
-        await message.answer("Эта команда доступна только для пар.")
-        return
     await show_settings_menu(message, couple_id)
 
 
@@ -47,10 +35,8 @@ async def process_reminders_enable(callback: types.CallbackQuery, state: FSMCont
         "Отлично! В какое время вам удобно получать напоминания о планах на день? (укажите в формате ЧЧ:ММ, например, 09:00)")
 
 
-@router.callback_query(F.data == "settings_disable")
-async def process_reminders_disable(callback: types.CallbackQuery):
-    couple_id = await get_couple_id(callback.from_user.id)
-    settings = await db.get_couple_settings(couple_id)
+@router.callback_query(F.data == "settings_disable", flags={"couple_required": True})
+async def process_reminders_disable(callback: types.CallbackQuery, couple_id: int):
     await db.update_reminders_settings(couple_id, reminders_enabled=False)
     await callback.answer("Напоминания о событиях выключены 🔕")
     new_settings = await db.get_couple_settings(couple_id)
@@ -63,8 +49,8 @@ async def process_reminders_change_time(callback: types.CallbackQuery, state: FS
     await callback.message.edit_text("Введите новое время для напоминаний о событиях (в формате ЧЧ:ММ).")
 
 
-@router.message(Settings.waiting_for_reminder_time, F.text)
-async def process_reminder_time(message: types.Message, state: FSMContext):
+@router.message(Settings.waiting_for_reminder_time, F.text, flags={"couple_required": True})
+async def process_reminder_time(message: types.Message, state: FSMContext, couple_id: int):
     try:
         datetime.strptime(message.text, "%H:%M")
     except ValueError:
@@ -72,7 +58,6 @@ async def process_reminder_time(message: types.Message, state: FSMContext):
         return
 
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
     await db.update_reminders_settings(couple_id, reminders_enabled=True, reminder_time=message.text)
     await message.answer(f"Отлично! Напоминания о событиях будут приходить ежедневно в {message.text}.")
     await show_settings_menu(message, couple_id)
@@ -80,18 +65,16 @@ async def process_reminder_time(message: types.Message, state: FSMContext):
 
 # --- Настройки "Вопроса дня" ---
 
-@router.callback_query(F.data == "settings_qotd_enable")
-async def process_qotd_enable(callback: types.CallbackQuery, state: FSMContext):
-    couple_id = await get_couple_id(callback.from_user.id)
+@router.callback_query(F.data == "settings_qotd_enable", flags={"couple_required": True})
+async def process_qotd_enable(callback: types.CallbackQuery, couple_id: int):
     await db.update_reminders_settings(couple_id, qotd_enabled=True)
     await callback.answer("Вопрос дня включен 🔔")
     new_settings = await db.get_couple_settings(couple_id)
     await callback.message.edit_reply_markup(reply_markup=get_settings_kb(new_settings))
 
 
-@router.callback_query(F.data == "settings_qotd_disable")
-async def process_qotd_disable(callback: types.CallbackQuery):
-    couple_id = await get_couple_id(callback.from_user.id)
+@router.callback_query(F.data == "settings_qotd_disable", flags={"couple_required": True})
+async def process_qotd_disable(callback: types.CallbackQuery, couple_id: int):
     await db.update_reminders_settings(couple_id, qotd_enabled=False)
     await callback.answer("Вопрос дня выключен 🔕")
     new_settings = await db.get_couple_settings(couple_id)
@@ -116,8 +99,8 @@ async def process_qotd_send_time(message: types.Message, state: FSMContext):
     await message.answer("Отлично. Теперь введите время для получения итогов с ответами (например, 20:00).")
 
 
-@router.message(Settings.waiting_for_qotd_summary_time, F.text)
-async def process_qotd_summary_time(message: types.Message, state: FSMContext):
+@router.message(Settings.waiting_for_qotd_summary_time, F.text, flags={"couple_required": True})
+async def process_qotd_summary_time(message: types.Message, state: FSMContext, couple_id: int):
     try:
         datetime.strptime(message.text, "%H:%M")
     except ValueError:
@@ -126,7 +109,6 @@ async def process_qotd_summary_time(message: types.Message, state: FSMContext):
 
     data = await state.get_data()
     await state.clear()
-    couple_id = await get_couple_id(message.from_user.id)
     await db.update_reminders_settings(
         couple_id,
         qotd_enabled=True,
@@ -135,3 +117,29 @@ async def process_qotd_summary_time(message: types.Message, state: FSMContext):
     )
     await message.answer("Время для 'Вопроса дня' успешно обновлено!")
     await show_settings_menu(message, couple_id)
+
+
+# --- Часовой пояс пары ---
+
+@router.callback_query(F.data == "settings_timezone")
+async def process_timezone_change(callback: types.CallbackQuery, state: FSMContext):
+    await state.set_state(Settings.waiting_for_timezone)
+    await callback.message.edit_text(
+        "Введите ваш часовой пояс в формате IANA, например <code>Europe/Moscow</code>, "
+        "<code>Asia/Almaty</code> или <code>America/New_York</code>.\n"
+        "Время напоминаний, вопроса дня, событий и отложенных комплиментов будет считаться по нему."
+    )
+
+
+@router.message(Settings.waiting_for_timezone, F.text, flags={"couple_required": True})
+async def process_timezone(message: types.Message, state: FSMContext, couple_id: int):
+    timezone_name = parse_timezone(message.text)
+    if not timezone_name:
+        await message.answer("Не знаю такого часового пояса. Пожалуйста, введите его в формате Europe/Moscow.")
+        return
+
+    await state.clear()
+    await db.update_reminders_settings(couple_id, timezone=timezone_name)
+    local_time = datetime.now(get_timezone(timezone_name)).strftime("%H:%M")
+    await message.answer(f"Часовой пояс пары: {timezone_name} (сейчас там {local_time}).")
+    await show_settings_menu(message, couple_id)
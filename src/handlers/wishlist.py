@@ -7,7 +7,8 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from src.db import database as db
 from src.states.user_states import Wishlist
-from src.keyboards.inline import get_wishlist_choice_kb, get_skip_photo_kb, get_skip_link_kb
+from src.keyboards.inline import get_wishlist_choice_kb, get_skip_photo_kb, get_skip_link_kb, add_page_nav
+from src.utils.paging import page_cursors, parse_page_callback
 
 router = Router()
 WISHES_PER_PAGE = 5
@@ -15,14 +16,9 @@ WISHES_PER_PAGE = 5
 
 # --- Добавление желания ---
 
-@router.message(Command("addwish"))
+@router.message(Command("addwish"), flags={"couple_required": True})
 async def cmd_addwish(message: types.Message, state: FSMContext):
     await state.clear()
-    user_data = await db.get_user(message.from_user.id)
-    if not user_data or not user_data['partner_id']:
-        await message.answer("Эта команда доступна только для пар.")
-        return
-
     await state.set_state(Wishlist.waiting_for_title)
     await message.answer("Что вы хотите добавить в свой вишлист? (например, 'Билет на концерт')")
 
@@ -77,13 +73,9 @@ async def process_skip_photo(callback: types.CallbackQuery, state: FSMContext):
 
 # --- Просмотр вишлистов ---
 
-@router.message(Command("wishlist"))
+@router.message(Command("wishlist"), flags={"couple_required": True})
 async def cmd_wishlist(message: types.Message, state: FSMContext):
     await state.clear()
-    user_data = await db.get_user(message.from_user.id)
-    if not user_data or not user_data['partner_id']:
-        await message.answer("Эта команда доступна только для пар.")
-        return
     await message.answer("Чей вишлист вы хотите посмотреть?", reply_markup=get_wishlist_choice_kb())
 
 
@@ -115,16 +107,15 @@ async def format_wishlist_text_and_kb(wishes: list, owner_name: str, is_partner:
     return text, builder.as_markup() if is_partner else None
 
 
-async def show_partner_wishlist(callback: types.CallbackQuery):
+async def show_partner_wishlist(callback: types.CallbackQuery, partner: dict):
     user_id = callback.from_user.id
-    partner = await db.get_partner(user_id)
     wishes = await db.get_wishes(partner['user_id'])
     text, keyboard = await format_wishlist_text_and_kb(wishes, partner['username'], is_partner=True, viewer_id=user_id)
     await callback.message.edit_text(text, reply_markup=keyboard, disable_web_page_preview=True)
 
 
-@router.callback_query(F.data.startswith("wishlist_"))
-async def process_wishlist_choice(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("wishlist_"), flags={"couple_required": True})
+async def process_wishlist_choice(callback: types.CallbackQuery, partner: dict):
     choice = callback.data.split("_")[1]
     user_id = callback.from_user.id
 
@@ -134,60 +125,62 @@ async def process_wishlist_choice(callback: types.CallbackQuery):
         await callback.message.edit_text(text, disable_web_page_preview=True)
 
     elif choice == "partner":
-        await show_partner_wishlist(callback)
+        await show_partner_wishlist(callback, partner)
 
 
-@router.callback_query(F.data.startswith("book_wish_"))
-async def process_book_wish(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("book_wish_"), flags={"couple_required": True})
+async def process_book_wish(callback: types.CallbackQuery, partner: dict):
     wish_id = int(callback.data.split("_")[-1])
     await db.book_wish(wish_id, callback.from_user.id)
     await callback.answer("Вы тайно забронировали это желание! 🤫")
-    await show_partner_wishlist(callback)
+    await show_partner_wishlist(callback, partner)
 
 
-@router.callback_query(F.data.startswith("unbook_wish_"))
-async def process_unbook_wish(callback: types.CallbackQuery):
+@router.callback_query(F.data.startswith("unbook_wish_"), flags={"couple_required": True})
+async def process_unbook_wish(callback: types.CallbackQuery, partner: dict):
     wish_id = int(callback.data.split("_")[-1])
     await db.unbook_wish(wish_id)
     await callback.answer("Бронь снята.")
-    await show_partner_wishlist(callback)
+    await show_partner_wishlist(callback, partner)
 
 
 # --- Удаление желания ---
 
-def get_delete_wish_kb(wishes: list, page: int = 0) -> InlineKeyboardMarkup:
+def get_delete_wish_kb(wishes: list, prev_cursor: str = None, next_cursor: str = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    start = page * WISHES_PER_PAGE
-    end = start + WISHES_PER_PAGE
 
-    for wish in wishes[start:end]:
+    for wish in wishes:
         builder.row(InlineKeyboardButton(text=f"❌ {wish['title'][:30]}", callback_data=f"del_wish_{wish['wish_id']}"))
 
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"wish_page_{page - 1}"))
-    if end < len(wishes):
-        nav_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"wish_page_{page + 1}"))
+    add_page_nav(builder, "wish_page", prev_cursor, next_cursor)
+    return builder.as_markup()
+
 
-    if nav_buttons:
-        builder.row(*nav_buttons)
+async def build_delete_wishes_kb(user_id: int, cursor: tuple = None, backward: bool = False):
+    """Загружает одну страницу вишлиста и строит для нее клавиатуру удаления."""
+    wishes, has_more = await db.get_wishes_page(user_id, cursor, backward, WISHES_PER_PAGE)
+    if not wishes and cursor is not None:
+        cursor, backward = None, False
+        wishes, has_more = await db.get_wishes_page(user_id, page_size=WISHES_PER_PAGE)
+    if not wishes:
+        return None
 
-    return builder.as_markup()
+    prev_cursor, next_cursor = page_cursors(wishes, lambda w: (w['wish_id'],), cursor, backward, has_more)
+    return get_delete_wish_kb(wishes, prev_cursor, next_cursor)
 
 
 @router.message(Command("delwish"))
 async def cmd_delwish(message: types.Message, state: FSMContext):
     await state.clear()
-    user_id = message.from_user.id
-    wishes = await db.get_wishes(user_id)
+    keyboard = await build_delete_wishes_kb(message.from_user.id)
 
-    if not wishes:
+    if not keyboard:
         await message.answer("Ваш вишлист пока пуст. Нечего удалять.")
         return
 
     await message.answer(
         "Какое желание вы хотите удалить?",
-        reply_markup=get_delete_wish_kb(wishes)
+        reply_markup=keyboard
     )
 
 
@@ -201,6 +194,8 @@ async def process_del_wish(callback: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("wish_page_"))
 async def process_wish_page(callback: types.CallbackQuery):
-    page = int(callback.data.split("_")[-1])
-    wishes = await db.get_wishes(callback.from_user.id)
-    await callback.message.edit_reply_markup(reply_markup=get_delete_wish_kb(wishes, page))
+    cursor, backward = parse_page_callback(callback.data, int)
+    keyboard = await build_delete_wishes_kb(callback.from_user.id, cursor, backward)
+    if not keyboard:
+        return await callback.message.edit_text("Ваш вишлист пока пуст. Нечего удалять.")
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
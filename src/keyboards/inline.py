@@ -1,7 +1,9 @@
-from datetime import datetime
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from src.utils.paging import encode_cursor
+from src.utils.timezones import DEFAULT_TZ, from_epoch
+
 def get_send_time_kb() -> InlineKeyboardMarkup:
     """
     Создает клавиатуру с выбором времени отправки комплимента.
@@ -57,30 +59,31 @@ def get_skip_details_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_delete_event_kb(events: list, page: int = 0) -> InlineKeyboardMarkup:
-    """Создает клавиатуру для удаления событий с пагинацией."""
+def add_page_nav(builder: InlineKeyboardBuilder, prefix: str, prev_cursor: str = None, next_cursor: str = None):
+    """Добавляет ряд кнопок "назад"/"вперед" с курсорами страниц (см. src/utils/paging.py)."""
+    nav_buttons = []
+    if prev_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"{prefix}_p_{prev_cursor}"))
+    if next_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"{prefix}_n_{next_cursor}"))
+
+    if nav_buttons:
+        builder.row(*nav_buttons)
+
+
+def get_delete_event_kb(events: list, prev_cursor: str = None, next_cursor: str = None,
+                        tz=DEFAULT_TZ) -> InlineKeyboardMarkup:
+    """Создает клавиатуру для удаления событий одной страницы, время показывается в поясе tz."""
     builder = InlineKeyboardBuilder()
-    EVENTS_PER_PAGE = 5
-    start = page * EVENTS_PER_PAGE
-    end = start + EVENTS_PER_PAGE
 
-    for event in events[start:end]:
-        event_datetime = datetime.fromisoformat(event['event_date'])
-        event_str = event_datetime.strftime('%d.%m %H:%M')
+    for event in events:
+        event_str = from_epoch(event['event_at'], tz).strftime('%d.%m %H:%M')
         builder.row(InlineKeyboardButton(
             text=f"❌ {event_str} - {event['title'][:20]}",
             callback_data=f"del_event_{event['event_id']}"
         ))
 
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"event_page_{page - 1}"))
-    if end < len(events):
-        nav_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"event_page_{page + 1}"))
-
-    if nav_buttons:
-        builder.row(*nav_buttons)
-
+    add_page_nav(builder, "event_page", prev_cursor, next_cursor)
     return builder.as_markup()
 
 def get_settings_kb(settings: dict) -> InlineKeyboardMarkup:
@@ -109,6 +112,8 @@ def get_settings_kb(settings: dict) -> InlineKeyboardMarkup:
     else:
         builder.row(InlineKeyboardButton(text="🔔 Включить", callback_data="settings_qotd_enable"))
 
+    builder.row(InlineKeyboardButton(text=f"🌍 Часовой пояс: {settings['timezone']}", callback_data="settings_timezone"))
+
     return builder.as_markup()
 
 def get_answer_qotd_kb() -> InlineKeyboardMarkup:
@@ -118,19 +123,23 @@ def get_answer_qotd_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_qotd_archive_kb(current_index: int, total_answers: int) -> InlineKeyboardMarkup:
-    """Создает клавиатуру для навигации по архиву ответов."""
+def get_qotd_archive_kb(current_index: int, total_answers: int, cursor: str) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру для навигации по архиву ответов.
+    Кнопки несут позицию и ключ текущей записи, соседняя запись ищется от него.
+    """
     builder = InlineKeyboardBuilder()
 
     nav_buttons = []
     if current_index > 0:
-        nav_buttons.append(
-            InlineKeyboardButton(text="⬅️ Предыдущий", callback_data=f"qotd_archive_{current_index - 1}"))
+        nav_buttons.append(InlineKeyboardButton(
+            text="⬅️ Предыдущий", callback_data=f"qotd_archive_p_{current_index}_{cursor}"))
 
     nav_buttons.append(InlineKeyboardButton(text=f"{current_index + 1}/{total_answers}", callback_data="noop"))
 
     if current_index < total_answers - 1:
-        nav_buttons.append(InlineKeyboardButton(text="Следующий ➡️", callback_data=f"qotd_archive_{current_index + 1}"))
+        nav_buttons.append(InlineKeyboardButton(
+            text="Следующий ➡️", callback_data=f"qotd_archive_n_{current_index}_{cursor}"))
 
     builder.row(*nav_buttons)
     return builder.as_markup()
@@ -160,18 +169,21 @@ def get_skip_link_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_memory_view_kb(current_index: int, total_memories: int) -> InlineKeyboardMarkup:
-    """Создает клавиатуру для навигации по воспоминаниям."""
+def get_memory_view_kb(current_index: int, total_memories: int, cursor: str) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру для навигации по воспоминаниям.
+    Кнопки несут позицию и ключ текущего воспоминания, соседнее ищется от него.
+    """
     builder = InlineKeyboardBuilder()
 
     nav_buttons = []
     if current_index > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"memory_view_{current_index - 1}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"memory_view_p_{current_index}_{cursor}"))
 
     nav_buttons.append(InlineKeyboardButton(text=f"{current_index + 1}/{total_memories}", callback_data="noop"))
 
     if current_index < total_memories - 1:
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"memory_view_{current_index + 1}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"memory_view_n_{current_index}_{cursor}"))
 
     builder.row(*nav_buttons)
     return builder.as_markup()
@@ -202,65 +214,49 @@ def get_movie_suggestion_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_delete_movie_kb(movies: list, page: int = 0) -> InlineKeyboardMarkup:
-    """Создает клавиатуру для удаления фильмов с пагинацией."""
+def get_delete_movie_kb(movies: list, prev_cursor: str = None, next_cursor: str = None) -> InlineKeyboardMarkup:
+    """Создает клавиатуру для удаления фильмов одной страницы."""
     builder = InlineKeyboardBuilder()
-    MOVIES_PER_PAGE = 5
-    start = page * MOVIES_PER_PAGE
-    end = start + MOVIES_PER_PAGE
 
-    for movie in movies[start:end]:
+    for movie in movies:
         builder.row(InlineKeyboardButton(
             text=f"❌ {movie['title'][:30]}",
             callback_data=f"del_movie_{movie['id']}"
         ))
 
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"movie_page_{page - 1}"))
-    if end < len(movies):
-        nav_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"movie_page_{page + 1}"))
-
-    if nav_buttons:
-        builder.row(*nav_buttons)
-
+    add_page_nav(builder, "movie_page", prev_cursor, next_cursor)
     return builder.as_markup()
 
 
-def get_date_ideas_kb(ideas: list) -> InlineKeyboardMarkup:
-    """Создает клавиатуру-чеклист для идей свиданий."""
+def get_date_ideas_kb(ideas: list, prev_cursor: str = None, next_cursor: str = None) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру-чеклист для одной страницы идей свиданий.
+    Кнопки отметки несут ключ первой идеи страницы, чтобы после переключения показать ту же страницу.
+    """
     builder = InlineKeyboardBuilder()
+    anchor = encode_cursor(int(ideas[0]['is_completed']), ideas[0]['id']) if ideas else ""
     for idea in ideas:
         status_icon = "✅" if idea['is_completed'] else "⬜️"
         builder.row(InlineKeyboardButton(
             text=f"{status_icon} {idea['idea_text']}",
-            callback_data=f"toggle_idea_{idea['id']}"
+            callback_data=f"toggle_idea_{idea['id']}_{anchor}"
         ))
+
+    add_page_nav(builder, "checklist_page", prev_cursor, next_cursor)
     return builder.as_markup()
 
 
-def get_delete_date_idea_kb(ideas: list, page: int = 0) -> InlineKeyboardMarkup:
-    """Создает клавиатуру для удаления идей с пагинацией."""
+def get_delete_date_idea_kb(ideas: list, prev_cursor: str = None, next_cursor: str = None) -> InlineKeyboardMarkup:
+    """Создает клавиатуру для удаления идей одной страницы."""
     builder = InlineKeyboardBuilder()
-    IDEAS_PER_PAGE = 5
-    start = page * IDEAS_PER_PAGE
-    end = start + IDEAS_PER_PAGE
 
-    for idea in ideas[start:end]:
+    for idea in ideas:
         builder.row(InlineKeyboardButton(
             text=f"❌ {idea['idea_text'][:30]}",
             callback_data=f"del_idea_{idea['id']}"
         ))
 
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"idea_page_{page - 1}"))
-    if end < len(ideas):
-        nav_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"idea_page_{page + 1}"))
-
-    if nav_buttons:
-        builder.row(*nav_buttons)
-
+    add_page_nav(builder, "idea_page", prev_cursor, next_cursor)
     return builder.as_markup()
 
 def get_confirm_unlink_kb() -> InlineKeyboardMarkup:
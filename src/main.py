@@ -5,13 +5,26 @@ from datetime import datetime
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 
-from src.config import BOT_TOKEN, BASE_DIR
+from src.config import (
+    BOT_TOKEN, BOT_MODE, BASE_DIR, OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+    OUTBOUND_QUEUE_SIZE, OUTBOUND_MAX_RETRIES, FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_FLUSH_INTERVAL,
+    FSM_DEFAULT_TTL, FSM_DATA_TTL, FSM_SWEEP_INTERVAL, UPDATES_CONCURRENCY, UPDATES_FLUSH_INTERVAL,
+    UPDATES_BACKLOG_LAG, UPDATES_DEDUP_WINDOW
+)
 from src.db import database as db
+from src.db.fsm_storage import SQLiteStorage
 from src.handlers import common, pairing, actions, calendar, settings, wishlist, qotd, memories, movies, dates
-from src.utils.scheduler import setup_scheduler
+from src.middlewares.couple import setup_couple_middlewares
+from src.middlewares.updates import UpdateTrackerMiddleware
+from src.states.user_states import STATE_TTLS
+from src.utils.scheduler import setup_scheduler, stop_deliveries
+from src.utils.compliment_timer import compliment_timer
+from src.utils.outbound import OutboundDispatcher
+from src.utils.startup import StartupTimings, call_if_changed
+from src.utils.stats import register_stats_provider
+from src.utils.webhook import run_webhook
 
 
 def setup_logging():
@@ -45,7 +58,7 @@ def setup_logging():
 
 
 async def set_main_menu(bot: Bot):
-    """Создает и устанавливает основное меню команд для бота."""
+    """Создает и устанавливает основное меню команд для бота, если оно изменилось."""
     main_menu_commands = [
         BotCommand(command="/start", description="Перезапустить бота"),
         BotCommand(command="/help", description="Помощь и список команд"),
@@ -76,23 +89,65 @@ async def set_main_menu(bot: Bot):
         BotCommand(command="/date_ideas", description="💖 Посмотреть идеи для свиданий"),
         BotCommand(command="/del_date_idea", description="💖 Удалить идею")
     ]
-    await bot.set_my_commands(main_menu_commands)
+    await call_if_changed(
+        bot, "set_my_commands",
+        [command.model_dump() for command in main_menu_commands],
+        lambda: bot.set_my_commands(main_menu_commands)
+    )
 
 
 async def main():
     """Основная функция, которая запускает бота."""
     setup_logging()
     logging.info("Запускаю бота...")
+    timings = StartupTimings()
+    register_stats_provider("startup", timings.stats)
 
-    await db.db_start()
-    await db.add_questions_to_db()
+    # Все остальные этапы зависят от базы, поэтому она поднимается первой
+    await timings.phase("db", db.db_start())
 
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-    dp = Dispatcher(storage=MemoryStorage())
+
+    # Все отправки из хендлеров и планировщика проходят через общую очередь с лимитами Telegram
+    outbound = OutboundDispatcher(
+        global_rate=OUTBOUND_GLOBAL_RATE,
+        chat_rate=OUTBOUND_CHAT_RATE,
+        chat_burst=OUTBOUND_CHAT_BURST,
+        queue_size=OUTBOUND_QUEUE_SIZE,
+        max_retries=OUTBOUND_MAX_RETRIES
+    )
+    bot.session.middleware(outbound)
+    await outbound.start()
+    register_stats_provider("outbound", outbound.stats)
+
+    # Состояния диалогов хранятся в базе и переживают перезапуск
+    # Брошенные диалоги удаляются по истечении срока из STATE_TTLS
+    storage = SQLiteStorage(
+        cache_size=FSM_CACHE_SIZE,
+        cache_ttl=FSM_CACHE_TTL,
+        flush_interval=FSM_FLUSH_INTERVAL,
+        state_ttls=STATE_TTLS,
+        default_ttl=FSM_DEFAULT_TTL,
+        data_ttl=FSM_DATA_TTL,
+        sweep_interval=FSM_SWEEP_INTERVAL
+    )
+    register_stats_provider("fsm_storage", storage.stats)
+
+    dp = Dispatcher(storage=storage)
 
     scheduler = setup_scheduler(bot)
     scheduler.start()
     logging.info("Планировщик запущен.")
+    register_stats_provider("compliment_timer", compliment_timer.stats)
+
+    update_tracker = UpdateTrackerMiddleware(
+        flush_interval=UPDATES_FLUSH_INTERVAL,
+        backlog_lag=UPDATES_BACKLOG_LAG,
+        dedup_window=UPDATES_DEDUP_WINDOW
+    )
+    dp.update.outer_middleware(update_tracker)
+    register_stats_provider("updates", update_tracker.stats)
+    setup_couple_middlewares(dp)
 
     # Регистрация роутеров
     dp.include_router(common.router)
@@ -106,14 +161,39 @@ async def main():
     dp.include_router(movies.router)
     dp.include_router(dates.router)
 
-    await set_main_menu(bot)
-    await bot.delete_webhook(drop_pending_updates=True)
+    # Независимые этапы запуска выполняются одновременно
+    startup_steps = dict(
+        questions=db.add_questions_to_db(),
+        fsm_storage=storage.start(),
+        compliment_timer=compliment_timer.start(bot),
+        commands=set_main_menu(bot),
+        update_offset=update_tracker.start(bot),
+    )
+    if BOT_MODE != "webhook":
+        # Снимаем вебхук, если бот до этого работал в режиме webhook. Апдейты, пришедшие
+        # во время перезапуска, не сбрасываются, а разбираются после старта
+        startup_steps["delete_webhook"] = bot.delete_webhook(drop_pending_updates=False)
+    await timings.parallel(**startup_steps)
 
     try:
-        await dp.start_polling(bot)
+        timings.mark_ready()
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types(),
+                tasks_concurrency_limit=UPDATES_CONCURRENCY
+            )
     finally:
+        await compliment_timer.stop()
         scheduler.shutdown()
+        await stop_deliveries()
+        await outbound.stop()
         await bot.session.close()
+        await storage.close()
+        await update_tracker.close()
+        await db.db_close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from src.db import database as db
+
+COUPLE_ONLY_TEXT = "Эта команда доступна только для пар."
+
+
+class CoupleContextMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: один раз на апдейт находит пользователя, его партнера и ID пары
+    и передает их в хендлеры как user_data, partner и couple_id.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        user_data, partner = (None, None)
+        if from_user:
+            user_data, partner = await db.get_user_context(from_user.id)
+
+        data["user_data"] = user_data
+        data["partner"] = partner
+        # ID пары - это меньший из ID партнеров, чтобы был уникальным и постоянным
+        data["couple_id"] = min(from_user.id, partner['user_id']) if partner else None
+        return await handler(event, data)
+
+
+class CoupleRequiredMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: не пускает в хендлеры с флагом couple_required
+    пользователей, которые не состоят в паре. Если пара распалась посреди диалога,
+    состояние диалога сбрасывается, чтобы следующие сообщения не попадали в его шаги.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, "couple_required") or data.get("couple_id"):
+            return await handler(event, data)
+
+        state = data.get("state")
+        if state is not None and await state.get_state() is not None:
+            await state.clear()
+        if isinstance(event, CallbackQuery):
+            await event.answer(COUPLE_ONLY_TEXT, show_alert=True)
+        elif isinstance(event, Message):
+            await event.answer(COUPLE_ONLY_TEXT)
+        return None
+
+
+def setup_couple_middlewares(dp):
+    """Регистрирует middleware контекста пары для сообщений и колбэков."""
+    for observer in (dp.message, dp.callback_query):
+        observer.outer_middleware(CoupleContextMiddleware())
+        observer.middleware(CoupleRequiredMiddleware())
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update
+
+from src.db import database as db
+
+
+class UpdateTrackerMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: запоминает, до какого update_id все апдейты обработаны,
+    и периодически сохраняет это значение в bot_state.
+
+    После перезапуска Telegram заново присылает апдейты, получение которых бот не успел
+    подтвердить. Те из них, что уже были обработаны, пропускаются, а остальные
+    разбираются как обычно. Повторы ищутся только среди последних dedup_window номеров:
+    если после недели без апдейтов Telegram начал нумерацию заново с меньшего числа,
+    сохраненная позиция сбрасывается, а не отбрасывает весь новый поток. Апдейты разных чатов обрабатываются параллельно, а апдейты
+    одного чата - строго по очереди, чтобы при разборе накопившейся очереди шаги
+    диалогов FSM не перепутались.
+
+    Отставание считается как разница между текущим временем и датой сообщения.
+    Пока оно больше backlog_lag секунд, бот считается разбирающим накопившуюся очередь.
+    """
+
+    def __init__(self, flush_interval: float = 2, backlog_lag: float = 5, dedup_window: int = 1000):
+        self.flush_interval = flush_interval
+        self.backlog_lag = backlog_lag
+        self.dedup_window = dedup_window
+
+        self._state_key = None
+        self._committed = 0
+        self._saved = 0
+        self._max_done = 0
+        self._inflight = set()
+        self._chat_locks = {}
+        self._task = None
+
+        self._backlog_started = None
+        self._backlog_updates = 0
+        self._stats = {"processed": 0, "duplicates": 0, "resets": 0, "lag_last": 0.0, "lag_max": 0.0}
+
+    async def start(self, bot: Bot):
+        """Загружает сохраненную позицию и запускает ее периодическое сохранение."""
+        self._state_key = f"update_offset:{bot.id}"
+        saved = await db.get_bot_state(self._state_key)
+        self._committed = self._saved = self._max_done = int(saved) if saved else 0
+        if self._committed:
+            logging.info(f"Продолжаю обработку апдейтов после update_id {self._committed}.")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Сохраняет позицию, до которой все апдейты обработаны, если она сдвинулась."""
+        committed = self._committed
+        if self._state_key is None or committed == self._saved:
+            return
+        await db.set_bot_state(self._state_key, str(committed))
+        self._saved = committed
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Не удалось сохранить позицию апдейтов: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_id = event.update_id
+        if update_id <= self._committed - self.dedup_window:
+            self._reset(update_id)
+        elif update_id <= self._committed or update_id in self._inflight:
+            self._stats["duplicates"] += 1
+            return None
+
+        self._track_lag(event)
+        self._inflight.add(update_id)
+        chat = data.get("event_chat") or data.get("event_from_user")
+        chat_key = chat.id if chat else None
+        try:
+            if chat_key is None:
+                return await handler(event, data)
+            lock = self._chat_locks.get(chat_key)
+            if lock is None:
+                lock = self._chat_locks[chat_key] = [asyncio.Lock(), 0]
+            lock[1] += 1
+            try:
+                async with lock[0]:
+                    return await handler(event, data)
+            finally:
+                lock[1] -= 1
+                if not lock[1]:
+                    del self._chat_locks[chat_key]
+        finally:
+            self._inflight.discard(update_id)
+            self._stats["processed"] += 1
+            self._max_done = max(self._max_done, update_id)
+            # Все апдейты до самого раннего незавершенного считаются обработанными
+            self._committed = min(min(self._inflight) - 1, self._max_done) if self._inflight else self._max_done
+
+    def _reset(self, update_id: int):
+        """Начинает отсчет заново: номер намного меньше сохраненного не может быть повтором."""
+        logging.warning(
+            f"update_id {update_id} намного меньше сохраненной позиции {self._committed}: "
+            f"Telegram начал нумерацию заново, позиция сброшена."
+        )
+        self._stats["resets"] += 1
+        self._committed = self._max_done = update_id - 1
+
+    def _track_lag(self, event: Update):
+        sent_at = getattr(event.event, "date", None)
+        if sent_at is None:
+            return
+        lag = max(0.0, time.time() - sent_at.timestamp())
+        self._stats["lag_last"] = round(lag, 1)
+        self._stats["lag_max"] = max(self._stats["lag_max"], round(lag, 1))
+
+        if lag > self.backlog_lag:
+            if self._backlog_started is None:
+                self._backlog_started = time.monotonic()
+                self._backlog_updates = 0
+                logging.info(f"Разбираю накопившиеся апдейты, отставание {lag:.0f} с.")
+            self._backlog_updates += 1
+        elif self._backlog_started is not None:
+            elapsed = time.monotonic() - self._backlog_started
+            logging.info(f"Накопившиеся апдейты разобраны: {self._backlog_updates} шт. за {elapsed:.1f} с.")
+            self._backlog_started = None
+
+    def stats(self) -> dict:
+        return {
+            "offset": self._committed,
+            "in_flight": len(self._inflight),
+            "backlog": self._backlog_started is not None,
+            **self._stats,
+        }
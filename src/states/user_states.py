@@ -20,6 +20,7 @@ class Settings(StatesGroup):
     waiting_for_reminder_time = State()
     waiting_for_qotd_send_time = State()
     waiting_for_qotd_summary_time = State()
+    waiting_for_timezone = State()
 
 class Wishlist(StatesGroup):
     waiting_for_title = State()
@@ -43,4 +44,18 @@ class Movie(StatesGroup):
     waiting_for_movie_title = State()
 
 class DateIdea(StatesGroup):
-    waiting_for_idea_text = State()
\ No newline at end of file
+    waiting_for_idea_text = State()
+
+
+# Сколько секунд хранить незавершенный диалог каждой группы состояний.
+# После этого состояние и накопленные данные (тексты, file_id вложений) удаляются.
+STATE_TTLS = {
+    Actions: 2 * 60 * 60,
+    Calendar: 2 * 60 * 60,
+    Settings: 30 * 60,
+    Wishlist: 2 * 60 * 60,
+    QOTD: 24 * 60 * 60,
+    Memory: 2 * 60 * 60,
+    Movie: 6 * 60 * 60,
+    DateIdea: 60 * 60,
+}
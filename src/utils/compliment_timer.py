@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+from aiogram import Bot
+
+from src.db import database as db
+from src.utils.scheduler import check_and_send_compliments
+from src.utils.timezones import from_epoch
+
+# Через сколько секунд повторить отправку, если Telegram вернул ошибку
+RETRY_DELAY = 60
+
+
+class ComplimentTimer:
+    """
+    Таймер отложенных комплиментов.
+
+    Держит в памяти кучу (время отправки, id) и просыпается ровно к ближайшему комплименту.
+    Источником истины остается таблица scheduled_compliments: при пробуждении отправляется
+    все, что по базе уже пора отправить, а после перезапуска куча заново строится из базы.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._bot = None
+
+    async def start(self, bot: Bot):
+        """Загружает ожидающие комплименты из базы и запускает фоновую задачу."""
+        self._bot = bot
+        for row in await db.get_pending_compliments_schedule():
+            self.schedule(row['id'], from_epoch(row['send_at']))
+        logging.info(f"Таймер комплиментов запущен, в очереди: {len(self._heap)}.")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, compliment_id: int, send_at: datetime):
+        """Добавляет комплимент в очередь. Если он раньше всех остальных, будит таймер."""
+        send_ts = send_at.timestamp()
+        heapq.heappush(self._heap, (send_ts, compliment_id))
+        if self._heap[0] == (send_ts, compliment_id):
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+
+            try:
+                failed_ids = await check_and_send_compliments(self._bot)
+            except Exception as e:
+                logging.error(f"Таймер комплиментов: ошибка при отправке: {e}")
+                failed_ids = []
+                # База недоступна - попробуем еще раз позже
+                heapq.heappush(self._heap, (now + RETRY_DELAY, 0))
+            for compliment_id in failed_ids:
+                heapq.heappush(self._heap, (now + RETRY_DELAY, compliment_id))
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._heap),
+            "next_in_seconds": round(self._heap[0][0] - time.time(), 1) if self._heap else None,
+        }
+
+
+compliment_timer = ComplimentTimer()
@@ -0,0 +1,32 @@
+import asyncio
+import logging
+import time
+
+
+async def fan_out(jobs: list, concurrency: int, job_timeout: float) -> dict:
+    """
+    Выполняет задачи параллельно, но не больше concurrency одновременно.
+
+    jobs - список пар (название, функция без аргументов, возвращающая корутину).
+    Каждая задача ограничена job_timeout секундами; ошибки и таймауты логируются
+    и не мешают остальным задачам. Возвращает сводку по выполнению.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    result = {"total": len(jobs), "ok": 0, "failed": 0, "timed_out": 0}
+    started = time.monotonic()
+
+    async def run(name, job):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(job(), timeout=job_timeout)
+                result["ok"] += 1
+            except asyncio.TimeoutError:
+                result["timed_out"] += 1
+                logging.error(f"Scheduler: задача {name} не уложилась в {job_timeout} с.")
+            except Exception as e:
+                result["failed"] += 1
+                logging.error(f"Scheduler: задача {name} завершилась с ошибкой: {e}")
+
+    await asyncio.gather(*(run(name, job) for name, job in jobs))
+    result["elapsed"] = round(time.monotonic() - started, 3)
+    return result
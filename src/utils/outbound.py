@@ -0,0 +1,339 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+
+# Классы приоритета исходящих запросов: чем меньше число, тем раньше отправка.
+PRIORITY_INTERACTIVE = 0   # ответы пользователю в хендлерах
+PRIORITY_NOTIFICATION = 1  # уведомления партнеру о действиях пользователя
+PRIORITY_BULK = 2          # массовые рассылки планировщика
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NOTIFICATION: "notification",
+    PRIORITY_BULK: "bulk",
+}
+
+_current_priority = ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority: int):
+    """
+    Задает класс приоритета для всех запросов к Bot API внутри блока,
+    включая задачи, созданные внутри него.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд будет доступен хотя бы один токен."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class _OutboundJob:
+    __slots__ = ("make_request", "bot", "method", "chat_id", "priority", "future", "enqueued_at", "attempts")
+
+    def __init__(self, make_request, bot, method, chat_id, priority):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Центральная очередь исходящих запросов к Bot API.
+
+    Подключается как middleware сессии бота, поэтому через нее проходят все отправки
+    из хендлеров и планировщика. Запросы, адресованные чату (у метода есть chat_id),
+    ставятся в ограниченную очередь и отправляются с учетом общего лимита и лимита
+    на чат. Сообщения в один чат уходят строго по порядку, по одному за раз.
+    При ответе 429 (RetryAfter) отправка приостанавливается на указанное Telegram время
+    и запрос повторяется. Остальные методы (getUpdates, answerCallbackQuery и т.д.)
+    идут напрямую.
+
+    Каждый запрос относится к классу приоритета (см. priority_scope). Готовые к отправке
+    чаты стоят в отдельной очереди на каждый класс, и следующий запрос всегда берется
+    из самого приоритетного непустого класса: ответы пользователям не ждут массовую
+    рассылку, а она досылается в оставшуюся часть общего лимита. Класс чата равен
+    самому высокому приоритету среди его запросов, так что срочный запрос не застревает
+    за рассылкой в тот же чат.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 queue_size: int = 10000, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.queue_size = queue_size
+
+        self._slots = None
+        self._wakeup = None
+        self._task = None
+        self._paused_until = 0.0
+        self._last_prune = time.monotonic()
+
+        self._chat_queues = {}
+        self._chat_buckets = {}
+        # Чаты, готовые к отправке, по классам приоритета. Устаревшие записи
+        # (чат переведен в другой класс или уже взят) отбрасываются при выборке.
+        self._ready = {priority: deque() for priority in PRIORITY_NAMES}
+        self._ready_class = {}
+        self._sleeping = []
+        self._inflight_chats = set()
+        self._inflight_tasks = set()
+
+        self._stats = {"failed": 0, "retries": 0, "cancelled": 0}
+        self._class_stats = {
+            priority: {"sent": 0, "wait_total": 0.0, "wait_max": 0.0} for priority in PRIORITY_NAMES
+        }
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.queue_size)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight_tasks):
+            task.cancel()
+        for chat_queue in self._chat_queues.values():
+            for job in chat_queue:
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Очередь исходящих сообщений остановлена"))
+        self._chat_queues.clear()
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or self._task is None:
+            return await make_request(bot, method)
+
+        async with self._slots:
+            job = _OutboundJob(make_request, bot, method, chat_id, _current_priority.get())
+            self._enqueue(job)
+            try:
+                return await job.future
+            except asyncio.CancelledError:
+                # Отправитель больше не ждет ответа (таймаут или остановка) - запрос не отправляем
+                chat_queue = self._chat_queues.get(chat_id)
+                if chat_queue and job in chat_queue:
+                    chat_queue.remove(job)
+                raise
+
+    def _enqueue(self, job: _OutboundJob):
+        chat_queue = self._chat_queues.get(job.chat_id)
+        if chat_queue is None:
+            chat_queue = self._chat_queues[job.chat_id] = deque()
+        was_empty = not chat_queue
+        chat_queue.append(job)
+        if was_empty and job.chat_id not in self._inflight_chats:
+            self._mark_ready(job.chat_id)
+        elif job.priority < self._ready_class.get(job.chat_id, job.priority):
+            # Чат уже ждет в менее приоритетном классе - поднимаем его
+            self._mark_ready(job.chat_id)
+
+    def _mark_ready(self, chat_id):
+        priority = min(job.priority for job in self._chat_queues[chat_id])
+        self._ready_class[chat_id] = priority
+        self._ready[priority].append(chat_id)
+        self._wakeup.set()
+
+    def _pop_ready(self):
+        for priority, ready in self._ready.items():
+            while ready:
+                chat_id = ready.popleft()
+                if self._ready_class.get(chat_id) == priority:
+                    del self._ready_class[chat_id]
+                    return chat_id
+        return None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_buckets(self):
+        """Удаляет лимиты чатов, которые успели полностью восстановиться: они равны новым."""
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in self._chat_queues and chat_id not in self._inflight_chats and bucket.delay() == 0 \
+                    and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    def _wake_sleeping(self):
+        now = time.monotonic()
+        while self._sleeping and self._sleeping[0][0] <= now:
+            _, chat_id = heapq.heappop(self._sleeping)
+            if self._chat_queues.get(chat_id):
+                self._mark_ready(chat_id)
+
+    async def _wait(self, timeout):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._wake_sleeping()
+            self._prune_buckets()
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            if not self._ready_class:
+                timeout = self._sleeping[0][0] - time.monotonic() if self._sleeping else None
+                await self._wait(timeout)
+                continue
+
+            global_delay = self.global_bucket.delay()
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            chat_id = self._pop_ready()
+            chat_queue = self._chat_queues.get(chat_id) if chat_id is not None else None
+            if not chat_queue:
+                self._chat_queues.pop(chat_id, None)
+                continue
+
+            bucket = self._chat_bucket(chat_id)
+            chat_delay = bucket.delay()
+            if chat_delay > 0:
+                heapq.heappush(self._sleeping, (time.monotonic() + chat_delay, chat_id))
+                continue
+
+            job = chat_queue.popleft()
+            if job.future.cancelled():
+                self._stats["cancelled"] += 1
+                if chat_queue:
+                    self._mark_ready(chat_id)
+                else:
+                    self._chat_queues.pop(chat_id, None)
+                continue
+            bucket.consume()
+            self.global_bucket.consume()
+            self._inflight_chats.add(chat_id)
+            task = asyncio.create_task(self._execute(job))
+            self._inflight_tasks.add(task)
+            task.add_done_callback(self._inflight_tasks.discard)
+
+    async def _execute(self, job: _OutboundJob):
+        retry = False
+        try:
+            job.attempts += 1
+            result = await job.make_request(job.bot, job.method)
+            waited = time.monotonic() - job.enqueued_at
+            class_stats = self._class_stats[job.priority]
+            class_stats["sent"] += 1
+            class_stats["wait_total"] += waited
+            class_stats["wait_max"] = max(class_stats["wait_max"], waited)
+            if not job.future.done():
+                job.future.set_result(result)
+        except TelegramRetryAfter as e:
+            if job.attempts <= self.max_retries:
+                retry = True
+                self._stats["retries"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logging.warning(f"Outbound: Telegram просит подождать {e.retry_after} с, повтор для чата {job.chat_id}.")
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            self._inflight_chats.discard(job.chat_id)
+            chat_queue = self._chat_queues.get(job.chat_id)
+            if retry and job.future.cancelled():
+                self._stats["cancelled"] += 1
+            elif retry:
+                if chat_queue is None:
+                    chat_queue = self._chat_queues[job.chat_id] = deque()
+                chat_queue.appendleft(job)
+            if chat_queue:
+                self._mark_ready(job.chat_id)
+            else:
+                self._chat_queues.pop(job.chat_id, None)
+
+    def _fail(self, job: _OutboundJob, error: Exception):
+        self._stats["failed"] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def stats(self) -> dict:
+        depth = {priority: 0 for priority in PRIORITY_NAMES}
+        for chat_queue in self._chat_queues.values():
+            for job in chat_queue:
+                depth[job.priority] += 1
+
+        classes = {}
+        for priority, name in PRIORITY_NAMES.items():
+            class_stats = self._class_stats[priority]
+            sent = class_stats["sent"]
+            classes[name] = {
+                "queued": depth[priority],
+                "sent": sent,
+                "wait_avg_ms": round(class_stats["wait_total"] / sent * 1000, 1) if sent else 0.0,
+                "wait_max_ms": round(class_stats["wait_max"] * 1000, 1),
+            }
+
+        return {
+            "queued": sum(depth.values()),
+            "chats_waiting": len(self._chat_queues),
+            "in_flight": len(self._inflight_tasks),
+            "sent": sum(c["sent"] for c in self._class_stats.values()),
+            "failed": self._stats["failed"],
+            "retries": self._stats["retries"],
+            "cancelled": self._stats["cancelled"],
+            "classes": classes,
+        }
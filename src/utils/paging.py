@@ -0,0 +1,61 @@
+# Вспомогательные функции для постраничных клавиатур с курсором (keyset-пагинация).
+# Кнопки навигации несут в callback_data направление и ключ граничной строки:
+# "<префикс>_n_<курсор>" - следующая страница, "<префикс>_p_<курсор>" - предыдущая.
+
+PAGE_SIZE = 5
+
+
+def encode_cursor(*values) -> str:
+    """Склеивает значения ключа сортировки в строку для callback_data."""
+    return "|".join(str(value) for value in values)
+
+
+def parse_page_callback(data: str, *types) -> tuple:
+    """
+    Разбирает callback_data кнопки навигации.
+    Возвращает (курсор, backward), где курсор - кортеж значений, приведенных к types.
+    Для кнопок старого формата (с номером страницы) возвращает первую страницу.
+    """
+    _, direction, raw_cursor = data.rsplit("_", 2)
+    values = raw_cursor.split("|")
+    if direction not in ("n", "p") or len(values) != len(types):
+        return None, False
+    try:
+        cursor = tuple(cast(value) for cast, value in zip(types, values))
+    except ValueError:
+        return None, False
+    return cursor, direction == "p"
+
+
+def page_cursors(rows: list, key, cursor, backward: bool, has_more: bool) -> tuple:
+    """
+    Возвращает курсоры для кнопок "назад" и "вперед" (None, если кнопка не нужна).
+    key - функция, возвращающая ключ сортировки строки.
+    """
+    if not rows:
+        return None, None
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+    prev_cursor = encode_cursor(*key(rows[0])) if has_prev else None
+    next_cursor = encode_cursor(*key(rows[-1])) if has_next else None
+    return prev_cursor, next_cursor
+
+
+def parse_archive_callback(data: str, *types) -> tuple:
+    """
+    Разбирает callback_data кнопки листания архива "<префикс>_<n|p>_<позиция>_<курсор>".
+    Возвращает (позиция, курсор, older) или None для кнопок старого формата.
+    """
+    parts = data.rsplit("_", 3)
+    if len(parts) != 4 or parts[1] not in ("n", "p"):
+        return None
+    _, direction, index, raw_cursor = parts
+    values = raw_cursor.split("|")
+    if len(values) != len(types):
+        return None
+    try:
+        return int(index), tuple(cast(value) for cast, value in zip(types, values)), direction == "n"
+    except ValueError:
+        return None
@@ -1,153 +1,250 @@
+import asyncio
 import logging
+from collections import defaultdict
 from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, time, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
 
+from src.config import STATS_LOG_INTERVAL, SCHEDULER_CONCURRENCY, SCHEDULER_JOB_TIMEOUT
 from src.db import database as db
+from src.db.triggers import JOB_EVENT_REMINDER, JOB_QOTD_SEND, JOB_QOTD_REMINDER, JOB_QOTD_SUMMARY
 from src.keyboards.inline import get_answer_qotd_kb
+from src.utils.fanout import fan_out
+from src.utils.outbound import PRIORITY_BULK, PRIORITY_NOTIFICATION, priority_scope
+from src.utils.stats import log_runtime_stats
+from src.utils.timezones import fixed_offset, from_epoch
+
+
+# Рассылки, запущенные тиками планировщика и еще не завершенные
+_deliveries = set()
 
 
 # --- Основные задачи планировщика ---
 
 async def check_and_send_compliments(bot: Bot):
-    """Проверяет и отправляет запланированные комплименты."""
+    """
+    Проверяет и отправляет запланированные комплименты.
+    Возвращает id комплиментов, которые не удалось отправить и можно отправить повторно.
+
+    Повтор безопасен, только если Telegram ответил ошибкой на первое же сообщение:
+    тогда партнер точно ничего не получил. После таймаута, сетевой ошибки или частичной
+    отправки неизвестно, что дошло, поэтому такой комплимент удаляется из очереди,
+    чтобы партнер не получил его дважды.
+    """
+    failed_ids = []
+    finished_ids = []
     compliments = await db.get_due_compliments()
-    if not compliments: return
+    if not compliments: return failed_ids
 
     logging.info(f"Scheduler: Найдено {len(compliments)} комплиментов для отправки.")
-    for compliment in compliments:
+
+    async def deliver(compliment):
+        retry = False
+        text_sent = False
         try:
-            from_user = await db.get_user(compliment['sender_id'])
-            from_user_name = from_user['username'] if from_user else "Ваш партнер"
-
-            full_message = f"💌 Вам пришел отложенный комплимент от {from_user_name}:\n\n✨ «{compliment['text']}» ✨"
-
-            if compliment['attachment_file_id']:
-                attachment_type = compliment['attachment_type']
-                file_id = compliment['attachment_file_id']
-                caption = compliment['caption']
-
-                await bot.send_message(chat_id=compliment['receiver_id'], text=full_message)
-
-                if attachment_type == 'photo':
-                    await bot.send_photo(chat_id=compliment['receiver_id'], photo=file_id, caption=caption)
-                elif attachment_type == 'video':
-                    await bot.send_video(chat_id=compliment['receiver_id'], video=file_id, caption=caption)
-                elif attachment_type == 'voice':
-                    await bot.send_voice(chat_id=compliment['receiver_id'], voice=file_id, caption=caption)
-                elif attachment_type == 'video_note':
-                    await bot.send_video_note(chat_id=compliment['receiver_id'], video_note=file_id)
-            else:
-                await bot.send_message(chat_id=compliment['receiver_id'], text=full_message)
-
-            await db.delete_compliment(compliment['id'])
+            await bot.send_message(chat_id=compliment['receiver_id'], text=compliment_message(compliment))
+            text_sent = True
+            await send_compliment_attachment(bot, compliment)
             logging.info(f"Scheduler: Комплимент {compliment['id']} успешно отправлен.")
+        except TelegramNetworkError as e:
+            logging.error(f"Scheduler: Сетевая ошибка при отправке комплимента {compliment['id']}, "
+                          f"повтор не выполняется: {e}")
+        except TelegramAPIError as e:
+            retry = not text_sent
+            logging.error(f"Scheduler: Не удалось отправить комплимент {compliment['id']}: {e}")
         except Exception as e:
             logging.error(f"Scheduler: Не удалось отправить комплимент {compliment['id']}: {e}")
+        finally:
+            # Сюда же попадают доставки, прерванные по таймауту: они не повторяются
+            (failed_ids if retry else finished_ids).append(compliment['id'])
+
+    # Комплимент ко времени - личное уведомление, он не ждет массовую рассылку
+    with priority_scope(PRIORITY_NOTIFICATION):
+        await fan_out(
+            [(f"compliment:{c['id']}", lambda c=c: deliver(c)) for c in compliments],
+            SCHEDULER_CONCURRENCY, SCHEDULER_JOB_TIMEOUT
+        )
+    await db.delete_compliments(finished_ids)
+    return failed_ids
+
+
+def compliment_message(compliment: dict) -> str:
+    """Текст отложенного комплимента с именем отправителя."""
+    from_user_name = compliment['sender_name'] or "Ваш партнер"
+    return f"💌 Вам пришел отложенный комплимент от {from_user_name}:\n\n✨ «{compliment['text']}» ✨"
+
+
+async def send_compliment_attachment(bot: Bot, compliment: dict):
+    """Отправляет вложение отложенного комплимента, если оно есть."""
+    file_id = compliment['attachment_file_id']
+    if not file_id:
+        return
+    attachment_type = compliment['attachment_type']
+    caption = compliment['caption']
+    if attachment_type == 'photo':
+        await bot.send_photo(chat_id=compliment['receiver_id'], photo=file_id, caption=caption)
+    elif attachment_type == 'video':
+        await bot.send_video(chat_id=compliment['receiver_id'], video=file_id, caption=caption)
+    elif attachment_type == 'voice':
+        await bot.send_voice(chat_id=compliment['receiver_id'], voice=file_id, caption=caption)
+    elif attachment_type == 'video_note':
+        await bot.send_video_note(chat_id=compliment['receiver_id'], video_note=file_id)
 
 
 async def master_scheduler_task(bot: Bot):
-    """Главная задача, которая запускается каждую минуту и управляет всеми событиями."""
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    now = datetime.now(moscow_tz)
-    current_time_str = now.strftime("%H:%M")
+    """
+    Главная задача, которая запускается каждую минуту и управляет всеми событиями.
+    Читает из индекса срабатываний только пары, у которых что-то назначено на текущую минуту по UTC.
+    Местное время пары получается из сохраненного в срабатывании смещения, без обращения к базе поясов.
+    Сама рассылка идет в фоне: тик возвращается сразу после загрузки данных, поэтому долгая
+    рассылка большой волны не заставляет планировщик пропускать следующие минуты.
+    """
+    now = datetime.now(timezone.utc)
+
+    await db.refresh_stale_triggers()
+    due_triggers = await db.get_due_triggers(now.hour * 60 + now.minute)
+    if not due_triggers: return
+
+    due = defaultdict(list)
+    for trigger in due_triggers:
+        due[trigger['job_kind']].append(trigger)
+
+    # Данные для рассылок загружаются сразу для всех пар этой минуты, до отправки
+    jobs = []
+    # --- 1. Напоминания о событиях ---
+    # У пар с одинаковым смещением общие местные сутки, поэтому один запрос на смещение
+    by_offset = defaultdict(list)
+    for trigger in due[JOB_EVENT_REMINDER]:
+        by_offset[trigger['utc_offset']].append(trigger)
+    for utc_offset, triggers in by_offset.items():
+        local_tz = fixed_offset(utc_offset)
+        today_start = now.astimezone(local_tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        today_end = today_start + timedelta(days=1, seconds=-1)
+        events_by_couple = await db.get_events_for_couples(
+            [t['couple_id'] for t in triggers], today_start, today_end
+        )
+        for trigger in triggers:
+            events = events_by_couple.get(trigger['couple_id'])
+            if events:
+                text = format_event_reminder(events, local_tz)
+                jobs.append((f"{JOB_EVENT_REMINDER}:{trigger['couple_id']}",
+                             lambda t=trigger, text=text: send_event_reminders_for_couple(bot, t, text)))
+
+    # --- 2. Вопрос дня: отправка, напоминание и итоги ---
+    if due[JOB_QOTD_SEND]:
+        questions = await db.assign_daily_questions(
+            [{**dict(t), 'question_date': local_date(now, t)} for t in due[JOB_QOTD_SEND]]
+        )
+        for trigger in due[JOB_QOTD_SEND]:
+            question = questions.get(trigger['couple_id'])
+            if question:
+                jobs.append((f"{JOB_QOTD_SEND}:{trigger['couple_id']}",
+                             lambda t=trigger, q=question: send_qotd_to_couple(bot, t, q)))
+
+    if due[JOB_QOTD_REMINDER] or due[JOB_QOTD_SUMMARY]:
+        answers_by_couple = await db.get_questions_for_couple_dates(
+            {t['couple_id']: local_date(now, t) for t in due[JOB_QOTD_REMINDER] + due[JOB_QOTD_SUMMARY]}
+        )
+        for job_kind, send in ((JOB_QOTD_REMINDER, send_qotd_reminder_to_couple),
+                               (JOB_QOTD_SUMMARY, send_qotd_summary_to_couple)):
+            for trigger in due[job_kind]:
+                answers = answers_by_couple.get(trigger['couple_id'])
+                if answers:
+                    jobs.append((f"{job_kind}:{trigger['couple_id']}",
+                                 lambda t=trigger, a=answers, send=send: send(bot, t, a)))
+
+    if not jobs: return
+    task = asyncio.create_task(deliver_tick(now, jobs))
+    _deliveries.add(task)
+    task.add_done_callback(_deliveries.discard)
+
+
+async def deliver_tick(now: datetime, jobs: list):
+    """Выполняет рассылку одного тика и пишет по ней сводку в лог."""
+    # Рассылка идет низшим приоритетом, чтобы не задерживать ответы пользователям
+    with priority_scope(PRIORITY_BULK):
+        result = await fan_out(jobs, SCHEDULER_CONCURRENCY, SCHEDULER_JOB_TIMEOUT)
+    logging.info(
+        f"Scheduler: тик {now.strftime('%H:%M')} UTC - доставок {result['total']} за {result['elapsed']} с "
+        f"(успешно {result['ok']}, ошибок {result['failed']}, таймаутов {result['timed_out']})"
+    )
 
-    all_couples = await db.get_all_couples_with_settings()
 
-    for couple in all_couples:
-        # --- 1. Напоминания о событиях ---
-        if couple['reminders_enabled'] and couple['reminder_time'] == current_time_str:
-            await send_event_reminders_for_couple(bot, couple, now)
+async def stop_deliveries():
+    """Прерывает незавершенные рассылки тиков при остановке бота."""
+    for task in list(_deliveries):
+        task.cancel()
+    await asyncio.gather(*_deliveries, return_exceptions=True)
 
-        # --- 2. Вопрос дня ---
-        if couple['qotd_enabled']:
-            # 2a. Отправка вопроса
-            if couple['qotd_send_time'] == current_time_str:
-                await send_qotd_to_couple(bot, couple)
 
-            # 2b. Напоминание и итоги
-            summary_time = datetime.strptime(couple['qotd_summary_time'], "%H:%M").time()
-            reminder_time = (datetime.combine(now.date(), summary_time) - timedelta(hours=1)).time()
+# --- Вспомогательные функции для master_scheduler_task ---
 
-            if reminder_time.strftime("%H:%M") == current_time_str:
-                await send_qotd_reminder_to_couple(bot, couple)
+def local_date(now: datetime, trigger) -> datetime.date:
+    """Местная дата пары по смещению из срабатывания."""
+    return (now + timedelta(minutes=trigger['utc_offset'])).date()
 
-            if couple['qotd_summary_time'] == current_time_str:
-                await send_qotd_summary_to_couple(bot, couple)
 
+def format_event_reminder(events: list, local_tz) -> str:
+    """Собирает текст утреннего напоминания о событиях на сегодня во времени пары."""
+    lines = ["<b>Доброе утро! Напоминаю о ваших планах на сегодня:</b>\n"]
+    for event in events:
+        time_str = from_epoch(event['event_at'], local_tz).strftime("%H:%M")
+        lines.append(f"• <b>{time_str}</b> - {event['title']} 🗓️")
+    lines.append("\nХорошего дня! ❤️")
+    return "\n".join(lines)
 
-# --- Вспомогательные функции для master_scheduler_task ---
 
-async def send_event_reminders_for_couple(bot: Bot, couple: dict, now: datetime):
+async def send_event_reminders_for_couple(bot: Bot, couple: dict, response_text: str):
     """Отправляет напоминание о событиях на сегодня для одной пары."""
     couple_id = couple['couple_id']
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-    events = await db.get_events_for_period(couple_id, today_start, today_end)
-    if not events: return
-
-    response_text = "<b>Доброе утро! Напоминаю о ваших планах на сегодня:</b>\n\n"
-    for event in events:
-        event_datetime = datetime.fromisoformat(event['event_date'])
-        time_str = event_datetime.strftime("%H:%M")
-        response_text += f"• <b>{time_str}</b> - {event['title']} 🗓️\n"
-    response_text += "\nХорошего дня! ❤️"
-
     try:
-        await bot.send_message(couple['user1_id'], response_text)
-        await bot.send_message(couple['user2_id'], response_text)
+        await asyncio.gather(
+            bot.send_message(couple['user1_id'], response_text),
+            bot.send_message(couple['user2_id'], response_text)
+        )
         logging.info(f"Scheduler: Напоминание о событиях отправлено паре {couple_id}")
     except Exception as e:
         logging.error(f"Scheduler: Не удалось отправить напоминание паре {couple_id}: {e}")
 
 
-async def send_qotd_to_couple(bot: Bot, couple: dict):
-    """Отправляет вопрос дня одной паре."""
-    question = await db.get_random_question()
-    if not question: return
-
-    await db.create_daily_question_entry(couple['couple_id'], question['question_id'], couple['user1_id'],
-                                         couple['user2_id'])
-
+async def send_qotd_to_couple(bot: Bot, couple: dict, question: dict):
+    """Отправляет одной паре уже назначенный ей вопрос дня."""
     text = f"<b>❓ Вопрос дня для вас двоих:</b>\n\n{question['text']}"
     try:
-        await bot.send_message(couple['user1_id'], text, reply_markup=get_answer_qotd_kb())
-        await bot.send_message(couple['user2_id'], text, reply_markup=get_answer_qotd_kb())
+        await asyncio.gather(
+            bot.send_message(couple['user1_id'], text, reply_markup=get_answer_qotd_kb()),
+            bot.send_message(couple['user2_id'], text, reply_markup=get_answer_qotd_kb())
+        )
         logging.info(f"Scheduler: Вопрос дня отправлен паре {couple['couple_id']}")
     except Exception as e:
         logging.error(f"Scheduler: Не удалось отправить вопрос дня паре {couple['couple_id']}: {e}")
 
 
-async def send_qotd_reminder_to_couple(bot: Bot, couple: dict):
+async def send_qotd_reminder_to_couple(bot: Bot, couple: dict, answers: dict):
     """Отправляет напоминание об ответе на вопрос дня."""
-    answers = await db.get_today_question_for_couple(couple['couple_id'])
-    if not answers or (answers['answer_user1'] and answers['answer_user2']): return
+    if answers['answer_user1'] and answers['answer_user2']: return
 
     reminder_text = "Напоминаю, что ваш партнер уже ответил на вопрос дня. Мы ждем только вас! 😉"
     try:
+        recipients = []
         if not answers['answer_user1']:
-            await bot.send_message(answers['user1_id'], reminder_text)
+            recipients.append(answers['user1_id'])
         if not answers['answer_user2']:
-            await bot.send_message(answers['user2_id'], reminder_text)
+            recipients.append(answers['user2_id'])
+        await asyncio.gather(*(bot.send_message(user_id, reminder_text) for user_id in recipients))
         logging.info(f"Scheduler: Напоминание о вопросе дня отправлено паре {couple['couple_id']}")
     except Exception as e:
         logging.error(f"Scheduler: Не удалось отправить напоминание о вопросе дня паре {couple['couple_id']}: {e}")
 
 
-async def send_qotd_summary_to_couple(bot: Bot, couple: dict):
+async def send_qotd_summary_to_couple(bot: Bot, couple: dict, answers: dict):
     """Отправляет итоги с ответами."""
-    answers = await db.get_today_question_for_couple(couple['couple_id'])
-    if not answers: return
-
     user1_answer = answers['answer_user1'] or "<i>(нет ответа)</i>"
     user2_answer = answers['answer_user2'] or "<i>(нет ответа)</i>"
 
-    # Получаем имена пользователей
-    user1 = await db.get_user(answers['user1_id'])
-    user2 = await db.get_user(answers['user2_id'])
-    user1_name = user1['username'] if user1 else "Партнер 1"
-    user2_name = user2['username'] if user2 else "Партнер 2"
+    user1_name = answers['user1_name'] or "Партнер 1"
+    user2_name = answers['user2_name'] or "Партнер 2"
 
     summary_text = (
         f"<b>Ответы на вопрос дня:</b>\n"
@@ -157,8 +254,10 @@ async def send_qotd_summary_to_couple(bot: Bot, couple: dict):
     )
 
     try:
-        await bot.send_message(answers['user1_id'], summary_text)
-        await bot.send_message(answers['user2_id'], summary_text)
+        await asyncio.gather(
+            bot.send_message(answers['user1_id'], summary_text),
+            bot.send_message(answers['user2_id'], summary_text)
+        )
         logging.info(f"Scheduler: Итоги по вопросу дня отправлены паре {couple['couple_id']}")
     except Exception as e:
         logging.error(f"Scheduler: Не удалось отправить итоги по вопросу дня паре {couple['couple_id']}: {e}")
@@ -167,6 +266,9 @@ async def send_qotd_summary_to_couple(bot: Bot, couple: dict):
 def setup_scheduler(bot: Bot):
     """Настраивает и запускает планировщик задач."""
     scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
-    scheduler.add_job(check_and_send_compliments, 'interval', minutes=1, args=(bot,))
-    scheduler.add_job(master_scheduler_task, 'interval', minutes=1, args=(bot,))
+    # Тик, запущенный с опозданием (например, при занятом цикле событий), все еще выполняется,
+    # пока не закончилась его минута; иначе срабатывания этой минуты были бы потеряны
+    scheduler.add_job(master_scheduler_task, 'cron', minute='*', second=0, args=(bot,),
+                      misfire_grace_time=30, coalesce=True)
+    scheduler.add_job(log_runtime_stats, 'interval', minutes=STATS_LOG_INTERVAL)
     return scheduler
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+
+from aiogram import Bot
+
+from src.db import database as db
+
+
+class StartupTimings:
+    """Замеряет длительность этапов запуска и время готовности бота."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.ready_at = None
+        self.ready_after = None
+
+    async def phase(self, name: str, awaitable):
+        """Выполняет этап запуска и запоминает, сколько он занял."""
+        phase_started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.phases[name] = round(time.monotonic() - phase_started, 3)
+
+    async def parallel(self, **awaitables):
+        """Выполняет независимые этапы одновременно."""
+        await asyncio.gather(*(self.phase(name, awaitable) for name, awaitable in awaitables.items()))
+
+    def mark_ready(self):
+        self.ready_at = datetime.now()
+        self.ready_after = round(time.monotonic() - self.started, 3)
+        breakdown = ", ".join(f"{name} {seconds} с" for name, seconds in self.phases.items())
+        logging.info(
+            f"Бот готов к работе в {self.ready_at.strftime('%H:%M:%S')}: запуск занял {self.ready_after} с ({breakdown})"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "phases": self.phases,
+            "ready_at": self.ready_at.strftime("%Y-%m-%d %H:%M:%S") if self.ready_at else None,
+            "ready_after": self.ready_after,
+        }
+
+
+async def call_if_changed(bot: Bot, name: str, payload, call):
+    """
+    Выполняет вызов Bot API, только если его содержимое изменилось с прошлого запуска.
+    Хеш последнего отправленного содержимого хранится в bot_state отдельно для каждого бота.
+    """
+    payload_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    state_key = f"api:{name}:{bot.id}"
+    if await db.get_bot_state(state_key) == payload_hash:
+        logging.info(f"{name}: содержимое не изменилось, вызов пропущен.")
+        return False
+    await call()
+    await db.set_bot_state(state_key, payload_hash)
+    return True
@@ -0,0 +1,26 @@
+import logging
+
+# Источники статистики: имя -> функция без аргументов, возвращающая словарь
+_providers = {}
+
+
+def register_stats_provider(name: str, provider):
+    """Регистрирует источник статистики, который будет попадать в периодический отчет."""
+    _providers[name] = provider
+
+
+def collect_stats() -> dict:
+    """Собирает статистику со всех зарегистрированных источников."""
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logging.error(f"Не удалось собрать статистику '{name}': {e}")
+    return result
+
+
+async def log_runtime_stats():
+    """Пишет в лог сводку по всем источникам статистики."""
+    for name, values in collect_stats().items():
+        logging.info(f"Stats [{name}]: {values}")
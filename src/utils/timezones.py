@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+# Часовой пояс, в котором бот понимает и показывает время, пока пара не выбрала свой
+DEFAULT_TZ = pytz.timezone("Europe/Moscow")
+
+# Названия поясов IANA без учета регистра: {"europe/moscow": "Europe/Moscow"}
+_TZ_NAMES = {name.lower(): name for name in pytz.all_timezones}
+
+# На сколько вперед искать смену смещения пояса (переход на летнее или зимнее время)
+OFFSET_CHANGE_HORIZON = 366 * 24 * 60 * 60
+
+
+def to_epoch(moment: datetime) -> int:
+    """Переводит момент времени с часовым поясом в секунды UTC от начала эпохи."""
+    if moment.tzinfo is None:
+        raise ValueError("Ожидается datetime с часовым поясом")
+    return int(moment.timestamp())
+
+
+def from_epoch(timestamp: int, tz=DEFAULT_TZ) -> datetime:
+    """Переводит секунды UTC от начала эпохи в datetime в указанном часовом поясе."""
+    return datetime.fromtimestamp(timestamp, tz)
+
+
+def get_timezone(name: str):
+    """Возвращает пояс по названию IANA. Неизвестное название заменяется поясом по умолчанию."""
+    try:
+        return pytz.timezone(name) if name else DEFAULT_TZ
+    except pytz.UnknownTimeZoneError:
+        return DEFAULT_TZ
+
+
+def parse_timezone(text: str):
+    """Находит название пояса IANA во введенном пользователем тексте или возвращает None."""
+    return _TZ_NAMES.get(text.strip().lower())
+
+
+def utc_offset_minutes(tz, timestamp: int) -> int:
+    """Смещение пояса относительно UTC в минутах в указанный момент."""
+    return int(from_epoch(timestamp, tz).utcoffset().total_seconds()) // 60
+
+
+def fixed_offset(offset_minutes: int) -> timezone:
+    """Пояс с постоянным смещением: для расчетов по уже известному смещению без базы поясов."""
+    return timezone(timedelta(minutes=offset_minutes))
+
+
+def next_offset_change(tz, timestamp: int) -> int:
+    """
+    Возвращает момент (секунды UTC) ближайшей смены смещения пояса после timestamp.
+    Если в пределах OFFSET_CHANGE_HORIZON смещение не меняется, возвращает границу горизонта.
+    """
+    offset = utc_offset_minutes(tz, timestamp)
+    step = 24 * 60 * 60
+    for probe in range(timestamp + step, timestamp + OFFSET_CHANGE_HORIZON + 1, step):
+        if utc_offset_minutes(tz, probe) != offset:
+            # Смена произошла за последние сутки - уточняем момент делением пополам
+            low, high = probe - step, probe
+            while high - low > 1:
+                middle = (low + high) // 2
+                if utc_offset_minutes(tz, middle) == offset:
+                    low = middle
+                else:
+                    high = middle
+            return high
+    return timestamp + OFFSET_CHANGE_HORIZON
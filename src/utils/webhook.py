@@ -0,0 +1,49 @@
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from src.config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Принимает обновления через вебхук на встроенном aiohttp-сервере.
+
+    Если задан WEBHOOK_BASE_URL, адрес регистрируется в Telegram. Без него сервер просто
+    слушает WEBHOOK_PATH - так можно локально отправлять на него записанные обновления.
+    Работает до отмены задачи, после чего сервер корректно останавливается.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    logging.info(f"Вебхук-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_BASE_URL:
+        webhook_url = WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH
+        await bot.set_webhook(
+            url=webhook_url,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        logging.info(f"Вебхук зарегистрирован в Telegram: {webhook_url}")
+    else:
+        logging.warning("WEBHOOK_BASE_URL не задан: вебхук в Telegram не регистрируется.")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        logging.info("Вебхук-сервер остановлен.")
@@ -0,0 +1,35 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+# src.config требует токены при импорте; для тестов достаточно заглушек
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("TMDB_API_KEY", "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.db import database as db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Возвращает контекстный менеджер, открывающий чистую базу во временном каталоге.
+    Открывать нужно внутри того же цикла событий, в котором идет тест.
+    """
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    for cache in (db._user_cache, db._timezone_cache, db._archive_cache, db._memory_decks):
+        cache.clear()
+
+    @asynccontextmanager
+    async def opened():
+        await db.db_start()
+        try:
+            yield db
+        finally:
+            await db.db_close()
+
+    return opened
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramBadRequest
+
+from src.utils import scheduler
+from src.utils.outbound import PRIORITY_NOTIFICATION, _current_priority
+
+
+class FakeBot:
+    """Бот, который записывает отправленные сообщения или ведет себя как задано в behave."""
+
+    def __init__(self, behave=None):
+        self.sent = []
+        self.priorities = []
+        self.behave = behave
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.behave:
+            await self.behave()
+        self.sent.append((chat_id, text))
+        self.priorities.append(_current_priority.get())
+
+    async def send_photo(self, chat_id, photo, caption=None):
+        self.sent.append((chat_id, photo))
+
+
+async def add_due_compliment(db, **kwargs):
+    await db.add_user(1, "alice")
+    await db.add_user(2, "bob")
+    send_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    return await db.add_scheduled_compliment(1, 2, "ты лучший", send_at, **kwargs)
+
+
+def test_sends_due_compliment_and_removes_it(database):
+    async def scenario():
+        async with database() as db:
+            await add_due_compliment(db, attachment_type="photo", attachment_file_id="file")
+            bot = FakeBot()
+            failed = await scheduler.check_and_send_compliments(bot)
+            return failed, bot.sent, await db.get_pending_compliments_schedule()
+
+    failed, sent, pending = asyncio.run(scenario())
+    assert failed == []
+    assert [chat_id for chat_id, _ in sent] == [2, 2]
+    assert "alice" in sent[0][1]
+    assert pending == []
+
+
+def test_rejected_first_message_is_retried(database):
+    async def scenario():
+        async with database() as db:
+            compliment_id = await add_due_compliment(db)
+
+            async def reject():
+                raise TelegramBadRequest(method=None, message="Bad Request: chat not found")
+
+            failed = await scheduler.check_and_send_compliments(FakeBot(reject))
+            return compliment_id, failed, await db.get_pending_compliments_schedule()
+
+    compliment_id, failed, pending = asyncio.run(scenario())
+    assert failed == [compliment_id]
+    assert [row['id'] for row in pending] == [compliment_id]
+
+
+def test_timed_out_compliment_is_not_retried(database, monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_JOB_TIMEOUT", 0.05)
+
+    async def scenario():
+        async with database() as db:
+            await add_due_compliment(db)
+
+            async def hang():
+                await asyncio.sleep(1)
+
+            failed = await scheduler.check_and_send_compliments(FakeBot(hang))
+            return failed, await db.get_pending_compliments_schedule()
+
+    failed, pending = asyncio.run(scenario())
+    # Неизвестно, дошло ли сообщение, поэтому повтор мог бы прислать комплимент дважды
+    assert failed == []
+    assert pending == []
+
+
+def test_compliment_is_sent_as_notification(database):
+    async def scenario():
+        async with database() as db:
+            await add_due_compliment(db)
+            bot = FakeBot()
+            await scheduler.check_and_send_compliments(bot)
+            return bot.priorities
+
+    # Комплимент ко времени не должен ждать в очереди за массовой рассылкой
+    assert asyncio.run(scenario()) == [PRIORITY_NOTIFICATION]
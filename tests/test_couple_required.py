@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from src.handlers import actions, calendar
+from src.middlewares.couple import COUPLE_ONLY_TEXT, setup_couple_middlewares
+from src.states.user_states import Actions, Calendar
+
+
+class FakeSession(BaseSession):
+    """Сессия без сети: запоминает тексты отправленных сообщений."""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    async def make_request(self, bot, method, timeout=None):
+        text = getattr(method, "text", None)
+        if text:
+            self.texts.append(text)
+        if method.__returning__ is bool:
+            return True
+        return Message(message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"), text="ok")
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def user(user_id):
+    return User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+
+
+def text_update(update_id, user_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+        from_user=user(user_id), text=text
+    ))
+
+
+def callback_update(update_id, user_id, data):
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"), text="old")
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user(user_id), chat_instance="chat", message=message, data=data
+    ))
+
+
+# Роутеры модулей можно подключить только к одному диспетчеру, поэтому он общий для всех тестов
+dp = Dispatcher(storage=MemoryStorage())
+setup_couple_middlewares(dp)
+dp.include_router(actions.router)
+dp.include_router(calendar.router)
+
+
+def run_step_after_unpairing(database, state, update):
+    """Начинает диалог пары, разрывает пару и отправляет следующий шаг диалога."""
+    async def scenario():
+        async with database() as db:
+            await db.add_user(1, "alice")
+            await db.add_user(2, "bob")
+            await db.link_partners(1, 2)
+
+            session = FakeSession()
+            bot = Bot("123456:TEST", session=session)
+            context = dp.fsm.get_context(bot, chat_id=1, user_id=1)
+            await context.set_state(state)
+            await context.update_data(compliment_text="привет", event_date=datetime.now().date())
+            await db.unlink_partners(1)
+
+            await dp.feed_update(bot, update)
+            return session.texts, await context.get_state()
+
+    return asyncio.run(scenario())
+
+
+def test_compliment_time_step_requires_couple(database):
+    texts, state = run_step_after_unpairing(database, Actions.waiting_for_send_time, text_update(1, 1, "10:00"))
+    assert texts == [COUPLE_ONLY_TEXT]
+    assert state is None
+
+
+def test_compliment_date_button_requires_couple(database):
+    texts, state = run_step_after_unpairing(database, Actions.waiting_for_send_date, callback_update(2, 1, "date_today"))
+    assert texts == [COUPLE_ONLY_TEXT]
+    assert state is None
+
+
+def test_event_time_step_requires_couple(database):
+    texts, state = run_step_after_unpairing(database, Calendar.waiting_for_event_time, text_update(3, 1, "10:00"))
+    assert texts == [COUPLE_ONLY_TEXT]
+    assert state is None
@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+
+import pytz
+
+from src.db import database as db
+from src.db.migrations import MIGRATIONS
+
+# Схема базы до появления миграций (как ее создавала первая версия db_start)
+BASELINE_SCHEMA = """
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, partner_id INTEGER UNIQUE, start_date TEXT);
+CREATE TABLE questions (question_id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL UNIQUE);
+CREATE TABLE scheduled_compliments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id INTEGER NOT NULL, receiver_id INTEGER NOT NULL,
+    text TEXT, caption TEXT, attachment_type TEXT, attachment_file_id TEXT, send_at TIMESTAMP NOT NULL
+);
+CREATE TABLE events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT, couple_id INTEGER NOT NULL,
+    event_date TIMESTAMP NOT NULL, title TEXT NOT NULL, details TEXT
+);
+CREATE TABLE wishlist (
+    wish_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, title TEXT NOT NULL,
+    link TEXT, photo_file_id TEXT, booked_by_id INTEGER, FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+CREATE TABLE couple_settings (
+    couple_id INTEGER PRIMARY KEY, reminders_enabled BOOLEAN DEFAULT FALSE, reminder_time TEXT DEFAULT '09:00',
+    qotd_enabled BOOLEAN DEFAULT FALSE, qotd_send_time TEXT DEFAULT '12:00', qotd_summary_time TEXT DEFAULT '20:00'
+);
+CREATE TABLE daily_answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, couple_id INTEGER NOT NULL, question_id INTEGER NOT NULL,
+    answer_user1 TEXT, user1_id INTEGER, answer_user2 TEXT, user2_id INTEGER, question_date DATE NOT NULL,
+    UNIQUE(couple_id, question_date)
+);
+CREATE TABLE memories (
+    memory_id INTEGER PRIMARY KEY AUTOINCREMENT, couple_id INTEGER NOT NULL, media_type TEXT NOT NULL,
+    media_file_id TEXT NOT NULL, description TEXT, added_at DATE NOT NULL
+);
+CREATE TABLE movie_watchlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, couple_id INTEGER NOT NULL, title TEXT NOT NULL, UNIQUE(couple_id, title)
+);
+CREATE TABLE date_ideas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, couple_id INTEGER NOT NULL, idea_text TEXT NOT NULL,
+    is_completed BOOLEAN DEFAULT FALSE, UNIQUE(couple_id, idea_text)
+);
+"""
+
+MOSCOW = pytz.timezone("Europe/Moscow")
+
+
+def create_baseline(path):
+    """Создает базу со старой схемой и данными в старом формате."""
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO users (user_id, username, partner_id, start_date) VALUES (?, ?, ?, ?)",
+        [(1, "alice", 2, "2024-01-01"), (2, "bob", 1, "2024-01-01"), (3, "carol", None, None)]
+    )
+    # Время без пояса хранилось как московское, с поясом - в ISO-формате со смещением
+    conn.execute("INSERT INTO events (couple_id, event_date, title) VALUES (1, '2030-01-01 19:00:00', 'Кино')")
+    conn.execute(
+        "INSERT INTO scheduled_compliments (sender_id, receiver_id, text, send_at) VALUES (1, 2, 'hi', ?)",
+        ("2030-01-01T09:00:00+03:00",)
+    )
+    conn.execute(
+        "INSERT INTO couple_settings (couple_id, reminders_enabled, reminder_time, qotd_enabled) VALUES (1, 1, '09:00', 0)"
+    )
+    conn.commit()
+    conn.close()
+
+
+def fetch_all(sql, params=()):
+    async def query():
+        async with db._pool.reader() as conn:
+            cursor = await conn.execute(sql, params)
+            return [tuple(row) for row in await cursor.fetchall()]
+    return query()
+
+
+def test_migrations_upgrade_baseline_database(database, tmp_path):
+    create_baseline(tmp_path / "test.db")
+
+    async def scenario():
+        async with database():
+            return {
+                "versions": await fetch_all("SELECT version FROM schema_version ORDER BY version"),
+                "couples": await fetch_all("SELECT couple_id, user1_id, user2_id FROM couples"),
+                "events": await fetch_all("SELECT couple_id, event_at, title FROM events"),
+                "compliments": await fetch_all("SELECT send_at FROM scheduled_compliments"),
+                "timezones": await fetch_all("SELECT couple_id, timezone FROM couple_settings"),
+                "triggers": await fetch_all("SELECT minute_of_day, couple_id, job_kind, utc_offset FROM schedule_triggers"),
+            }
+
+    result = asyncio.run(scenario())
+    assert [row[0] for row in result["versions"]] == sorted(version for version, _, _ in MIGRATIONS)
+    assert result["couples"] == [(1, 1, 2)]
+    assert result["events"] == [(1, int(MOSCOW.localize(datetime(2030, 1, 1, 19, 0)).timestamp()), "Кино")]
+    assert result["compliments"] == [(int(MOSCOW.localize(datetime(2030, 1, 1, 9, 0)).timestamp()),)]
+    assert result["timezones"] == [(1, "Europe/Moscow")]
+    # 09:00 по Москве (UTC+3) - это 06:00 UTC
+    assert result["triggers"] == [(6 * 60, 1, "event_reminder", 180)]
+
+
+def test_migrations_are_applied_once(database, tmp_path):
+    create_baseline(tmp_path / "test.db")
+
+    async def scenario():
+        async with database():
+            pass
+        async with database():
+            return await fetch_all("SELECT version, COUNT(*) FROM schema_version GROUP BY version HAVING COUNT(*) > 1")
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_fresh_database_reaches_latest_version(database):
+    async def scenario():
+        async with database():
+            return await fetch_all("SELECT MAX(version) FROM schema_version")
+
+    assert asyncio.run(scenario()) == [(max(version for version, _, _ in MIGRATIONS),)]
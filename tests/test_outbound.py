@@ -0,0 +1,157 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from src.utils.outbound import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION, OutboundDispatcher, priority_scope
+)
+
+
+class FakeApi:
+    """Запоминает отправленные запросы; errors - исключения для первых попыток."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.sent = []
+        self.errors = list(errors)
+        self.delay = delay
+
+    async def __call__(self, bot, method):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(method.chat_id)
+        return True
+
+
+def method(chat_id):
+    return SimpleNamespace(chat_id=chat_id)
+
+
+def retry_after(seconds):
+    return TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=seconds)
+
+
+async def started(**kwargs):
+    dispatcher = OutboundDispatcher(**kwargs)
+    await dispatcher.start()
+    return dispatcher
+
+
+def test_sends_request():
+    async def scenario():
+        dispatcher = await started()
+        api = FakeApi()
+        assert await dispatcher(api, None, method(1)) is True
+        await dispatcher.stop()
+        return api.sent
+
+    assert asyncio.run(scenario()) == [1]
+
+
+def test_cancelled_waiting_job_is_not_sent():
+    async def scenario():
+        dispatcher = await started()
+        dispatcher._paused_until = time.monotonic() + 0.3
+        api = FakeApi()
+        try:
+            await asyncio.wait_for(dispatcher(api, None, method(1)), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.5)
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return api.sent, stats
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == []
+    assert stats["queued"] == 0
+
+
+def test_retry_after_resends_request():
+    async def scenario():
+        dispatcher = await started()
+        api = FakeApi(errors=[retry_after(0)])
+        result = await dispatcher(api, None, method(1))
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return result, api.sent, stats
+
+    result, sent, stats = asyncio.run(scenario())
+    assert result is True
+    assert sent == [1]
+    assert stats["retries"] == 1
+
+
+def test_cancelled_job_is_not_retried_after_retry_after():
+    async def scenario():
+        dispatcher = await started()
+        # Запрос уже выполняется, когда отправитель перестает ждать, а Telegram отвечает 429
+        api = FakeApi(errors=[retry_after(0)], delay=0.1)
+        try:
+            await asyncio.wait_for(dispatcher(api, None, method(1)), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.3)
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return api.sent, stats
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == []
+    assert stats["cancelled"] == 1
+    assert stats["queued"] == 0
+
+
+def test_cancelled_job_waiting_for_retry_is_dropped():
+    async def scenario():
+        dispatcher = await started()
+        api = FakeApi(errors=[retry_after(1)])
+        try:
+            await asyncio.wait_for(dispatcher(api, None, method(1)), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(1.2)
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return api.sent, stats
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == []
+    assert stats["queued"] == 0
+
+
+def test_same_chat_keeps_order():
+    async def scenario():
+        dispatcher = await started(chat_burst=10)
+        order = []
+
+        async def api(bot, m):
+            order.append(m.n)
+            return True
+
+        await asyncio.gather(*(dispatcher(api, None, SimpleNamespace(chat_id=1, n=n)) for n in range(5)))
+        await dispatcher.stop()
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+
+def test_higher_priority_is_sent_first():
+    async def scenario():
+        dispatcher = await started()
+        api = FakeApi()
+        # Пока отправка приостановлена, в очереди копятся запросы разных классов
+        dispatcher._paused_until = time.monotonic() + 0.2
+        calls = []
+        for chat_id, priority in ((1, PRIORITY_BULK), (2, PRIORITY_BULK), (3, PRIORITY_NOTIFICATION),
+                                  (4, PRIORITY_INTERACTIVE), (5, PRIORITY_BULK)):
+            with priority_scope(priority):
+                calls.append(asyncio.create_task(dispatcher(api, None, method(chat_id))))
+        await asyncio.gather(*calls)
+        await dispatcher.stop()
+        return api.sent
+
+    assert asyncio.run(scenario()) == [4, 3, 1, 2, 5]
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytz
+
+from src.db.triggers import (
+    JOB_EVENT_REMINDER, JOB_QOTD_REMINDER, JOB_QOTD_SEND, JOB_QOTD_SUMMARY, build_triggers
+)
+from src.utils.timezones import next_offset_change, utc_offset_minutes
+
+LOS_ANGELES = pytz.timezone("America/Los_Angeles")
+
+# Переход Лос-Анджелеса на зимнее время: 2026-11-01 02:00 PDT = 09:00 UTC
+PDT_END = int(datetime(2026, 11, 1, 9, 0, tzinfo=timezone.utc).timestamp())
+BEFORE_CHANGE = int(datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc).timestamp())
+
+SETTINGS = {
+    "reminders_enabled": 1, "reminder_time": "09:00",
+    "qotd_enabled": 1, "qotd_send_time": "12:00", "qotd_summary_time": "20:00",
+}
+
+
+def test_next_offset_change_finds_exact_moment():
+    assert next_offset_change(LOS_ANGELES, BEFORE_CHANGE) == PDT_END
+    assert utc_offset_minutes(LOS_ANGELES, PDT_END - 1) == -7 * 60
+    assert utc_offset_minutes(LOS_ANGELES, PDT_END) == -8 * 60
+
+
+def test_zone_without_changes_is_valid_until_horizon():
+    moscow = pytz.timezone("Europe/Moscow")
+    assert next_offset_change(moscow, BEFORE_CHANGE) > BEFORE_CHANGE + 300 * 24 * 60 * 60
+
+
+def test_build_triggers_converts_local_time_to_utc():
+    triggers = sorted(build_triggers(SETTINGS, -7 * 60))
+    assert triggers == [
+        (2 * 60, JOB_QOTD_REMINDER),    # 19:00 PDT
+        (3 * 60, JOB_QOTD_SUMMARY),     # 20:00 PDT
+        (16 * 60, JOB_EVENT_REMINDER),  # 09:00 PDT
+        (19 * 60, JOB_QOTD_SEND),       # 12:00 PDT
+    ]
+
+
+def test_triggers_are_rebuilt_after_dst_change(database, monkeypatch):
+    clock = {"now": BEFORE_CHANGE}
+    monkeypatch.setattr(time, "time", lambda: clock["now"])
+
+    async def triggers(db):
+        async with db._pool.reader() as conn:
+            cursor = await conn.execute(
+                "SELECT job_kind, minute_of_day, utc_offset, valid_until FROM schedule_triggers ORDER BY job_kind"
+            )
+            return [tuple(row) for row in await cursor.fetchall()]
+
+    async def scenario():
+        async with database() as db:
+            await db.add_user(1, "alice")
+            await db.add_user(2, "bob")
+            await db.link_partners(1, 2)
+            await db.update_reminders_settings(
+                1, timezone="America/Los_Angeles", reminders_enabled=True, reminder_time="09:00"
+            )
+            before = await triggers(db)
+            not_yet = await db.refresh_stale_triggers()
+
+            clock["now"] = PDT_END + 60
+            refreshed = await db.refresh_stale_triggers()
+            after = await triggers(db)
+            return before, not_yet, refreshed, after
+
+    before, not_yet, refreshed, after = asyncio.run(scenario())
+    assert before == [(JOB_EVENT_REMINDER, 16 * 60, -7 * 60, PDT_END)]
+    assert not_yet == 0
+    assert refreshed == 1
+    # Те же 09:00 по местному времени после перехода приходятся на 17:00 UTC
+    assert after[0][:3] == (JOB_EVENT_REMINDER, 17 * 60, -8 * 60)
+    assert after[0][3] > PDT_END